@@ -1,9 +1,34 @@
 # app.py
 
+import argparse
+import os
+
+import tracing
+
+from scripts.batch_query import load_questions
+from scripts.build_index import load_index
 from scripts.pageindex_index import build_pageindex_trees
-from scripts.query_pipeline import query_system
+from scripts.query_pipeline import query_corpus_system, query_system_batch, query_system_stream
+
+def run_batch(questions_path, doc_id, output_path, trees_cache):
+    questions = load_questions(questions_path)
+    print(f"\n[2] Answering {len(questions)} questions for doc_id {doc_id}...")
+    summary = query_system_batch(questions, doc_id, trees_cache, output_path)
+    print(
+        f"Done: {summary['questions'] - summary['failed']} answers, {summary['failed']} failed, "
+        f"in {summary['elapsed_ms'] / 1000:.1f}s ({summary['selection_calls']} selection calls) "
+        f"-> {summary['output_path']}"
+    )
+
 
 def main():
+    parser = argparse.ArgumentParser(description="Insurance document query assistant")
+    parser.add_argument("--batch", help="file of questions (.txt, one per line, or .jsonl with a 'question' field)")
+    parser.add_argument("--doc-id", help="document to query in batch mode (default: the only indexed document)")
+    parser.add_argument("--output", help="JSONL results path for batch mode (default: <batch file>.results.jsonl)")
+    parser.add_argument("--trace-log", help="append each question's spans to this JSONL file")
+    args = parser.parse_args()
+
     print("\n=== Insurance Document Query Assistant (Vectorless) ===\n")
     print("[1] Building PageIndex trees...")
     docs_cache, trees_cache = build_pageindex_trees()
@@ -14,6 +39,18 @@ def main():
 
     doc_items = list(docs_cache.items())
     selected_doc_id = None
+    search_all = False
+
+    if args.batch:
+        doc_id = args.doc_id
+        if doc_id is None and len(doc_items) == 1:
+            doc_id = doc_items[0][1]
+        if doc_id is None:
+            print("\n[Error] Several documents are indexed; pass --doc-id for batch mode.")
+            return
+        output_path = args.output or os.path.splitext(args.batch)[0] + ".results.jsonl"
+        run_batch(args.batch, doc_id, output_path, trees_cache)
+        return
 
     if len(doc_items) == 1:
         selected_doc_id = doc_items[0][1]
@@ -21,23 +58,51 @@ def main():
         print("\nAvailable documents:")
         for idx, (name, doc_id) in enumerate(doc_items, 1):
             print(f"{idx}. {name} (doc_id: {doc_id})")
-        choice = input("\nSelect a document by number: ").strip()
-        if choice.isdigit():
+        choice = input("\nSelect a document by number (0 searches all documents): ").strip()
+        if choice == "0":
+            search_all = True
+        elif choice.isdigit():
             index = int(choice) - 1
             if 0 <= index < len(doc_items):
                 selected_doc_id = doc_items[index][1]
 
-    if not selected_doc_id:
+    if not selected_doc_id and not search_all:
         print("\n[Error] Invalid document selection.")
         return
 
+    page_index = None
+    if search_all:
+        try:
+            # Mapped up front so a refresh from the web app cannot pull files out from under the loop.
+            page_index = load_index(eager=True)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"\n[Warning] {e} Routing on the trees instead.")
+
     # Step 2: Query loop
     print("\n[2] Ready for questions!\n")
     while True:
         query = input("\nAsk a question (or type 'exit'): ")
         if query.lower() == "exit":
             break
-        query_system(query, selected_doc_id, trees_cache)
+        if search_all:
+            result = query_corpus_system(query, docs_cache, trees_cache, index=page_index)
+            for doc in result["documents"]:
+                selected = [node_id for step in doc["traversal"] for node_id in step["selected"]]
+                print(f"  [{doc['document']}] {', '.join(selected) or '-'}")
+            print(f"\nAnswer: {result['answer']}")
+            continue
+        for event in query_system_stream(query, selected_doc_id, trees_cache):
+            if event["type"] == "step":
+                step = event["step"]
+                print(f"  [depth {step['depth']}] {', '.join(step['selected']) or '-'}", flush=True)
+            elif event["type"] == "contexts":
+                print("\nAnswer: ", end="", flush=True)
+            elif event["type"] == "token":
+                print(event["text"], end="", flush=True)
+            elif event["type"] == "done" and args.trace_log:
+                with open(args.trace_log, "a", encoding="utf-8") as f:
+                    f.write(tracing.to_jsonl(event["result"]["trace"]))
+        print()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,172 @@
+# benchmarks/fake_llm.py
+
+import asyncio
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from llm.router import Provider
+from scripts.bm25 import tokenize
+
+_CANDIDATE_RE = re.compile(r"^- id: (\S+); title: ([^;]*);", re.MULTILINE)
+_OUTLINE_RE = re.compile(r"^( *)(\S+) \| ([^|]*)\|", re.MULTILINE)
+_QUESTION_RE = re.compile(r"^Question: (.*)$", re.MULTILINE)
+_BATCH_QUESTION_RE = re.compile(r"^(\d+)\. (.*)$", re.MULTILINE)
+
+
+def _outline_leaves(prompt):
+    lines = _OUTLINE_RE.findall(prompt)
+    # A node is a leaf when the next line is not indented deeper.
+    return [
+        (node_id, title)
+        for (indent, node_id, title), following in itertools.zip_longest(lines, lines[1:])
+        if following is None or len(following[0]) <= len(indent)
+    ]
+
+
+class FakeLLM:
+    """Deterministic stand-in for the Groq client functions with a fixed per-call latency.
+
+    Selection prompts are answered by ranking the candidate titles on word
+    overlap with the question (ties broken by a stable hash), so the same
+    prompt always gets the same reply and traversals are repeatable. Answer
+    prompts get a short canned answer, streamed word by word.
+    """
+
+    def __init__(self, latency=0.05, picks=2):
+        self.latency = latency
+        self.picks = picks
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _pick(self, question, candidates):
+        words = set(tokenize(question))
+
+        def rank(candidate):
+            node_id, title = candidate
+            overlap = len(words & set(tokenize(title)))
+            tie = hashlib.sha256(f"{question}\0{node_id}".encode("utf-8")).hexdigest()
+            return (-overlap, tie)
+
+        return [node_id for node_id, _title in sorted(candidates, key=rank)[: self.picks]]
+
+    def reply(self, prompt):
+        with self._lock:
+            self.calls += 1
+
+        candidates = _CANDIDATE_RE.findall(prompt)
+        if "several questions" in prompt:
+            selections = [
+                {"question": int(number), "selected_ids": self._pick(question, candidates), "reason": "overlap", "drill_down": True}
+                for number, question in _BATCH_QUESTION_RE.findall(prompt)
+            ]
+            return json.dumps({"selections": selections})
+
+        question_match = _QUESTION_RE.search(prompt)
+        question = question_match.group(1) if question_match else ""
+        if candidates:
+            return json.dumps(
+                {"selected_ids": self._pick(question, candidates), "reason": "overlap", "drill_down": True}
+            )
+        if "Document outline" in prompt:
+            return json.dumps({"selected_ids": self._pick(question, _outline_leaves(prompt)), "reason": "overlap"})
+        return "Answer: covered under the selected sections.\nReasons:\n1) Based on the cited nodes."
+
+    def generate_text(self, prompt, temperature=0.2, use_cache=True):
+        time.sleep(self.latency)
+        return self.reply(prompt)
+
+    async def agenerate_text(self, prompt, temperature=0.2, use_cache=True):
+        await asyncio.sleep(self.latency)
+        return self.reply(prompt)
+
+    def stream_text(self, prompt, temperature=0.2, use_cache=True):
+        time.sleep(self.latency)
+        for word in self.reply(prompt).split(" "):
+            yield word + " "
+
+
+class FakeAPIError(Exception):
+    """Stand-in for an SDK error carrying an HTTP status, which is what the router inspects."""
+
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class ScriptedProvider(Provider):
+    """Router provider whose calls follow a script, for exercising hedging and failover offline.
+
+    Each step is a latency in seconds, or a (latency, status code) pair for a
+    call that fails with that HTTP status after the delay; the script repeats
+    once used up. Replies come from a FakeLLM.
+    """
+
+    def __init__(self, name, script, llm=None, **kwargs):
+        self.llm = llm if llm is not None else FakeLLM(latency=0)
+        self.calls = 0
+        self._steps = itertools.cycle(script)
+        self._steps_lock = threading.Lock()
+        super().__init__(name, f"fake-{name}", self._complete, self._stream, **kwargs)
+
+    def _step(self):
+        with self._steps_lock:
+            self.calls += 1
+            step = next(self._steps)
+        latency, status = step if isinstance(step, tuple) else (step, None)
+        time.sleep(latency)
+        if status is not None:
+            raise FakeAPIError(status)
+
+    def _complete(self, prompt, temperature):
+        self._step()
+        return self.llm.reply(prompt)
+
+    def _stream(self, prompt, temperature):
+        self._step()
+        for word in self.llm.reply(prompt).split(" "):
+            yield word + " "
+
+
+@contextmanager
+def routed(router):
+    """Make ``router`` the process-wide LLM router for the duration of the block."""
+    import llm.router
+
+    saved = llm.router._router
+    llm.router._router = router
+    try:
+        yield router
+    finally:
+        llm.router._router = saved
+
+
+# Modules that bind the client functions at import time.
+_PATCHED_MODULES = (
+    "scripts.pageindex_query",
+    "scripts.batch_query",
+    "scripts.corpus_query",
+)
+
+
+@contextmanager
+def installed(fake):
+    """Route every query module's LLM calls to ``fake`` for the duration of the block."""
+    import importlib
+
+    saved = []
+    for module_name in _PATCHED_MODULES:
+        module = importlib.import_module(module_name)
+        for name in ("generate_text", "agenerate_text", "stream_text"):
+            if hasattr(module, name):
+                saved.append((module, name, getattr(module, name)))
+                setattr(module, name, getattr(fake, name))
+    try:
+        yield fake
+    finally:
+        for module, name, original in saved:
+            setattr(module, name, original)
@@ -0,0 +1,99 @@
+# benchmarks/run.py
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from benchmarks.suite import STAGES
+
+DEFAULT_THRESHOLD = 0.25
+
+
+def run(stages):
+    results = []
+    for stage in stages:
+        print(f"[bench] {stage}...", flush=True)
+        for result in STAGES[stage]():
+            result["stage"] = stage
+            results.append(result)
+            print(f"  {result['name']}: {result['seconds'] * 1000:.1f} ms", flush=True)
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+
+
+def compare(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """Return (regressions, lines): results slower than baseline by more than ``threshold`` (0.25 = 25%)."""
+    baseline_results = {result["name"]: result for result in baseline.get("results", [])}
+    regressions = []
+    lines = []
+    for result in report["results"]:
+        previous = baseline_results.get(result["name"])
+        if previous is None or not previous["seconds"]:
+            lines.append(f"  {result['name']}: new")
+            continue
+        ratio = result["seconds"] / previous["seconds"]
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(result["name"])
+            flag = "  REGRESSION"
+        lines.append(
+            f"  {result['name']}: {previous['seconds'] * 1000:.1f} -> {result['seconds'] * 1000:.1f} ms "
+            f"({ratio:.2f}x){flag}"
+        )
+        # A changed selection means traversal behaviour moved, not just its speed.
+        if "selected" in result and "selected" in previous and result["selected"] != previous["selected"]:
+            lines.append(f"  {result['name']}: selected nodes differ from baseline")
+    return regressions, lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks (fake LLM and PageIndex client)")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"comma-separated subset of {', '.join(STAGES)}")
+    parser.add_argument("--output", default="bench_results.json", help="where to write this run's JSON report")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed slowdown ratio (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="also write the report to --baseline")
+    args = parser.parse_args(argv)
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+
+    report = run(stages)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[bench] wrote {args.output}")
+
+    if not args.baseline:
+        return 0
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[bench] saved baseline {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"[bench] baseline {args.baseline} not found; run with --save-baseline first.")
+        return 1
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions, lines = compare(report, baseline, args.threshold)
+    print("\n".join(lines))
+    if regressions:
+        print(f"[bench] {len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print("[bench] no regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,315 @@
+# benchmarks/suite.py
+
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from benchmarks.fake_llm import FakeLLM, installed
+from config import DOCS_DIR
+
+QUESTIONS = [
+    "What is the waiting period for pre-existing diseases?",
+    "Is maternity covered and what are the limits?",
+    "How do I file a cashless claim?",
+    "What is the grace period for premium payment?",
+    "Are ambulance charges reimbursed?",
+    "What expenses are excluded from the policy?",
+    "What is the sum insured for room rent?",
+    "Can the policy be cancelled and is the premium refunded?",
+]
+
+
+def _timed(func, repeat):
+    """Run func ``repeat`` times; return (median seconds, last return value)."""
+    timings = []
+    value = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), value
+
+
+def _result(name, seconds, ops=None, **extra):
+    result = {"name": name, "seconds": round(seconds, 6)}
+    if ops:
+        result["ops"] = ops
+        result["ops_per_second"] = round(ops / seconds, 2) if seconds else None
+    result.update(extra)
+    return result
+
+
+def synthetic_corpus(docs, doc_length=200, vocab_size=20000, seed=0):
+    """Token lists drawn from a Zipf-like vocabulary, like real policy wording."""
+    rng = random.Random(seed)
+    vocab = [f"w{i}" for i in range(vocab_size)]
+    weights = [1.0 / (rank + 1) for rank in range(vocab_size)]
+    return [rng.choices(vocab, weights=weights, k=doc_length) for _ in range(docs)]
+
+
+def synthetic_tree(branching=6, depth=4, seed=0):
+    rng = random.Random(seed)
+    words = ["claim", "premium", "waiting", "period", "hospital", "cover", "exclusion", "benefit", "limit", "renewal"]
+    counter = [0]
+
+    def build(level, page):
+        nodes = []
+        for _ in range(branching):
+            counter[0] += 1
+            title = " ".join(rng.sample(words, 3)).title()
+            node = {
+                "node_id": f"{counter[0]:05d}",
+                "title": title,
+                "start_index": page,
+                "end_index": page + 1,
+                "summary": f"{title}: " + " ".join(rng.choices(words, k=30)),
+                "text": " ".join(rng.choices(words, k=120)),
+                "nodes": build(level + 1, page) if level + 1 < depth else [],
+            }
+            nodes.append(node)
+            page += 2
+        return nodes
+
+    return build(0, 1)
+
+
+def _real_trees():
+    from scripts.tree_store import get_tree_store
+
+    return dict(get_tree_store().items())
+
+
+def _trees():
+    trees = {f"real:{doc_id}": tree for doc_id, tree in _real_trees().items()}
+    trees["synthetic"] = synthetic_tree()
+    return trees
+
+
+def bench_bm25(sizes=(1000, 5000, 20000), queries=50, repeat=3):
+    from scripts.bm25 import BM25
+
+    results = []
+    for size in sizes:
+        corpus = synthetic_corpus(size)
+        seconds, bm25 = _timed(lambda: BM25(corpus), repeat)
+        arrays = (bm25.postings_offsets, bm25.postings_docs, bm25.postings_freqs, bm25.idf, bm25.max_scores)
+        results.append(
+            _result(f"bm25_build/{size}", seconds, ops=size, index_bytes=sum(array.nbytes for array in arrays))
+        )
+
+        rng = random.Random(size)
+        query_set = [rng.sample(corpus[rng.randrange(size)], 5) for _ in range(queries)]
+        seconds, _ = _timed(lambda: [bm25.get_scores(query) for query in query_set], repeat)
+        results.append(_result(f"bm25_get_scores/{size}", seconds, ops=queries))
+        seconds, _ = _timed(lambda: [bm25.top_k(query, 5) for query in query_set], repeat)
+        results.append(_result(f"bm25_top_k/{size}", seconds, ops=queries))
+    return results
+
+
+def bench_trees(repeat=5):
+    from scripts.bm25 import tokenize
+    from scripts.compiled_tree import CompiledTree
+
+    # CompiledTree replaced the per-query _build_maps pass; compiling is its one-off cost.
+    results = []
+    for name, tree in _trees().items():
+        seconds, compiled = _timed(lambda: CompiledTree(tree), repeat)
+        results.append(_result(f"tree_compile/{name}", seconds, nodes=len(compiled)))
+        seconds, _ = _timed(compiled.lexical_index, 1)
+        results.append(_result(f"tree_lexical_index/{name}", seconds, nodes=len(compiled)))
+        seconds, _ = _timed(
+            lambda: [compiled.lexical_index().get_scores(tokenize(q)) for q in QUESTIONS], repeat
+        )
+        results.append(_result(f"tree_lexical_scores/{name}", seconds, ops=len(QUESTIONS)))
+    return results
+
+
+def bench_query(latency=0.05, modes=("sequential", "outline", "branch"), questions=QUESTIONS):
+    from scripts.compiled_tree import CompiledTree
+    from scripts.pageindex_query import query_tree, query_tree_stream
+
+    results = []
+    for name, tree in _trees().items():
+        compiled = CompiledTree(tree)
+        for mode in modes:
+            fake = FakeLLM(latency=latency)
+            with installed(fake):
+                started = time.perf_counter()
+                selected = [
+                    [node["node_id"] for node in query_tree(q, compiled, use_cache=False, mode=mode)["selected_nodes"]]
+                    for q in questions
+                ]
+                seconds = time.perf_counter() - started
+            results.append(
+                _result(
+                    f"query_tree/{mode}/{name}",
+                    seconds,
+                    ops=len(questions),
+                    llm_calls=fake.calls,
+                    selected=selected,
+                )
+            )
+
+        fake = FakeLLM(latency=latency)
+        with installed(fake):
+            first_tokens = []
+            for q in questions:
+                started = time.perf_counter()
+                for event in query_tree_stream(q, compiled, use_cache=False, mode="sequential"):
+                    if event["type"] == "token":
+                        first_tokens.append(time.perf_counter() - started)
+                        break
+        results.append(
+            _result(f"query_first_token/sequential/{name}", statistics.median(first_tokens))
+        )
+    return results
+
+
+def bench_batch(latency=0.05, questions=QUESTIONS * 4):
+    from scripts.batch_query import query_batch
+    from scripts.compiled_tree import CompiledTree
+
+    results = []
+    work_dir = tempfile.mkdtemp(prefix="batch-bench-")
+    try:
+        for name, tree in _trees().items():
+            fake = FakeLLM(latency=latency)
+            with installed(fake):
+                started = time.perf_counter()
+                summary = query_batch(
+                    questions, CompiledTree(tree), os.path.join(work_dir, "out.jsonl"), use_cache=False
+                )
+                seconds = time.perf_counter() - started
+            results.append(
+                _result(f"query_batch/{name}", seconds, ops=summary["questions"], llm_calls=fake.calls)
+            )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def bench_tree_store(docs=200, repeat=3):
+    from scripts.tree_store import TreeStore
+
+    # Opening the store and loading one tree should not depend on how many documents are indexed.
+    trees = {f"doc-{i:04d}": synthetic_tree(depth=3, seed=i) for i in range(docs)}
+    work_dir = tempfile.mkdtemp(prefix="tree-store-bench-")
+    try:
+        legacy_path = os.path.join(work_dir, "pageindex_trees.json")
+        with open(legacy_path, "w", encoding="utf-8") as f:
+            json.dump(trees, f, indent=2)
+
+        def load_legacy():
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+        seconds, _ = _timed(load_legacy, repeat)
+        results = [_result(f"tree_legacy_load_all/{docs}", seconds)]
+
+        root = os.path.join(work_dir, "trees")
+        seconds, _ = _timed(lambda: TreeStore(root).update(trees), 1)
+        results.append(_result(f"tree_store_write_all/{docs}", seconds, ops=docs))
+        seconds, _ = _timed(lambda: TreeStore(root).put("doc-0000", trees["doc-0000"]), repeat)
+        results.append(_result(f"tree_store_put_one/{docs}", seconds))
+        seconds, _ = _timed(lambda: TreeStore(root)["doc-0000"], repeat)
+        results.append(_result(f"tree_store_open_and_load_one/{docs}", seconds))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def bench_parse(pdf_path=os.path.join(DOCS_DIR, "p1.pdf"), repeat=3):
+    from scripts.parse_documents import parse_documents_parallel, parse_pdf
+
+    if not os.path.exists(pdf_path):
+        return []
+    fname = os.path.basename(pdf_path)
+    seconds, records = _timed(lambda: parse_pdf(pdf_path, fname), repeat)
+    results = [_result("parse_pdf", seconds, ops=len(records), unit="pages")]
+
+    work_dir = tempfile.mkdtemp(prefix="parse-bench-")
+    try:
+        input_dir = os.path.join(work_dir, "policies")
+        os.makedirs(input_dir)
+        shutil.copy(pdf_path, os.path.join(input_dir, fname))
+        output_path = os.path.join(work_dir, "chunks.jsonl")
+        seconds, _ = _timed(
+            lambda: parse_documents_parallel(input_dir, output_path=output_path, report_every=3600), 1
+        )
+        results.append(_result("parse_documents_parallel", seconds, ops=len(records), unit="pages"))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def bench_pageindex(num_docs=8):
+    from scripts.pageindex_fake import benchmark
+
+    # No processing delay: this times submission and polling overhead, not PageIndex itself.
+    stats = benchmark(num_docs=num_docs, processing_seconds=0.0, processing_jitter=0.0)
+    return [_result("pageindex_build", stats["seconds"], ops=stats["documents"], get_tree_calls=stats["get_tree_calls"])]
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def bench_router(calls=200, concurrency=8, warmup=40):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from benchmarks.fake_llm import ScriptedProvider
+    from llm.router import LLMRouter
+
+    # One call in 20 on the primary is slow; the backup is steady but slower than the primary's median.
+    scenarios = {
+        "no_hedge": ([0.02] * 19 + [0.5], [0.03], False),
+        "hedged": ([0.02] * 19 + [0.5], [0.03], True),
+        "failover": ([(0.01, 503)], [0.03], True),
+    }
+    results = []
+    for name, (primary_script, backup_script, hedge) in scenarios.items():
+        primary = ScriptedProvider("primary", primary_script)
+        backup = ScriptedProvider("backup", backup_script)
+        router = LLMRouter([primary, backup], hedge=hedge, max_workers=2 * concurrency)
+
+        def timed_call(i):
+            started = time.perf_counter()
+            router.complete(f"Question: benchmark {i}")
+            return time.perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(timed_call, range(warmup)))
+            primary.calls = backup.calls = 0
+            started = time.perf_counter()
+            latencies = list(pool.map(timed_call, range(calls)))
+            seconds = time.perf_counter() - started
+        results.append(
+            _result(
+                f"router/{name}",
+                seconds,
+                ops=calls,
+                p50_ms=round(_percentile(latencies, 0.5) * 1000, 1),
+                p99_ms=round(_percentile(latencies, 0.99) * 1000, 1),
+                primary_calls=primary.calls,
+                backup_calls=backup.calls,
+                providers=router.status(),
+            )
+        )
+    return results
+
+
+STAGES = {
+    "bm25": bench_bm25,
+    "trees": bench_trees,
+    "query": bench_query,
+    "batch": bench_batch,
+    "tree_store": bench_tree_store,
+    "parse": bench_parse,
+    "pageindex": bench_pageindex,
+    "router": bench_router,
+}
@@ -3,19 +3,129 @@ import os
 
 DOCS_DIR = "data/policies"
 INDEX_DIR = "index_data"
+CHUNKS_DIR = "chunks"
+CHUNKS_JSON = os.path.join(CHUNKS_DIR, "chunked_docs.json")
+CHUNKS_JSONL = os.path.join(CHUNKS_DIR, "chunked_docs.jsonl")
 
 PAGEINDEX_API_KEY_ENV = "PAGEINDEX_API_KEY"
 GROQ_API_KEY_ENV = "GROQ_API_KEY"
+GEMINI_API_KEY_ENV = "GEMINI_API_KEY"
 
 PAGEINDEX_DOCS_CACHE = os.path.join(INDEX_DIR, "pageindex_docs.json")
+PAGEINDEX_TREES_DIR = os.path.join(INDEX_DIR, "trees")
+# Single-file tree cache written by older versions; split into PAGEINDEX_TREES_DIR on the next build.
 PAGEINDEX_TREES_CACHE = os.path.join(INDEX_DIR, "pageindex_trees.json")
+BM25_INDEX_DIR = os.path.join(INDEX_DIR, "bm25")
+# Index commits keep the segments and df of this many earlier generations, so
+# readers that opened the index lazily keep working across refreshes.
+BM25_RETAINED_GENERATIONS = 2
 
-PAGEINDEX_POLL_SECONDS = 5
+PARSE_WORKERS = None  # None uses os.cpu_count()
+PARSE_PAGES_PER_TASK = 16
+
+PAGEINDEX_POLL_SECONDS = 5  # first poll delay; later polls back off exponentially
+PAGEINDEX_POLL_BACKOFF = 1.5
+PAGEINDEX_POLL_MAX_SECONDS = 30
 PAGEINDEX_MAX_POLLS = 60
+PAGEINDEX_MAX_CONCURRENCY = 4
+INDEX_JOB_HISTORY = 20  # refresh jobs kept for status display
+
+# query_system reuses the answer to an earlier question on the same tree when
+# their content words overlap enough (IDF-weighted Jaccard); candidates are
+# found with MinHash LSH (BANDS x ROWS hash values per question).
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_MAX_ENTRIES = 5000
+ANSWER_CACHE_MIN_SIMILARITY = 0.6
+ANSWER_CACHE_MINHASH_BANDS = 16
+ANSWER_CACHE_MINHASH_ROWS = 4
+
+# HTTP service (server.py). Each backend runs at most its concurrency limit of
+# queries; up to SERVICE_MAX_QUEUED more wait SERVICE_QUEUE_TIMEOUT_SECONDS for
+# a slot before the request is refused with 503.
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8080
+SERVICE_TREE_CONCURRENCY = 4
+SERVICE_CORPUS_CONCURRENCY = 2
+SERVICE_MAX_QUEUED = 32
+SERVICE_QUEUE_TIMEOUT_SECONDS = 10
+SERVICE_REQUEST_TIMEOUT_SECONDS = 120
+SERVICE_MAX_BODY_BYTES = 64 * 1024
 
 GROQ_MODEL_NAME = "llama-3.1-8b-instant"
+GEMINI_MODEL_NAME = "gemini-1.5-flash"
+LLM_MAX_CONCURRENCY = 8
+
+# LLM calls go through llm/router.py, which uses LLM_PROVIDERS in order,
+# skipping any without an API key or SDK. A call still running after its
+# provider's p95 latency (LLM_HEDGE_DELAY_SECONDS until LLM_HEDGE_MIN_SAMPLES
+# latencies are known) is duplicated on the next provider and the first reply
+# wins. 429s, 5xx and timeouts fail over to the next provider; after
+# LLM_BREAKER_FAILURES of them in a row a provider is skipped for
+# LLM_BREAKER_COOLDOWN_SECONDS.
+LLM_PROVIDERS = ("groq", "gemini")
+LLM_HEDGE_ENABLED = True
+LLM_HEDGE_DELAY_SECONDS = 2.0
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_LATENCY_WINDOW = 200
+LLM_BREAKER_FAILURES = 3
+LLM_BREAKER_COOLDOWN_SECONDS = 30
+
+LLM_CACHE_ENABLED = True
+LLM_CACHE_PATH = os.path.join(INDEX_DIR, "llm_cache.sqlite3")
+LLM_CACHE_MEMORY_ENTRIES = 512
+LLM_CACHE_DISK_ENTRIES = 20000
+LLM_CACHE_TTL_SECONDS = 7 * 24 * 3600
+# The cache is dropped whenever this file (the PageIndex tree store manifest) changes.
+LLM_CACHE_VERSION_PATH = os.path.join(PAGEINDEX_TREES_DIR, "manifest.json")
 
 TREE_MAX_DEPTH = 6
 TREE_MAX_NODES_PER_STEP = 6
 TREE_SELECT_TOP_K = 3
-NODE_TEXT_MAX_CHARS = 1200
+# Trees (and their compiled forms) kept in memory; the rest stay on disk until queried.
+TREE_STORE_MAX_LOADED = 16
+
+# Answer context: selected nodes are split into passages of at most
+# CONTEXT_PASSAGE_MAX_TOKENS, ranked against the question and packed into
+# CONTEXT_TOKEN_BUDGET estimated tokens (see scripts/context_packer.py).
+CONTEXT_TOKEN_BUDGET = 1500
+CONTEXT_PASSAGE_MAX_TOKENS = 120
+
+# Skip the LLM selection step when one candidate's BM25 score is at least
+# TREE_LEXICAL_MARGIN times the runner-up's (and above TREE_LEXICAL_MIN_SCORE).
+TREE_LEXICAL_ENABLED = True
+TREE_LEXICAL_MARGIN = 2.0
+TREE_LEXICAL_MIN_SCORE = 1.0
+
+# "sequential" walks one merged candidate list per level; "branch" explores
+# each selected branch concurrently (see pageindex_query.aquery_tree);
+# "outline" selects leaves from the whole tree in a single call.
+TREE_TRAVERSAL_MODE = "sequential"
+TREE_BRANCH_FANOUT = 3
+TREE_BRANCH_MAX_CONTEXTS = 6
+TREE_SPECULATIVE_PREFETCH = True
+
+# "outline" mode sends the whole compiled tree as a compact outline in one
+# call, falling back to the iterative walk above this estimated size.
+TREE_OUTLINE_TOKEN_BUDGET = 8000
+TREE_OUTLINE_SUMMARY_CHARS = 60
+
+# Levels wider than TREE_TOURNAMENT_BATCH_SIZE are split into groups scored in
+# parallel, with a final round over the group winners, instead of truncated.
+TREE_TOURNAMENT_ENABLED = True
+TREE_TOURNAMENT_BATCH_SIZE = TREE_MAX_NODES_PER_STEP
+TREE_TOURNAMENT_CONCURRENCY = LLM_MAX_CONCURRENCY
+
+# Batch QA asks up to BATCH_QUESTIONS_PER_PROMPT questions that face the same
+# candidate list in one selection prompt; BATCH_CONCURRENCY bounds the LLM
+# calls (selection groups and answers) in flight at once.
+BATCH_CONCURRENCY = LLM_MAX_CONCURRENCY
+BATCH_QUESTIONS_PER_PROMPT = 8
+
+# Corpus-wide queries route the question to at most ROUTE_TOP_DOCS documents
+# by summing BM25 scores of the ROUTE_CANDIDATE_PAGES best pages per file;
+# documents scoring below ROUTE_MIN_SCORE_RATIO of the best are not traversed.
+ROUTE_TOP_DOCS = 3
+ROUTE_CANDIDATE_PAGES = 20
+ROUTE_MIN_SCORE_RATIO = 0.3
+
+BM25_TOP_K = 5
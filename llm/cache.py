@@ -0,0 +1,209 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import tracing
+
+from config import (
+    LLM_CACHE_DISK_ENTRIES,
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_MEMORY_ENTRIES,
+    LLM_CACHE_PATH,
+    LLM_CACHE_TTL_SECONDS,
+    LLM_CACHE_VERSION_PATH,
+)
+
+
+def _file_fingerprint(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return "missing"
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+class LLMCache:
+    """Two-tier (in-memory LRU + SQLite) cache of LLM completions.
+
+    Entries expire after ``ttl_seconds`` and each tier is trimmed to its size
+    limit, oldest first. When ``version_path`` changes (the PageIndex tree store
+    manifest by default) the whole cache is dropped, since prompts built from the old trees
+    are no longer meaningful.
+    """
+
+    def __init__(
+        self,
+        path=LLM_CACHE_PATH,
+        memory_entries=LLM_CACHE_MEMORY_ENTRIES,
+        disk_entries=LLM_CACHE_DISK_ENTRIES,
+        ttl_seconds=LLM_CACHE_TTL_SECONDS,
+        version_path=LLM_CACHE_VERSION_PATH,
+    ):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl_seconds = ttl_seconds
+        self.version_path = version_path
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._version = None
+
+    @staticmethod
+    def make_key(model, temperature, prompt):
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{model}\0{temperature!r}\0{prompt_hash}".encode("utf-8")).hexdigest()
+
+    def _db(self):
+        if self._conn is None:
+            with tracing.span("llm_cache.open", path=self.path):
+                if os.path.dirname(self.path):
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._conn = sqlite3.connect(self.path, check_same_thread=False)
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS completions ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS completions_created ON completions (created_at)")
+                self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+                self._conn.commit()
+        return self._conn
+
+    def _check_version(self):
+        # Called with the lock held; one stat() per lookup.
+        version = _file_fingerprint(self.version_path) if self.version_path else ""
+        if version == self._version:
+            return
+        db = self._db()
+        row = db.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+        if row is None or row[0] != version:
+            self._clear()
+            db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('version', ?)", (version,))
+            db.commit()
+        self._version = version
+
+    def _clear(self):
+        self._memory.clear()
+        self._db().execute("DELETE FROM completions")
+        self._db().commit()
+        self.stats["invalidations"] += 1
+
+    def _remember(self, key, value, created_at):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def get(self, key):
+        value, tier = self._lookup(key)
+        tracing.annotate(cache=tier)
+        if value is None:
+            tracing.count("llm_cache_misses_total")
+        else:
+            tracing.count("llm_cache_hits_total", tier=tier)
+        return value
+
+    def _lookup(self, key):
+        now = time.time()
+        with self._lock:
+            self._check_version()
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] < self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry[0], "memory"
+            self._memory.pop(key, None)
+
+            row = self._db().execute(
+                "SELECT value, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] < self.ttl_seconds:
+                self._remember(key, row[0], row[1])
+                self.stats["disk_hits"] += 1
+                return row[0], "disk"
+
+            self.stats["misses"] += 1
+            return None, "miss"
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._check_version()
+            self._remember(key, value, now)
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO completions (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, now),
+            )
+            db.execute("DELETE FROM completions WHERE created_at < ?", (now - self.ttl_seconds,))
+            cursor = db.execute(
+                "DELETE FROM completions WHERE key IN ("
+                "SELECT key FROM completions ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_entries,),
+            )
+            self.stats["evictions"] += max(cursor.rowcount, 0)
+            db.commit()
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache()
+    return _cache
+
+
+def cached_call(model, prompt, temperature, generate, use_cache=True):
+    """Return a cached completion for (model, temperature, prompt), calling generate() on a miss."""
+    if not use_cache or not LLM_CACHE_ENABLED:
+        return generate()
+    cache = get_cache()
+    key = LLMCache.make_key(model, temperature, prompt)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    value = generate()
+    if value:
+        cache.set(key, value)
+    return value
+
+
+def cached_stream(model, prompt, temperature, stream, use_cache=True):
+    """Yield completion chunks, replaying a cached completion as one chunk on a hit."""
+    if not use_cache or not LLM_CACHE_ENABLED:
+        yield from stream()
+        return
+    cache = get_cache()
+    key = LLMCache.make_key(model, temperature, prompt)
+    cached = cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    for chunk in stream():
+        parts.append(chunk)
+        yield chunk
+    # Only a fully consumed stream is cached; an abandoned one never reaches this point.
+    value = "".join(parts)
+    if value:
+        cache.set(key, value)
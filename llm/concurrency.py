@@ -0,0 +1,37 @@
+import asyncio
+import contextvars
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncLimiter:
+    """Runs blocking calls from coroutines with at most ``limit`` in flight.
+
+    asyncio.Semaphore is bound to the loop that first uses it, while the LLM
+    clients are process-wide and may be driven from several loops (e.g. one
+    asyncio.run per Streamlit rerun), so one semaphore is kept per loop. Calls
+    run on a dedicated thread pool sized to the limit rather than the loop's
+    default executor, whose size depends on the CPU count. The caller's
+    context variables (e.g. the active trace) are carried into the thread.
+    """
+
+    def __init__(self, limit, thread_name_prefix="llm"):
+        self.limit = limit
+        self._executor = ThreadPoolExecutor(max_workers=limit, thread_name_prefix=thread_name_prefix)
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _semaphore(self, loop):
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.limit)
+                self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        async with self._semaphore(loop):
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(self._executor, context.run, func, *args)
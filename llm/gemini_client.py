@@ -1,9 +1,19 @@
 import os
+import threading
+import time
 
 from dotenv import load_dotenv
 import google.generativeai as genai
 
-from config import GEMINI_API_KEY_ENV, GEMINI_MODEL_NAME
+from config import GEMINI_API_KEY_ENV, GEMINI_MODEL_NAME, LLM_MAX_CONCURRENCY
+from llm.cache import cached_call, cached_stream
+from llm.concurrency import AsyncLimiter
+import tracing
+from token_count import estimate_tokens
+
+_model = None
+_model_lock = threading.Lock()
+_limiter = AsyncLimiter(LLM_MAX_CONCURRENCY)
 
 
 def _get_api_key():
@@ -17,17 +27,73 @@ def _get_api_key():
 
 
 def get_gemini_model():
-    api_key = _get_api_key()
-    genai.configure(api_key=api_key)
-    return genai.GenerativeModel(GEMINI_MODEL_NAME)
+    # Configure the SDK and build the model once per process.
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                genai.configure(api_key=_get_api_key())
+                _model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+    return _model
+
+
+def _complete(prompt, temperature):
+    model = get_gemini_model()
+    response = model.generate_content(
+        prompt,
+        generation_config={
+            "temperature": temperature,
+        },
+    )
+    content = response.text or ""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        tracing.record_llm_usage(GEMINI_MODEL_NAME, usage.prompt_token_count, usage.candidates_token_count)
+    else:
+        tracing.record_llm_usage(GEMINI_MODEL_NAME, estimate_tokens(prompt), estimate_tokens(content))
+    return content
 
 
-def generate_text(prompt, temperature=0.2):
+def _complete_stream(prompt, temperature):
     model = get_gemini_model()
     response = model.generate_content(
         prompt,
         generation_config={
             "temperature": temperature,
         },
+        stream=True,
     )
-    return response.text or ""
+    for chunk in response:
+        if chunk.text:
+            yield chunk.text
+
+
+def generate_text(prompt, temperature=0.2, use_cache=True):
+    with tracing.span("llm.generate", model=GEMINI_MODEL_NAME, temperature=temperature):
+        return cached_call(
+            GEMINI_MODEL_NAME, prompt, temperature, lambda: _complete(prompt, temperature), use_cache
+        )
+
+
+def _stream_with_usage(prompt, temperature):
+    # Streamed responses carry no usage block here, so tokens are estimated.
+    parts = []
+    for chunk in _complete_stream(prompt, temperature):
+        parts.append(chunk)
+        yield chunk
+    tracing.record_llm_usage(GEMINI_MODEL_NAME, estimate_tokens(prompt), estimate_tokens("".join(parts)))
+
+
+def stream_text(prompt, temperature=0.2, use_cache=True):
+    started = time.perf_counter()
+    chunks = 0
+    for chunk in cached_stream(
+        GEMINI_MODEL_NAME, prompt, temperature, lambda: _stream_with_usage(prompt, temperature), use_cache
+    ):
+        chunks += 1
+        yield chunk
+    tracing.record_span("llm.stream", started, model=GEMINI_MODEL_NAME, temperature=temperature, chunks=chunks)
+
+
+async def agenerate_text(prompt, temperature=0.2, use_cache=True):
+    return await _limiter.run(generate_text, prompt, temperature, use_cache)
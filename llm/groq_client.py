@@ -1,9 +1,19 @@
 import os
+import threading
+import time
 
 from dotenv import load_dotenv
 from groq import Groq
 
-from config import GROQ_API_KEY_ENV, GROQ_MODEL_NAME
+from config import GROQ_API_KEY_ENV, GROQ_MODEL_NAME, LLM_MAX_CONCURRENCY
+from llm.cache import cached_call, cached_stream
+from llm.concurrency import AsyncLimiter
+import tracing
+from token_count import estimate_tokens
+
+_client = None
+_client_lock = threading.Lock()
+_limiter = AsyncLimiter(LLM_MAX_CONCURRENCY)
 
 
 def _get_api_key():
@@ -17,11 +27,16 @@ def _get_api_key():
 
 
 def _get_client():
-    api_key = _get_api_key()
-    return Groq(api_key=api_key)
+    # One client per process: its HTTP connection pool stays warm across prompts.
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = Groq(api_key=_get_api_key())
+    return _client
 
 
-def generate_text(prompt, temperature=0.2):
+def _complete(prompt, temperature):
     client = _get_client()
     response = client.chat.completions.create(
         model=GROQ_MODEL_NAME,
@@ -30,4 +45,60 @@ def generate_text(prompt, temperature=0.2):
         ],
         temperature=temperature,
     )
-    return response.choices[0].message.content or ""
+    content = response.choices[0].message.content or ""
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        tracing.record_llm_usage(GROQ_MODEL_NAME, usage.prompt_tokens, usage.completion_tokens)
+    else:
+        tracing.record_llm_usage(GROQ_MODEL_NAME, estimate_tokens(prompt), estimate_tokens(content))
+    return content
+
+
+def _complete_stream(prompt, temperature):
+    client = _get_client()
+    stream = client.chat.completions.create(
+        model=GROQ_MODEL_NAME,
+        messages=[
+            {"role": "user", "content": prompt},
+        ],
+        temperature=temperature,
+        stream=True,
+    )
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        content = chunk.choices[0].delta.content
+        if content:
+            yield content
+
+
+def generate_text(prompt, temperature=0.2, use_cache=True):
+    with tracing.span("llm.generate", model=GROQ_MODEL_NAME, temperature=temperature):
+        return cached_call(
+            GROQ_MODEL_NAME, prompt, temperature, lambda: _complete(prompt, temperature), use_cache
+        )
+
+
+def _stream_with_usage(prompt, temperature):
+    # Streamed responses carry no usage block here, so tokens are estimated.
+    parts = []
+    for chunk in _complete_stream(prompt, temperature):
+        parts.append(chunk)
+        yield chunk
+    tracing.record_llm_usage(GROQ_MODEL_NAME, estimate_tokens(prompt), estimate_tokens("".join(parts)))
+
+
+def stream_text(prompt, temperature=0.2, use_cache=True):
+    started = time.perf_counter()
+    chunks = 0
+    for chunk in cached_stream(
+        GROQ_MODEL_NAME, prompt, temperature, lambda: _stream_with_usage(prompt, temperature), use_cache
+    ):
+        chunks += 1
+        yield chunk
+    tracing.record_span("llm.stream", started, model=GROQ_MODEL_NAME, temperature=temperature, chunks=chunks)
+
+
+async def agenerate_text(prompt, temperature=0.2, use_cache=True):
+    # The pooled sync client runs in worker threads, so it can serve any event loop.
+    return await _limiter.run(generate_text, prompt, temperature, use_cache)
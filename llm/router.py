@@ -0,0 +1,382 @@
+import contextvars
+import importlib
+import importlib.util
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+
+from config import (
+    GEMINI_API_KEY_ENV,
+    GEMINI_MODEL_NAME,
+    GROQ_API_KEY_ENV,
+    GROQ_MODEL_NAME,
+    LLM_BREAKER_COOLDOWN_SECONDS,
+    LLM_BREAKER_FAILURES,
+    LLM_HEDGE_DELAY_SECONDS,
+    LLM_HEDGE_ENABLED,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_LATENCY_WINDOW,
+    LLM_MAX_CONCURRENCY,
+    LLM_PROVIDERS,
+)
+from llm.cache import cached_call, cached_stream
+from llm.concurrency import AsyncLimiter
+import tracing
+
+# name -> (client module, model, API key variable, SDK module)
+_CLIENTS = {
+    "groq": ("llm.groq_client", GROQ_MODEL_NAME, GROQ_API_KEY_ENV, "groq"),
+    "gemini": ("llm.gemini_client", GEMINI_MODEL_NAME, GEMINI_API_KEY_ENV, "google.generativeai"),
+}
+_RETRYABLE_NAMES = ("Timeout", "Connection", "RateLimit", "ResourceExhausted", "ServiceUnavailable", "InternalServer")
+
+
+def _status_code(error):
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    return getattr(getattr(error, "response", None), "status_code", None)
+
+
+def is_retryable(error):
+    """True for errors another provider may not hit: 429, 5xx, timeouts and dropped connections."""
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(part in type(error).__name__ for part in _RETRYABLE_NAMES)
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """Stops calls to a provider after ``failures`` retryable errors in a row.
+
+    The breaker then stays open for ``cooldown`` seconds (longer if a 429
+    asked for it), after which a single trial call is let through: success
+    closes it again, another failure reopens it, and any other outcome lets
+    the next call be the trial.
+    """
+
+    def __init__(self, failures=LLM_BREAKER_FAILURES, cooldown=LLM_BREAKER_COOLDOWN_SECONDS, clock=time.monotonic):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = "closed"
+        self._consecutive = 0
+        self._open_until = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "open" and self.clock() >= self._open_until:
+                self.state = "half_open"
+                self._trial = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def release(self):
+        """End a call that says nothing about the provider's health (cancelled, or a non-retryable error)."""
+        with self._lock:
+            self._trial = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._consecutive = 0
+
+    def record_failure(self, retry_after=None):
+        with self._lock:
+            self._consecutive += 1
+            if self.state == "half_open" or self._consecutive >= self.failures or retry_after:
+                self.state = "open"
+                self._open_until = self.clock() + max(self.cooldown, retry_after or 0)
+
+
+class Provider:
+    """One LLM backend behind the router, with its recent latencies, errors and circuit breaker.
+
+    ``complete(prompt, temperature)`` returns the reply text and
+    ``stream(prompt, temperature)`` yields it in chunks. A provider whose
+    ``api_key_env`` is unset or whose ``sdk`` module is missing is skipped.
+    """
+
+    def __init__(
+        self,
+        name,
+        model,
+        complete,
+        stream=None,
+        api_key_env=None,
+        sdk=None,
+        window=LLM_LATENCY_WINDOW,
+        breaker=None,
+    ):
+        self.name = name
+        self.model = model
+        self.complete = complete
+        self.stream = stream
+        self.api_key_env = api_key_env
+        self.sdk = sdk
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self._latencies = deque(maxlen=window)
+        self._errors = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def configured(self):
+        if self.api_key_env is not None and not os.getenv(self.api_key_env):
+            return False
+        if self.sdk is not None:
+            try:
+                return importlib.util.find_spec(self.sdk) is not None
+            except ModuleNotFoundError:
+                return False
+        return True
+
+    def record(self, seconds, error=None):
+        """Record one finished call; only retryable errors count against the provider."""
+        failed = error is not None and is_retryable(error)
+        with self._lock:
+            self._errors.append(failed)
+            if seconds is not None and error is None:
+                self._latencies.append(seconds)
+        if failed:
+            self.breaker.record_failure(_retry_after(error) if _status_code(error) == 429 else None)
+        elif error is None:
+            self.breaker.record_success()
+        else:
+            self.breaker.release()
+        if seconds is not None:
+            tracing.metrics.observe("llm_provider_duration_seconds", seconds, provider=self.name)
+        tracing.count(
+            "llm_provider_requests_total",
+            provider=self.name,
+            status="ok" if error is None else ("retryable" if failed else "error"),
+        )
+
+    def percentile(self, q):
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def hedge_delay(self, min_samples=LLM_HEDGE_MIN_SAMPLES, default=LLM_HEDGE_DELAY_SECONDS):
+        with self._lock:
+            samples = len(self._latencies)
+        return self.percentile(0.95) if samples >= min_samples else default
+
+    def status(self):
+        with self._lock:
+            samples = len(self._latencies)
+            errors = sum(self._errors)
+            calls = len(self._errors)
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "model": self.model,
+            "state": self.breaker.state,
+            "samples": samples,
+            "p50_ms": None if p50 is None else round(p50 * 1000, 1),
+            "p95_ms": None if p95 is None else round(p95 * 1000, 1),
+            "error_rate": round(errors / calls, 3) if calls else 0.0,
+        }
+
+
+def client_provider(name):
+    """A Provider backed by one of the llm/*_client modules (imported on first call)."""
+    module_name, model, api_key_env, sdk = _CLIENTS[name]
+
+    def complete(prompt, temperature):
+        return importlib.import_module(module_name)._complete(prompt, temperature)
+
+    def stream(prompt, temperature):
+        return importlib.import_module(module_name)._stream_with_usage(prompt, temperature)
+
+    return Provider(name, model, complete, stream, api_key_env=api_key_env, sdk=sdk)
+
+
+class LLMRouter:
+    """Sends each prompt to the first usable provider, hedging slow calls and failing over on errors.
+
+    A call still running after its provider's p95 latency gets a duplicate on
+    the next provider; the first reply wins and the other call is cancelled
+    (or, once its blocking request is under way, left to finish with its
+    reply dropped). A retryable error (429, 5xx, timeout) moves on to the next
+    provider, and providers whose breaker is open are skipped. Streams fail
+    over only before their first chunk and are not hedged.
+    """
+
+    def __init__(self, providers, hedge=LLM_HEDGE_ENABLED, max_workers=2 * LLM_MAX_CONCURRENCY):
+        self.providers = list(providers)
+        self.hedge = hedge
+        self.cache_model = "+".join(provider.model for provider in self.providers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-router")
+
+    def _usable(self):
+        usable = [provider for provider in self.providers if provider.configured()]
+        # With nothing configured, the first provider's own error explains what is missing.
+        return usable or self.providers[:1]
+
+    def _next(self, providers, tried):
+        for provider in providers:
+            if provider not in tried and provider.breaker.allow():
+                tried.append(provider)
+                return provider
+        return None
+
+    def _call(self, provider, prompt, temperature):
+        started = time.perf_counter()
+        with tracing.span("llm.provider", provider=provider.name, model=provider.model):
+            try:
+                text = provider.complete(prompt, temperature)
+            except Exception as e:
+                provider.record(time.perf_counter() - started, e)
+                raise
+        provider.record(time.perf_counter() - started)
+        return text
+
+    def _submit(self, provider, prompt, temperature):
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, self._call, provider, prompt, temperature)
+
+    def _cancel(self, pending):
+        for future, provider in pending.items():
+            if future.cancel():
+                # A call that never started reports no outcome, so hand back a half-open trial slot here.
+                provider.breaker.release()
+                tracing.count("llm_hedge_cancelled_total", provider=provider.name)
+
+    def complete(self, prompt, temperature=0.2):
+        """Return (reply, provider) for ``prompt``."""
+        providers = self._usable()
+        tried = []
+        primary = self._next(providers, tried)
+        if primary is None:
+            raise RuntimeError("Every LLM provider is failing (circuit breakers open). Please retry shortly.")
+        pending = {self._submit(primary, prompt, temperature): primary}
+        deadline = time.monotonic() + primary.hedge_delay()
+        hedged = not self.hedge
+        last_error = None
+
+        while pending:
+            timeout = None if hedged else max(0.0, deadline - time.monotonic())
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                backup = self._next(providers, tried)
+                if backup is not None:
+                    tracing.count("llm_hedged_requests_total", provider=backup.name)
+                    pending[self._submit(backup, prompt, temperature)] = backup
+                continue
+
+            for future in done:
+                provider = pending.pop(future)
+                error = future.exception()
+                if error is None:
+                    self._cancel(pending)
+                    tracing.annotate(provider=provider.name, model=provider.model, hedged=len(tried) > 1)
+                    return future.result(), provider
+                if not is_retryable(error):
+                    self._cancel(pending)
+                    raise error
+                last_error = error
+
+            if not pending:
+                fallback = self._next(providers, tried)
+                if fallback is None:
+                    break
+                tracing.count("llm_failovers_total", provider=fallback.name)
+                pending[self._submit(fallback, prompt, temperature)] = fallback
+                deadline = time.monotonic() + fallback.hedge_delay()
+        if last_error is None:
+            raise RuntimeError("Every LLM provider is failing (circuit breakers open). Please retry shortly.")
+        raise last_error
+
+    def stream(self, prompt, temperature=0.2):
+        providers = self._usable()
+        tried = []
+        last_error = None
+        while True:
+            provider = self._next(providers, tried)
+            if provider is None:
+                break
+            if provider.stream is None:
+                yield self._call(provider, prompt, temperature)
+                return
+            try:
+                chunks = iter(provider.stream(prompt, temperature))
+                first = next(chunks, None)
+            except Exception as e:
+                provider.record(None, e)
+                if not is_retryable(e):
+                    raise
+                last_error = e
+                tracing.count("llm_failovers_total", provider=provider.name)
+                continue
+            provider.record(None)
+            if first is not None:
+                yield first
+                yield from chunks
+            return
+        if last_error is None:
+            raise RuntimeError("Every LLM provider is failing (circuit breakers open). Please retry shortly.")
+        raise last_error
+
+    def status(self):
+        return {provider.name: provider.status() for provider in self.providers}
+
+
+_router = None
+_router_lock = threading.Lock()
+_limiter = AsyncLimiter(LLM_MAX_CONCURRENCY)
+
+
+def get_router():
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                load_dotenv()
+                _router = LLMRouter([client_provider(name) for name in LLM_PROVIDERS])
+    return _router
+
+
+def generate_text(prompt, temperature=0.2, use_cache=True):
+    router = get_router()
+    with tracing.span("llm.generate", model=router.cache_model, temperature=temperature):
+        return cached_call(
+            router.cache_model, prompt, temperature, lambda: router.complete(prompt, temperature)[0], use_cache
+        )
+
+
+def stream_text(prompt, temperature=0.2, use_cache=True):
+    router = get_router()
+    started = time.perf_counter()
+    chunks = 0
+    for chunk in cached_stream(
+        router.cache_model, prompt, temperature, lambda: router.stream(prompt, temperature), use_cache
+    ):
+        chunks += 1
+        yield chunk
+    tracing.record_span("llm.stream", started, model=router.cache_model, temperature=temperature, chunks=chunks)
+
+
+async def agenerate_text(prompt, temperature=0.2, use_cache=True):
+    return await _limiter.run(generate_text, prompt, temperature, use_cache)
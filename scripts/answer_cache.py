@@ -0,0 +1,251 @@
+# scripts/answer_cache.py
+
+import hashlib
+import itertools
+import random
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import tracing
+from scripts.bm25 import tokenize
+from config import (
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_MIN_SIMILARITY,
+    ANSWER_CACHE_MINHASH_BANDS,
+    ANSWER_CACHE_MINHASH_ROWS,
+)
+
+# Words that change how a question is phrased, not what it asks.
+_STOPWORDS = frozenset(
+    """a an the is are was were be been am do does did doing has have had having can could will would
+    shall should may might must i me my we our us you your it its this that these those there here
+    what which who whom whose when where why how of in on at to for from by with about under as into
+    and or if than then so any all please tell explain know policy insurance plan""".split()
+)
+# Questions differing in any of these (or in a token with a digit) ask about different amounts, ages or periods.
+_NUMBER_WORDS = """zero one two three four five six seven eight nine ten eleven twelve fifteen twenty thirty forty
+    fifty sixty seventy eighty ninety hundred thousand lakh lakhs crore crores million first second third fourth
+    fifth sixth seventh eighth ninth tenth eleventh twelfth""".split()
+# Negation and direction words flip the answer but carry little IDF weight, so they must match too.
+_POLARITY_WORDS = """not no non nor never none neither cannot without except excluding excluded t isn aren doesn don
+    didn wasn weren won wouldn shouldn couldn hasn haven within after before above below beyond over upto until
+    till since prior post pre during inside outside out more less minimum maximum""".split()
+_SUFFIXES = (("ies", "y"), ("ment", ""), ("ing", ""), ("ed", ""), ("age", ""), ("ss", "ss"), ("s", ""))
+_PRIME = (1 << 61) - 1
+
+
+def _stem(token):
+    for suffix, replacement in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[: -len(suffix)] + replacement
+    return token
+
+
+_QUANTITY_TOKENS = frozenset(_stem(word) for word in _NUMBER_WORDS)
+_POLARITY_TOKENS = frozenset(_stem(word) for word in _POLARITY_WORDS)
+
+
+def _changes_answer(token):
+    return token in _QUANTITY_TOKENS or token in _POLARITY_TOKENS or any(char.isdigit() for char in token)
+
+
+def normalize_question(question):
+    """Distinct content tokens of ``question``: bm25 tokens minus stopwords, lightly stemmed."""
+    return frozenset(_stem(token) for token in tokenize(question) if token not in _STOPWORDS)
+
+
+def _token_hash(token):
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+_term_weights = weakref.WeakKeyDictionary()
+_weights_lock = threading.Lock()
+
+
+def term_weights(compiled):
+    """IDF of each stemmed term in a compiled tree, so shared rare terms count for more than common ones."""
+    with _weights_lock:
+        weights = _term_weights.get(compiled)
+    if weights is None:
+        weights = {}
+        index = compiled.lexical_index()
+        for term, idf in zip(index.vocabulary.terms(), index.idf.tolist()):
+            stem = _stem(term)
+            weights[stem] = max(idf, weights.get(stem, 0.0))
+        with _weights_lock:
+            _term_weights[compiled] = weights
+    return weights
+
+
+def weighted_jaccard(a, b, weights):
+    # Terms the document never uses are treated as its rarest.
+    default = max(weights.values(), default=1.0)
+    union = sum(weights.get(token, default) for token in a | b)
+    if not union:
+        return 0.0
+    return sum(weights.get(token, default) for token in a & b) / union
+
+
+class _Entry:
+    __slots__ = ("namespace", "question", "tokens", "bands", "result")
+
+    def __init__(self, namespace, question, tokens, bands, result):
+        self.namespace = namespace
+        self.question = question
+        self.tokens = tokens
+        self.bands = bands
+        self.result = result
+
+
+class AnswerCache:
+    """Bounded LRU of answered questions with MinHash/LSH lookup of near-duplicates.
+
+    Entries live in a namespace (doc_id, tree version, mode), so a rebuilt
+    tree never serves old answers. Each question's content tokens get a
+    MinHash signature cut into ``bands`` bands of ``rows`` values. Questions
+    sharing any band with the new one are candidates, and the best candidate
+    is used if its IDF-weighted Jaccard similarity reaches ``min_similarity``
+    and the two questions do not differ in a number or ordinal.
+    """
+
+    def __init__(
+        self,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        min_similarity=ANSWER_CACHE_MIN_SIMILARITY,
+        bands=ANSWER_CACHE_MINHASH_BANDS,
+        rows=ANSWER_CACHE_MINHASH_ROWS,
+        seed=0,
+    ):
+        self.max_entries = max_entries
+        self.min_similarity = min_similarity
+        self.bands = bands
+        self.rows = rows
+        rng = random.Random(seed)
+        self._permutations = [(rng.randrange(1, _PRIME), rng.randrange(_PRIME)) for _ in range(bands * rows)]
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "exact_hits": 0, "misses": 0, "evictions": 0}
+
+    def _band_keys(self, namespace, tokens):
+        hashes = [_token_hash(token) for token in tokens]
+        signature = [min((a * h + b) % _PRIME for h in hashes) for a, b in self._permutations]
+        return [
+            (namespace, band, tuple(signature[band * self.rows : (band + 1) * self.rows]))
+            for band in range(self.bands)
+        ]
+
+    def lookup(self, namespace, question, weights):
+        """Return (result, similarity, cached question) for the closest earlier question, or None."""
+        tokens = normalize_question(question)
+        if not tokens:
+            return None
+        band_keys = self._band_keys(namespace, tokens)
+        with self._lock:
+            candidates = set()
+            for key in band_keys:
+                candidates.update(self._buckets.get(key, ()))
+            best = None
+            best_similarity = 0.0
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                # "5 lakh" vs "10 lakh", "first year" vs "second year" or "covered" vs "not covered"
+                # share most words but not the answer.
+                if any(_changes_answer(token) for token in tokens ^ entry.tokens):
+                    continue
+                similarity = 1.0 if entry.tokens == tokens else weighted_jaccard(tokens, entry.tokens, weights)
+                if similarity > best_similarity:
+                    best, best_similarity = entry_id, similarity
+            if best is None or best_similarity < self.min_similarity:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(best)
+            entry = self._entries[best]
+            self.stats["hits"] += 1
+            if best_similarity == 1.0:
+                self.stats["exact_hits"] += 1
+            return entry.result, best_similarity, entry.question
+
+    def store(self, namespace, question, result):
+        tokens = normalize_question(question)
+        if not tokens:
+            return
+        band_keys = self._band_keys(namespace, tokens)
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = _Entry(namespace, question, tokens, band_keys, result)
+            for key in band_keys:
+                self._buckets.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        entry_id, entry = self._entries.popitem(last=False)
+        for key in entry.bands:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+        self.stats["evictions"] += 1
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache()
+    return _cache
+
+
+def cached_answer(question, namespace, compiled):
+    """A stored result for ``question`` or a near-duplicate, with the hit recorded as the first traversal step."""
+    started = time.perf_counter()
+    with tracing.span("answer_cache.lookup") as attrs:
+        hit = get_answer_cache().lookup(namespace, question, term_weights(compiled))
+        attrs["hit"] = hit is not None
+    if hit is None:
+        tracing.count("answer_cache_misses_total")
+        return None
+    tracing.count("answer_cache_hits_total")
+
+    result, similarity, cached_question = hit
+    step = {
+        "depth": 0,
+        "selected": [node["node_id"] for node in result["selected_nodes"]],
+        "reason": f"answer cache hit: similar to {cached_question!r} (similarity {similarity:.2f}); "
+        "the steps below are from that question",
+        "method": "answer_cache",
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        "cached_question": cached_question,
+        "similarity": round(similarity, 3),
+    }
+    return {
+        "answer": result["answer"],
+        "selected_nodes": result["selected_nodes"],
+        "traversal": [step] + result["traversal"],
+    }
+
+
+def remember_answer(question, namespace, result):
+    get_answer_cache().store(
+        namespace,
+        question,
+        {
+            "answer": result["answer"],
+            "selected_nodes": result["selected_nodes"],
+            "traversal": result["traversal"],
+        },
+    )
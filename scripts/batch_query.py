@@ -0,0 +1,387 @@
+# scripts/batch_query.py
+
+import asyncio
+import json
+import os
+import time
+
+import tracing
+from llm.router import agenerate_text
+from scripts.bm25 import tokenize
+from scripts.compiled_tree import get_compiled_tree
+from scripts.pageindex_query import (
+    _aanswer_with_reasons,
+    _aselect_nodes,
+    _collect_context,
+    _elapsed_ms,
+    _extract_json_object,
+    _format_candidate_nodes,
+    _lexical_step,
+)
+from config import (
+    BATCH_CONCURRENCY,
+    BATCH_QUESTIONS_PER_PROMPT,
+    TREE_LEXICAL_ENABLED,
+    TREE_MAX_DEPTH,
+    TREE_MAX_NODES_PER_STEP,
+    TREE_SELECT_TOP_K,
+    TREE_TOURNAMENT_BATCH_SIZE,
+    TREE_TOURNAMENT_ENABLED,
+)
+
+
+def load_questions(path):
+    """Read questions from a .jsonl file (one {"question": ...} per line) or a plain text file (one per line)."""
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if path.endswith(".jsonl"):
+                line = json.loads(line)["question"]
+            questions.append(line)
+    return questions
+
+
+def _batch_selection_prompt(questions, node_ids, compiled):
+    questions_text = "\n".join(f"{number}. {question}" for number, question in enumerate(questions, 1))
+    candidates_text = _format_candidate_nodes(node_ids, compiled)
+
+    return f"""You are selecting the most relevant sections in a document tree for several questions.
+Questions:
+{questions_text}
+
+Candidates:
+{candidates_text}
+
+Rules:
+- For each question, pick up to {TREE_SELECT_TOP_K} node ids that best match it.
+- Prefer precise sections over broad ones.
+- If none look relevant to a question, return an empty list for it.
+
+Return JSON only, one entry per question:
+{{"selections": [{{"question": 1, "selected_ids": ["id1", "id2"], "reason": "...", "drill_down": true}}]}}
+"""
+
+
+def _parse_batch_selection(raw, count, compiled):
+    """Map question number (1-based) to (selected, reason, drill_down); unusable entries are left out."""
+    data = _extract_json_object(raw) or {}
+    parsed = {}
+    for entry in data.get("selections") or []:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            number = int(entry.get("question"))
+        except (TypeError, ValueError):
+            continue
+        selected = [sid for sid in entry.get("selected_ids") or [] if sid in compiled]
+        if 1 <= number <= count and selected:
+            parsed[number] = (selected, entry.get("reason") or "", bool(entry.get("drill_down")))
+    return parsed
+
+
+class _QuestionState:
+    __slots__ = (
+        "index",
+        "question",
+        "lexical_scores",
+        "current_ids",
+        "selected_ids",
+        "traversal",
+        "selection_ms",
+        "error",
+    )
+
+    def __init__(self, index, question, compiled, lexical):
+        self.index = index
+        self.question = question
+        self.lexical_scores = None
+        if lexical:
+            self.lexical_scores = compiled.lexical_index().get_scores(tokenize(question))
+        self.current_ids = list(compiled.root_ids)
+        self.selected_ids = []
+        self.traversal = []
+        self.selection_ms = None
+        self.error = None
+
+
+class _BatchRun:
+    """Level-synchronous tree walk over many questions for one document.
+
+    At each depth, questions that still need an LLM selection and face the
+    same candidate list are asked together, BATCH_QUESTIONS_PER_PROMPT per
+    prompt. Every question at depth 0 shares the root list, and at depth 1
+    questions that picked the same first-level nodes share again; tournament
+    rounds over wide levels are shared the same way. Answers start as soon as
+    a question's walk ends and are written as they finish. A failed LLM call
+    fails only the questions it was for: each gets an error record and the
+    rest of the batch carries on.
+    """
+
+    def __init__(self, compiled, output, use_cache, concurrency, per_prompt, tournament):
+        self.compiled = compiled
+        self.output = output
+        self.use_cache = use_cache
+        self.per_prompt = max(1, per_prompt)
+        self.tournament = tournament
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.started = time.perf_counter()
+        self.selection_calls = 0
+        self.failures = []
+
+    def _fail(self, state, error):
+        state.error = f"{type(error).__name__}: {error}"
+        state.current_ids = []
+        tracing.count("batch_question_failures_total")
+        record = {"index": state.index, "question": state.question, "error": state.error}
+        self._write(record)
+        self.failures.append(record)
+        return record
+
+    def _write(self, record):
+        self.output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.output.flush()
+
+    async def _select_alone(self, state, node_ids, depth):
+        async with self.semaphore:
+            self.selection_calls += 1
+            return await _aselect_nodes(
+                state.question,
+                node_ids,
+                self.compiled,
+                depth,
+                use_cache=self.use_cache,
+                tournament=self.tournament,
+            )
+
+    async def _select_one(self, state, node_ids, depth):
+        return [await self._select_alone(state, node_ids, depth)]
+
+    async def _select_group(self, states, node_ids, depth):
+        if len(states) == 1:
+            return [await self._select_alone(states[0], node_ids, depth)]
+
+        prompt = _batch_selection_prompt([state.question for state in states], node_ids, self.compiled)
+        async with self.semaphore:
+            self.selection_calls += 1
+            raw = await agenerate_text(prompt, temperature=0.1, use_cache=self.use_cache)
+        parsed = _parse_batch_selection(raw, len(states), self.compiled)
+
+        results = []
+        for number, state in enumerate(states, 1):
+            if number in parsed:
+                selected, reason, drill_down = parsed[number]
+                results.append((selected, reason, drill_down, "batch"))
+            else:
+                # The shared answer skipped this question; ask for it on its own.
+                tracing.count("batch_selection_retries_total")
+                results.append(await self._select_alone(state, node_ids, depth))
+        return results
+
+    def _group_jobs(self, groups, depth):
+        jobs = []
+        for node_ids, members in groups.items():
+            for i in range(0, len(members), self.per_prompt):
+                chunk = members[i : i + self.per_prompt]
+                jobs.append((chunk, self._select_group(chunk, list(node_ids), depth)))
+        return jobs
+
+    async def _shared_tournament(self, states, depth, failed):
+        """Tournament rounds shared across questions; returns each state's surviving candidates.
+
+        Questions facing the same candidate list see the same groups each round,
+        so every group is one prompt for all of them. A question whose group
+        prompt fails is recorded in ``failed`` and drops out.
+        """
+        batch_size = max(TREE_TOURNAMENT_BATCH_SIZE, TREE_SELECT_TOP_K + 1)
+        candidates = {state.index: list(state.current_ids) for state in states}
+        while True:
+            wide = [
+                state
+                for state in states
+                if state.index not in failed and len(candidates[state.index]) > batch_size
+            ]
+            if not wide:
+                return candidates
+            groups = {}
+            for state in wide:
+                ids = candidates[state.index]
+                for i in range(0, len(ids), batch_size):
+                    groups.setdefault(tuple(ids[i : i + batch_size]), []).append(state)
+            jobs = self._group_jobs(groups, depth)
+            results = await asyncio.gather(*(job for _members, job in jobs), return_exceptions=True)
+
+            winners = {state.index: [] for state in wide}
+            for (members, _job), outcome in zip(jobs, results):
+                if isinstance(outcome, Exception):
+                    failed.update((state.index, outcome) for state in members)
+                    continue
+                for state, (selected, reason, _drill_down, _method) in zip(members, outcome):
+                    if reason == "fallback":
+                        continue
+                    kept = winners[state.index]
+                    kept.extend(sid for sid in selected[:TREE_SELECT_TOP_K] if sid not in kept)
+            for state in wide:
+                if state.index in failed:
+                    continue
+                # Keep the winners in tree order so questions that agree keep sharing groups.
+                kept = set(winners[state.index])
+                reduced = [sid for sid in candidates[state.index] if sid in kept]
+                candidates[state.index] = reduced or candidates[state.index][:batch_size]
+
+    async def _step(self, states, depth):
+        """Decide one level for every state; returns the states that drill further down."""
+        step_started = time.perf_counter()
+        decisions = {}
+        shared = []
+        alone = []
+        wide = []
+        for state in states:
+            ordered, winner, top_score = _lexical_step(state.current_ids, state.lexical_scores, self.compiled)
+            if winner is not None:
+                reason = f"lexical match (score {top_score:.2f})"
+                decisions[state.index] = ([winner], reason, bool(self.compiled.children(winner)), "lexical")
+            elif self.tournament and len(state.current_ids) > TREE_TOURNAMENT_BATCH_SIZE:
+                wide.append(state)
+            elif not self.tournament and len(state.current_ids) > TREE_MAX_NODES_PER_STEP:
+                # Truncated to the top of each question's own lexical order, so nothing to share.
+                alone.append((state, ordered[:TREE_MAX_NODES_PER_STEP]))
+            else:
+                shared.append((state, state.current_ids))
+
+        failed = {}
+        reduced = await self._shared_tournament(wide, depth, failed) if wide else {}
+        shared.extend((state, reduced[state.index]) for state in wide if state.index not in failed)
+
+        groups = {}
+        for state, node_ids in shared:
+            groups.setdefault(tuple(node_ids), []).append(state)
+        jobs = self._group_jobs(groups, depth)
+        for state, ordered in alone:
+            jobs.append(([state], self._select_one(state, ordered, depth)))
+
+        results = await asyncio.gather(*(job for _members, job in jobs), return_exceptions=True)
+        for (members, _job), outcome in zip(jobs, results):
+            if isinstance(outcome, Exception):
+                failed.update((state.index, outcome) for state in members)
+                continue
+            for state, decision in zip(members, outcome):
+                decisions[state.index] = decision
+        for state in wide:
+            if state.index in failed:
+                continue
+            selected, reason, drill_down, method = decisions[state.index]
+            if method != "fallback":
+                decisions[state.index] = (selected, reason, drill_down, "tournament")
+
+        elapsed_ms = _elapsed_ms(step_started)
+        drilling = []
+        for state in states:
+            if state.index in failed:
+                self._fail(state, failed[state.index])
+                continue
+            selected, reason, drill_down, method = decisions[state.index]
+            state.selected_ids = selected
+            state.traversal.append(
+                {
+                    "depth": depth,
+                    "selected": selected,
+                    "reason": reason,
+                    "method": method,
+                    "elapsed_ms": elapsed_ms,
+                }
+            )
+            next_ids = []
+            if drill_down:
+                for node_id in selected:
+                    next_ids.extend(self.compiled.children(node_id))
+            state.current_ids = next_ids
+            if next_ids and depth + 1 < TREE_MAX_DEPTH:
+                drilling.append(state)
+            else:
+                state.selection_ms = _elapsed_ms(self.started)
+        return drilling
+
+    async def _answer(self, state):
+        answer_started = time.perf_counter()
+        try:
+            contexts = _collect_context(state.question, state.selected_ids, self.compiled)
+            async with self.semaphore:
+                answer = await _aanswer_with_reasons(state.question, contexts, use_cache=self.use_cache)
+        except Exception as e:
+            return self._fail(state, e)
+        record = {
+            "index": state.index,
+            "question": state.question,
+            "answer": answer,
+            "selected_nodes": [ctx["node_id"] for ctx in contexts],
+            "traversal": state.traversal,
+            "selection_ms": state.selection_ms,
+            "answer_ms": _elapsed_ms(answer_started),
+            "total_ms": _elapsed_ms(self.started),
+        }
+        self._write(record)
+        return record
+
+    async def run(self, states):
+        answers = []
+        active = [state for state in states if state.current_ids]
+        for state in states:
+            if not state.current_ids:
+                state.selection_ms = 0.0
+                answers.append(asyncio.ensure_future(self._answer(state)))
+
+        for depth in range(TREE_MAX_DEPTH):
+            if not active:
+                break
+            still_active = set(id(state) for state in await self._step(active, depth))
+            for state in active:
+                if id(state) not in still_active and state.error is None:
+                    answers.append(asyncio.ensure_future(self._answer(state)))
+            active = [state for state in active if id(state) in still_active]
+
+        return self.failures + [record for record in await asyncio.gather(*answers) if "error" not in record]
+
+
+async def aquery_batch(
+    questions,
+    tree,
+    output_path,
+    doc_id=None,
+    use_cache=True,
+    lexical=TREE_LEXICAL_ENABLED,
+    tournament=TREE_TOURNAMENT_ENABLED,
+    concurrency=BATCH_CONCURRENCY,
+    per_prompt=BATCH_QUESTIONS_PER_PROMPT,
+):
+    """Answer many questions against one tree, appending one JSON line per question as it completes.
+
+    Lines are written in completion order; each carries the question's ``index``
+    in ``questions``; a question whose LLM calls failed gets an
+    ``{"index", "question", "error"}`` line instead. Returns a summary with the
+    record and failure counts, selection calls and total time.
+    """
+    with tracing.start_trace("query_batch") as trace:
+        compiled = get_compiled_tree(tree, doc_id)
+        states = [_QuestionState(index, question, compiled, lexical) for index, question in enumerate(questions)]
+
+        if os.path.dirname(output_path):
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, "w", encoding="utf-8") as output:
+            batch = _BatchRun(compiled, output, use_cache, concurrency, per_prompt, tournament)
+            records = await batch.run(states)
+
+    return {
+        "questions": len(records),
+        "failed": sum(1 for record in records if "error" in record),
+        "selection_calls": batch.selection_calls,
+        "elapsed_ms": _elapsed_ms(batch.started),
+        "output_path": output_path,
+        "counters": trace.to_dict()["counters"],
+    }
+
+
+def query_batch(questions, tree, output_path, **kwargs):
+    return asyncio.run(aquery_batch(questions, tree, output_path, **kwargs))
@@ -1,42 +1,210 @@
-import math
-from collections import Counter
+import heapq
 import re
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import accumulate
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+")
+
 
 def tokenize(text):
-    text = text.lower()
-    return re.findall(r'\w+', text)
+    return _TOKEN_RE.findall(text.lower())
+
+
+class Vocabulary:
+    """Interns terms as dense integer ids, numbered in the order they were first seen."""
+
+    def __init__(self):
+        self.term_ids = {}
+
+    def __len__(self):
+        return len(self.term_ids)
+
+    def get(self, term):
+        return self.term_ids.get(term)
+
+    def add_all(self, tokens):
+        term_ids = self.term_ids
+        # len() is evaluated before setdefault inserts, so a new term gets the next id.
+        return [term_ids.setdefault(token, len(term_ids)) for token in tokens]
+
+    def terms(self):
+        return list(self.term_ids)
+
 
 class BM25:
-    def __init__(self, corpus, k1=1.5, b=0.75):
+    """BM25 over an iterable of token lists, kept as integer postings arrays.
+
+    Each document is mapped to term ids as it arrives and only the ids are
+    kept, so the caller can stream the corpus from a generator. Postings are
+    stored CSR-style: ``postings_offsets[t]:postings_offsets[t + 1]`` slices
+    ``postings_docs`` and ``postings_freqs`` for term id ``t``; ``idf`` and
+    ``max_scores`` are arrays indexed by term id.
+    """
+
+    def __init__(self, corpus, k1=1.5, b=0.75, vocabulary=None):
         self.k1 = k1
         self.b = b
-        self.corpus = corpus
-        self.doc_lengths = [len(doc) for doc in corpus]
-        self.avg_doc_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0
-        self.doc_freqs = []
-        self.idf = {}
-        self.doc_count = len(corpus)
-        
-        df = Counter()
+        self.vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+
+        token_ids = array("i")
+        doc_lengths = array("i")
         for doc in corpus:
-            self.doc_freqs.append(Counter(doc))
-            for word in set(doc):
-                df[word] += 1
-                
-        for word, count in df.items():
-            self.idf[word] = math.log(1 + (self.doc_count - count + 0.5) / (count + 0.5))
+            ids = self.vocabulary.add_all(doc)
+            token_ids.extend(ids)
+            doc_lengths.append(len(ids))
 
-    def get_scores(self, query):
-        scores = [0] * self.doc_count
+        self.doc_count = len(doc_lengths)
+        self.doc_lengths = np.array(doc_lengths, dtype=np.float64)
+        self.avg_doc_length = float(self.doc_lengths.mean()) if self.doc_count else 0
+
+        # One sort of (term, doc) keys yields every posting list, doc ids ascending, with its frequencies.
+        span = max(self.doc_count, 1)
+        keys = np.asarray(token_ids, dtype=np.int64)
+        del token_ids
+        keys *= span
+        keys += np.repeat(np.arange(self.doc_count, dtype=np.int64), np.asarray(doc_lengths, dtype=np.int64))
+        keys, freqs = np.unique(keys, return_counts=True)
+        terms = keys // span
+        keys %= span
+        self.postings_docs = keys.astype(np.int32)
+        self.postings_freqs = freqs.astype(np.int32)
+        del keys, freqs
+        df = np.bincount(terms, minlength=len(self.vocabulary))
+        self.postings_offsets = np.concatenate(([0], np.cumsum(df))).astype(np.int64)
+        self.idf = np.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+
+        self.length_norms = self._length_norms()
+        # Upper bound of each term's contribution to any single document, used to prune top_k
+        self.max_scores = np.zeros(len(df), dtype=np.float64)
+        present = df > 0
+        if present.any():
+            freqs = self.postings_freqs.astype(np.float64)
+            scores = self.idf[terms] * (freqs * (k1 + 1)) / (freqs + self.length_norms[self.postings_docs])
+            self.max_scores[present] = np.maximum.reduceat(scores, self.postings_offsets[:-1][present])
+
+    def _length_norms(self):
+        # k1 * (1 - b + b * |d| / avgdl), the per-document part of the BM25 denominator
+        if not self.avg_doc_length:
+            return np.zeros(self.doc_count, dtype=np.float64)
+        return self.k1 * (1 - self.b + self.b * self.doc_lengths / self.avg_doc_length)
+
+    def _postings(self, word):
+        term_id = self.vocabulary.get(word)
+        if term_id is None:
+            return None
+        start, end = self.postings_offsets[term_id : term_id + 2].tolist()
+        if start == end:
+            return None
+        return self.postings_docs[start:end], self.postings_freqs[start:end].astype(np.float64)
+
+    def _idf(self, word):
+        return float(self.idf[self.vocabulary.get(word)])
+
+    def _term_scores(self, word):
+        postings = self._postings(word)
+        if postings is None:
+            return None
+        ids, freqs = postings
+        scores = self._idf(word) * (freqs * (self.k1 + 1)) / (freqs + self.length_norms[ids])
+        return ids, scores
+
+    def _max_score(self, word):
+        term_id = self.vocabulary.get(word)
+        return 0.0 if term_id is None else float(self.max_scores[term_id])
+
+    def _score_array(self, query, cache=None):
+        scores = np.zeros(self.doc_count, dtype=np.float64)
         for word in query:
-            if word not in self.idf:
+            if cache is not None and word in cache:
+                term_scores = cache[word]
+            else:
+                term_scores = self._term_scores(word)
+                if cache is not None:
+                    cache[word] = term_scores
+            if term_scores is None:
                 continue
-            for i, doc in enumerate(self.corpus):
-                freq = self.doc_freqs[i][word]
-                if freq == 0:
-                    continue
-                score = self.idf[word] * (freq * (self.k1 + 1)) / (
-                    freq + self.k1 * (1 - self.b + self.b * self.doc_lengths[i] / self.avg_doc_length)
-                )
-                scores[i] += score
+            ids, contribution = term_scores
+            scores[ids] += contribution
         return scores
+
+    def get_scores(self, query):
+        return self._score_array(query).tolist()
+
+    def get_scores_batch(self, queries):
+        # Terms shared between queries are only scored once.
+        cache = {}
+        return [self._score_array(query, cache).tolist() for query in queries]
+
+    def top_k(self, query, k):
+        """Return the k best (doc index, score) pairs, best first, using MaxScore pruning."""
+        if k <= 0:
+            return []
+
+        terms = []
+        for word, weight in Counter(query).items():
+            term_scores = self._term_scores(word)
+            if term_scores is None:
+                continue
+            ids, scores = term_scores
+            terms.append((weight * self._max_score(word), ids.tolist(), (scores * weight).tolist()))
+        if not terms:
+            return []
+
+        # Sort by upper bound so the low-impact terms form the non-essential prefix.
+        terms.sort(key=lambda term: term[0])
+        bounds = [term[0] for term in terms]
+        postings = [term[1] for term in terms]
+        scores = [term[2] for term in terms]
+        prefix_bounds = list(accumulate(bounds))
+        cursors = [0] * len(terms)
+
+        heap = []
+        threshold = 0.0
+        first_essential = 0
+
+        while first_essential < len(terms):
+            doc = None
+            for i in range(first_essential, len(terms)):
+                if cursors[i] < len(postings[i]):
+                    candidate = postings[i][cursors[i]]
+                    if doc is None or candidate < doc:
+                        doc = candidate
+            if doc is None:
+                break
+
+            score = 0.0
+            for i in range(first_essential, len(terms)):
+                pos = cursors[i]
+                if pos < len(postings[i]) and postings[i][pos] == doc:
+                    score += scores[i][pos]
+                    cursors[i] = pos + 1
+
+            # Non-essential terms can only be looked up while the doc can still enter the top k.
+            for i in range(first_essential - 1, -1, -1):
+                if len(heap) == k and score + prefix_bounds[i] <= threshold:
+                    break
+                pos = bisect_left(postings[i], doc, cursors[i])
+                cursors[i] = pos
+                if pos < len(postings[i]) and postings[i][pos] == doc:
+                    score += scores[i][pos]
+                    cursors[i] = pos + 1
+
+            if len(heap) < k:
+                heapq.heappush(heap, (score, -doc))
+            elif score > threshold:
+                heapq.heapreplace(heap, (score, -doc))
+            else:
+                continue
+
+            if len(heap) == k:
+                threshold = heap[0][0]
+                while first_essential < len(terms) and prefix_bounds[first_essential] <= threshold:
+                    first_essential += 1
+
+        results = [(-neg_doc, score) for score, neg_doc in heap]
+        results.sort(key=lambda item: (-item[1], item[0]))
+        return results
@@ -1,24 +1,35 @@
 # scripts/build_index.py
 
-import json
-import pickle
 import os
-from scripts.bm25 import BM25, tokenize
-from config import INDEX_DIR
+from itertools import groupby
+from scripts.bm25 import tokenize
+from scripts.index_store import IndexWriter, file_sha256, open_index
+from scripts.parse_documents import iter_page_records, latest_chunks_path
+from config import BM25_INDEX_DIR, BM25_TOP_K
 
-def build_index(input_dir):
-    with open("chunks/chunked_docs.json", "r", encoding="utf-8") as f:
-        docs = json.load(f)
+def build_index(input_dir, chunks_path=None):
+    records = iter_page_records(chunks_path or latest_chunks_path())
 
-    corpus = [tokenize(doc["text"]) for doc in docs]
-    bm25 = BM25(corpus)
+    # Rebuild every segment from scratch; refresh_index handles incremental updates.
+    # Both parsers emit each file's pages contiguously, so only one file is held in memory.
+    writer = IndexWriter(BM25_INDEX_DIR, reset=True)
+    for fname, pages in groupby(records, key=lambda doc: doc["doc_id"]):
+        pages = list(pages)
+        doc_path = os.path.join(input_dir, fname)
+        if os.path.exists(doc_path):
+            writer.add_file(fname, pages, sha256=file_sha256(doc_path), stat=os.stat(doc_path))
+        else:
+            writer.add_file(fname, pages)
+    writer.commit()
 
-    os.makedirs(INDEX_DIR, exist_ok=True)
 
-    # Save the index and documents
-    with open(os.path.join(INDEX_DIR, "bm25_index.pkl"), "wb") as f:
-        pickle.dump(bm25, f)
+def load_index(index_dir=BM25_INDEX_DIR, eager=False):
+    return open_index(index_dir, eager=eager)
 
-    with open(os.path.join(INDEX_DIR, "docs.pkl"), "wb") as f:
-        pickle.dump(docs, f)
 
+def search_index(query, bm25, docs, k=BM25_TOP_K):
+    results = []
+    for index, score in bm25.top_k(tokenize(query), k):
+        doc = docs[index]
+        results.append((doc["doc_id"], doc["page_num"], score))
+    return results
@@ -0,0 +1,228 @@
+# scripts/compiled_tree.py
+
+import threading
+from array import array
+from collections import OrderedDict
+
+import tracing
+from scripts.bm25 import BM25, tokenize
+from scripts.context_packer import split_passages
+from config import TREE_OUTLINE_SUMMARY_CHARS, TREE_STORE_MAX_LOADED
+
+
+def _get_page_range(node):
+    start = node.get("start_index") or node.get("page_index")
+    end = node.get("end_index") or node.get("page_index")
+    if start is None and "page" in node:
+        start = node.get("page")
+        end = node.get("page")
+    return start, end
+
+
+def _shorten_text(text, limit):
+    if not text:
+        return ""
+    text = text.strip()
+    if len(text) <= limit:
+        return text
+    return text[:limit].rstrip() + "..."
+
+
+def _node_summary(node):
+    return (
+        node.get("summary")
+        or node.get("node_summary")
+        or _shorten_text(node.get("text") or "", 400)
+    )
+
+
+def _normalize_node_id(node_id, fallback):
+    if node_id is None or str(node_id).strip() == "":
+        return fallback
+    return str(node_id)
+
+
+class TreeNode:
+    """Read-only view of one PageIndex node with its prompt strings precomputed."""
+
+    __slots__ = (
+        "index",
+        "node_id",
+        "title",
+        "start_page",
+        "end_page",
+        "summary",
+        "text",
+        "candidate_line",
+        "depth",
+    )
+
+    def __init__(self, index, node_id, node, depth):
+        self.index = index
+        self.node_id = node_id
+        self.title = node.get("title", "")
+        self.start_page, self.end_page = _get_page_range(node)
+        self.summary = _node_summary(node)
+        self.text = node.get("text") or ""
+        self.depth = depth
+        if self.start_page is not None and self.end_page is not None:
+            page_part = f"pages {self.start_page}-{self.end_page}"
+        else:
+            page_part = "pages unknown"
+        self.candidate_line = (
+            f"- id: {node_id}; title: {self.title}; {page_part}; summary: {self.summary}"
+        )
+
+
+class CompiledTree:
+    """Flattened PageIndex tree, built once and shared read-only between queries.
+
+    Nodes are stored in pre-order. ``parents`` holds each node's parent index
+    (-1 for roots) and the children of node ``i`` are
+    ``child_index[child_offsets[i]:child_offsets[i + 1]]``. The source tree
+    dicts are never modified.
+    """
+
+    def __init__(self, tree, doc_id=None):
+        self.doc_id = doc_id
+        self.source = tree
+        self.nodes = []
+        self.node_map = {}
+        self.parents = array("i")
+        self.root_ids = []
+
+        children_lists = []
+
+        def walk(nodes, path_prefix, parent, depth):
+            for idx, node in enumerate(nodes):
+                node_id = _normalize_node_id(node.get("node_id"), f"node-{path_prefix}-{idx}")
+                record = TreeNode(len(self.nodes), node_id, node, depth)
+                self.nodes.append(record)
+                self.node_map[node_id] = record
+                self.parents.append(parent)
+                children_lists.append([])
+                if parent >= 0:
+                    children_lists[parent].append(record.index)
+                else:
+                    self.root_ids.append(node_id)
+                walk(node.get("nodes") or [], f"{path_prefix}-{idx}", record.index, depth + 1)
+
+        walk(tree, "root", -1, 0)
+
+        self.child_offsets = array("i", [0])
+        self.child_index = array("i")
+        for children in children_lists:
+            self.child_index.extend(children)
+            self.child_offsets.append(len(self.child_index))
+
+        self._children_ids = {}
+        for record in self.nodes:
+            start, end = self.child_offsets[record.index], self.child_offsets[record.index + 1]
+            self._children_ids[record.node_id] = tuple(
+                self.nodes[i].node_id for i in self.child_index[start:end]
+            )
+
+        self._lexical = None
+        self._outline = None
+        self._passages = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node_id):
+        return node_id in self.node_map
+
+    def node(self, node_id):
+        return self.node_map[node_id]
+
+    def children(self, node_id):
+        return self._children_ids.get(node_id, ())
+
+    def descendants(self, node_id):
+        record = self.node_map[node_id]
+        pending = list(self.child_index[self.child_offsets[record.index] : self.child_offsets[record.index + 1]])
+        result = []
+        while pending:
+            index = pending.pop()
+            result.append(index)
+            pending.extend(self.child_index[self.child_offsets[index] : self.child_offsets[index + 1]])
+        return [self.nodes[index] for index in sorted(result)]
+
+    def passages(self, node_id):
+        """A node's text (or summary) split into passages on first use."""
+        passages = self._passages.get(node_id)
+        if passages is None:
+            record = self.node_map[node_id]
+            passages = tuple(split_passages(record.text or record.summary))
+            self._passages[node_id] = passages
+        return passages
+
+    def outline(self):
+        """Indented one-line-per-node outline (id, title, pages, short summary), built on first use."""
+        if self._outline is None:
+            lines = []
+            for record in self.nodes:
+                if record.start_page is None or record.end_page is None:
+                    page_part = "p?"
+                elif str(record.start_page) == str(record.end_page):
+                    page_part = f"p{record.start_page}"
+                else:
+                    page_part = f"p{record.start_page}-{record.end_page}"
+                # Node summaries often repeat the title as a markdown heading; keep only the rest.
+                summary = " ".join(record.summary.split()).lstrip("# ")
+                if summary.lower().startswith(record.title.lower()):
+                    summary = summary[len(record.title) :].strip()
+                line = f"{'  ' * record.depth}{record.node_id} | {record.title} | {page_part}"
+                if summary:
+                    line += f" | {_shorten_text(summary, TREE_OUTLINE_SUMMARY_CHARS)}"
+                lines.append(line)
+            self._outline = "\n".join(lines)
+        return self._outline
+
+    def _lexical_tokens(self):
+        for record in self.nodes:
+            parts = [record.title, record.summary, record.text]
+            # Descendant titles let broad sections match terms only their subsections mention.
+            parts.extend(child.title for child in self.descendants(record.node_id))
+            yield tokenize(" ".join(parts))
+
+    def lexical_index(self):
+        """BM25 over each node's title, summary, text and descendant titles (built on first use)."""
+        if self._lexical is None:
+            with self._lock:
+                if self._lexical is None:
+                    with tracing.span("lexical_index.build", nodes=len(self.nodes)):
+                        self._lexical = BM25(self._lexical_tokens())
+        return self._lexical
+
+
+_compiled_trees = OrderedDict()
+_compiled_lock = threading.Lock()
+
+
+def get_compiled_tree(tree, doc_id=None):
+    """Return the compiled form of ``tree``, cached per doc_id until a new tree object replaces it.
+
+    Only the TREE_STORE_MAX_LOADED most recently used documents stay compiled.
+    """
+    if isinstance(tree, CompiledTree):
+        return tree
+    if doc_id is None:
+        with tracing.span("compile_tree"):
+            return CompiledTree(tree)
+
+    with _compiled_lock:
+        compiled = _compiled_trees.get(doc_id)
+        if compiled is not None and compiled.source is tree:
+            _compiled_trees.move_to_end(doc_id)
+            return compiled
+
+    with tracing.span("compile_tree", doc_id=doc_id):
+        compiled = CompiledTree(tree, doc_id)
+    with _compiled_lock:
+        _compiled_trees[doc_id] = compiled
+        _compiled_trees.move_to_end(doc_id)
+        while len(_compiled_trees) > TREE_STORE_MAX_LOADED:
+            _compiled_trees.popitem(last=False)
+    return compiled
@@ -0,0 +1,169 @@
+# scripts/context_packer.py
+
+import re
+
+import tracing
+from token_count import CHARS_PER_TOKEN, estimate_tokens
+from scripts.bm25 import BM25, tokenize
+from config import CONTEXT_PASSAGE_MAX_TOKENS, CONTEXT_TOKEN_BUDGET
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.;:!?])\s+")
+_GAP = " ... "
+
+
+def _split_long(text, max_tokens):
+    # Groups whole sentences up to max_tokens; a sentence longer than that is cut on word boundaries.
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    pieces = []
+    for sentence in _SENTENCE_RE.split(text):
+        current = ""
+        for word in sentence.split():
+            if current and len(current) + 1 + len(word) > max_chars:
+                pieces.append(current)
+                current = word
+            else:
+                current = f"{current} {word}" if current else word
+        if current:
+            pieces.append(current)
+
+    passages = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            passages.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        passages.append(current)
+    return passages
+
+
+def split_passages(text, max_tokens=CONTEXT_PASSAGE_MAX_TOKENS):
+    """Split node text into paragraph-sized passages of at most ``max_tokens`` (estimated) tokens.
+
+    A markdown heading on a line of its own is joined to the paragraph that
+    follows it, so a clause keeps its heading.
+    """
+    passages = []
+    heading = ""
+    for paragraph in _PARAGRAPH_RE.split(text or ""):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if paragraph.startswith("#") and "\n" not in paragraph:
+            heading = f"{heading} {paragraph}".strip()
+            continue
+        if heading:
+            paragraph = f"{heading} {paragraph}"
+            heading = ""
+        passages.extend(_split_long(" ".join(paragraph.split()), max_tokens))
+    if heading:
+        passages.extend(_split_long(heading, max_tokens))
+    return passages
+
+
+def _header(record):
+    # Mirrors the per-node prefix of the answer prompt, so its tokens count against the budget.
+    return f"Node {record.node_id} ({record.title}, pages {record.start_page}-{record.end_page}): "
+
+
+def pack_contexts(question, selected_ids, compiled, budget=CONTEXT_TOKEN_BUDGET):
+    """Build answer contexts for ``selected_ids`` within ``budget`` estimated tokens.
+
+    Passages repeated across the selection (a parent and its own child, or
+    overlapping sections) are kept once, under the most specific node. The
+    remaining passages are ranked by BM25 against the question; each node
+    first gets its best passage, then the best of the rest fill the budget.
+    A node's chosen passages keep their original order, and the node keeps its
+    page range for citations. Nodes with no passage chosen are left out.
+    """
+    node_ids = list(dict.fromkeys(node_id for node_id in selected_ids if node_id in compiled))
+    records = [compiled.node(node_id) for node_id in node_ids]
+
+    # Deepest nodes claim shared passages first.
+    owner = {}
+    for position in sorted(range(len(records)), key=lambda i: -records[i].depth):
+        for text in compiled.passages(records[position].node_id):
+            owner.setdefault(text.lower(), position)
+
+    candidates = []
+    for position, record in enumerate(records):
+        for passage_index, text in enumerate(compiled.passages(record.node_id)):
+            if owner.get(text.lower()) == position:
+                owner[text.lower()] = None
+                candidates.append((position, passage_index, text))
+    if not candidates:
+        return []
+
+    scores = BM25(tokenize(text) for _position, _index, text in candidates).get_scores(tokenize(question))
+    ranked = sorted(
+        range(len(candidates)),
+        key=lambda i: (-scores[i], candidates[i][0], candidates[i][1]),
+    )
+
+    chosen = set()
+    used = 0
+    opened = set()
+
+    def try_add(i):
+        nonlocal used
+        position, _index, text = candidates[i]
+        cost = estimate_tokens(text + _GAP)
+        if position not in opened:
+            cost += estimate_tokens(_header(records[position]))
+        if used + cost > budget:
+            return False
+        used += cost
+        chosen.add(i)
+        opened.add(position)
+        return True
+
+    for i in ranked:
+        if candidates[i][0] not in opened:
+            try_add(i)
+    for i in ranked:
+        if i not in chosen:
+            try_add(i)
+
+    if not chosen:
+        # Budget smaller than any passage: cut the best one down to fit.
+        position, passage_index, text = candidates[ranked[0]]
+        room = max(0, budget - estimate_tokens(_header(records[position]))) * CHARS_PER_TOKEN
+        candidates[ranked[0]] = (position, passage_index, text[:room].rstrip() + "...")
+        chosen.add(ranked[0])
+        used = budget
+
+    by_node = {}
+    for i in sorted(chosen, key=lambda i: (candidates[i][0], candidates[i][1])):
+        by_node.setdefault(candidates[i][0], []).append(candidates[i])
+
+    contexts = []
+    for position, passages in by_node.items():
+        record = records[position]
+        parts = []
+        previous = None
+        for _position, passage_index, text in passages:
+            if previous is not None and passage_index != previous + 1:
+                parts.append(_GAP.strip())
+            parts.append(text)
+            previous = passage_index
+        contexts.append(
+            {
+                "node_id": record.node_id,
+                "title": record.title,
+                "start_page": record.start_page,
+                "end_page": record.end_page,
+                "context": " ".join(parts),
+            }
+        )
+
+    tracing.annotate(
+        budget=budget,
+        tokens=used,
+        passages=len(chosen),
+        candidates=len(candidates),
+        nodes=len(contexts),
+    )
+    return contexts
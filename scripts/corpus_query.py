@@ -0,0 +1,214 @@
+# scripts/corpus_query.py
+
+import asyncio
+import time
+
+import numpy as np
+
+import tracing
+from llm.router import agenerate_text
+from scripts.bm25 import tokenize
+from scripts.build_index import load_index
+from scripts.compiled_tree import get_compiled_tree
+from scripts.pageindex_query import (
+    _abranch_selection,
+    _collect_context,
+    _elapsed_ms,
+    _iter_selection,
+    _run_to_end,
+)
+from config import (
+    CONTEXT_TOKEN_BUDGET,
+    ROUTE_CANDIDATE_PAGES,
+    ROUTE_MIN_SCORE_RATIO,
+    ROUTE_TOP_DOCS,
+    TREE_BRANCH_FANOUT,
+    TREE_LEXICAL_ENABLED,
+    TREE_SPECULATIVE_PREFETCH,
+    TREE_TOURNAMENT_ENABLED,
+    TREE_TRAVERSAL_MODE,
+)
+
+
+def _route_with_pages(question, bm25, docs, names):
+    # Sum each file's own best pages, so a long document with many weak
+    # matches cannot push a short one out of a corpus-wide top list.
+    page_scores = np.asarray(bm25.get_scores(tokenize(question)))
+    scores = {}
+    for fname, start, stop in docs.page_ranges():
+        if fname not in names:
+            continue
+        best = np.sort(page_scores[start:stop])[-ROUTE_CANDIDATE_PAGES:]
+        total = float(best[best > 0].sum())
+        if total > 0:
+            scores[fname] = total
+    return scores
+
+
+def _route_with_trees(question, trees_cache, docs_cache):
+    # No page index yet: score each tree's best node instead.
+    query = tokenize(question)
+    scores = {}
+    for fname, doc_id in docs_cache.items():
+        tree = trees_cache.get(doc_id)
+        if not tree:
+            continue
+        best = max(get_compiled_tree(tree, doc_id).lexical_index().get_scores(query), default=0.0)
+        if best > 0:
+            scores[fname] = best
+    return scores
+
+
+def route_question(question, docs_cache, trees_cache, index=None, top_docs=ROUTE_TOP_DOCS):
+    """Rank indexed documents for ``question`` without any LLM call.
+
+    Uses the BM25 page index (``index`` is a (bm25, docs) pair from load_index,
+    opened on demand) and falls back to the trees' node text when it is missing,
+    was written in an older format or can no longer be read.
+    Returns [(filename, doc_id, score)], best first.
+    """
+    names = {fname for fname, doc_id in docs_cache.items() if doc_id in trees_cache}
+    scores = {}
+    with tracing.span("route") as attrs:
+        try:
+            bm25, docs = index or load_index()
+            scores = _route_with_pages(question, bm25, docs, names)
+            attrs["source"] = "pages"
+        except (OSError, ValueError) as e:
+            # Missing, out-of-date or since-replaced index: route on the trees instead.
+            attrs["index_error"] = str(e)
+        if not scores:
+            scores = _route_with_trees(question, trees_cache, docs_cache)
+            attrs["source"] = "trees"
+
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    if not ranked:
+        return []
+    cutoff = ranked[0][1] * ROUTE_MIN_SCORE_RATIO
+    return [
+        (fname, docs_cache[fname], score)
+        for fname, score in ranked[:top_docs]
+        if score >= cutoff
+    ]
+
+
+def _corpus_answer_prompt(question, contexts):
+    context_lines = []
+    for ctx in contexts:
+        page_info = "pages unknown"
+        if ctx["start_page"] is not None and ctx["end_page"] is not None:
+            page_info = f"pages {ctx['start_page']}-{ctx['end_page']}"
+        context_lines.append(
+            f"[{ctx['document']}] Node {ctx['node_id']} ({ctx['title']}, {page_info}): {ctx['context']}"
+        )
+
+    return f"""You are an insurance policy assistant comparing several policy documents.
+Use ONLY the context below. Each line starts with the document it comes from.
+Question: {question}
+
+Context:
+""" + "\n".join(context_lines) + """
+
+Provide a detailed answer with reasons, noting where the documents differ.
+Format:
+Answer: <final answer>
+Reasons:
+1) <reason with document, node title/page>
+2) <reason with document, node title/page>
+If the context is insufficient, say what is missing.
+"""
+
+
+async def _aselect_document(question, compiled, mode, use_cache, lexical, tournament):
+    started = time.perf_counter()
+    with tracing.span("select.document", doc_id=compiled.doc_id):
+        if mode == "branch":
+            selected_ids, traversal = await _abranch_selection(
+                question,
+                compiled,
+                lexical,
+                use_cache,
+                TREE_BRANCH_FANOUT,
+                TREE_SPECULATIVE_PREFETCH,
+                tournament,
+            )
+        else:
+            traversal = []
+            selected_ids = await asyncio.to_thread(
+                _run_to_end,
+                _iter_selection(question, compiled, mode, lexical, traversal, use_cache, tournament),
+            )
+    return selected_ids, traversal, _elapsed_ms(started)
+
+
+async def aquery_corpus(
+    question,
+    docs_cache,
+    trees_cache,
+    use_cache=True,
+    mode=TREE_TRAVERSAL_MODE,
+    top_docs=ROUTE_TOP_DOCS,
+    index=None,
+    lexical=TREE_LEXICAL_ENABLED,
+    tournament=TREE_TOURNAMENT_ENABLED,
+):
+    """Answer one question from the documents it routes to, traversing their trees concurrently."""
+    with tracing.start_trace("query_corpus") as trace:
+        started = time.perf_counter()
+        routed = route_question(question, docs_cache, trees_cache, index=index, top_docs=top_docs)
+        route_ms = _elapsed_ms(started)
+
+        compiled = [get_compiled_tree(trees_cache[doc_id], doc_id) for _fname, doc_id, _score in routed]
+        selections = await asyncio.gather(
+            *(
+                _aselect_document(question, tree, mode, use_cache, lexical, tournament)
+                for tree in compiled
+            )
+        )
+
+        # The answer prompt covers every routed document, so they share one context budget.
+        budget = CONTEXT_TOKEN_BUDGET // max(1, len(routed))
+        documents = []
+        contexts = []
+        for (fname, doc_id, score), tree, (selected_ids, traversal, selection_ms) in zip(
+            routed, compiled, selections
+        ):
+            doc_contexts = _collect_context(question, selected_ids, tree, budget)
+            for ctx in doc_contexts:
+                ctx["document"] = fname
+                ctx["doc_id"] = doc_id
+            contexts.extend(doc_contexts)
+            documents.append(
+                {
+                    "document": fname,
+                    "doc_id": doc_id,
+                    "route_score": score,
+                    "selected_nodes": doc_contexts,
+                    "traversal": traversal,
+                    "selection_ms": selection_ms,
+                }
+            )
+
+        selection_ms = _elapsed_ms(started) - route_ms
+
+        if documents:
+            with tracing.span("answer", contexts=len(contexts)):
+                answer = await agenerate_text(
+                    _corpus_answer_prompt(question, contexts), temperature=0.2, use_cache=use_cache
+                )
+        else:
+            answer = "No indexed document matches the question."
+
+    return {
+        "answer": answer,
+        "documents": documents,
+        "selected_nodes": contexts,
+        "mode": mode,
+        "route_ms": route_ms,
+        "selection_ms": round(selection_ms, 1),
+        "trace": trace.to_dict(),
+    }
+
+
+def query_corpus(question, docs_cache, trees_cache, **kwargs):
+    return asyncio.run(aquery_corpus(question, docs_cache, trees_cache, **kwargs))
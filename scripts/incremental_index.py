@@ -0,0 +1,72 @@
+# scripts/incremental_index.py
+
+import os
+
+from scripts.index_store import IndexWriter, file_sha256
+from scripts.parse_documents import parse_pdf
+from config import BM25_INDEX_DIR, DOCS_DIR
+
+
+def _unchanged(entry, stat):
+    return (
+        entry is not None
+        and entry.get("size") == stat.st_size
+        and entry.get("mtime_ns") == stat.st_mtime_ns
+    )
+
+
+def refresh_index(input_dir=DOCS_DIR, index_dir=BM25_INDEX_DIR, progress=None):
+    """Bring the BM25 index in line with input_dir, re-parsing only new or changed PDFs.
+
+    ``progress(done, total, fname)``, if given, is called before each PDF is checked.
+    """
+    writer = IndexWriter(index_dir)
+    indexed = writer.files()
+
+    current = {}
+    for fname in sorted(os.listdir(input_dir)):
+        if fname.endswith(".pdf"):
+            current[fname] = os.path.join(input_dir, fname)
+
+    summary = {"added": [], "updated": [], "removed": [], "unchanged": [], "failed": []}
+    dirty = False
+
+    for fname in indexed:
+        if fname not in current:
+            writer.remove_file(fname)
+            summary["removed"].append(fname)
+            dirty = True
+
+    for done, (fname, doc_path) in enumerate(current.items()):
+        if progress is not None:
+            progress(done, len(current), fname)
+        entry = indexed.get(fname)
+        stat = os.stat(doc_path)
+        # Size and mtime match: skip hashing entirely.
+        if _unchanged(entry, stat):
+            summary["unchanged"].append(fname)
+            continue
+
+        sha256 = file_sha256(doc_path)
+        if entry is not None and entry.get("sha256") == sha256:
+            entry["size"] = stat.st_size
+            entry["mtime_ns"] = stat.st_mtime_ns
+            summary["unchanged"].append(fname)
+            dirty = True
+            continue
+
+        dirty = True
+        try:
+            pages = parse_pdf(doc_path, fname)
+        except Exception as e:
+            print(f"Error reading {fname}: {e}")
+            writer.remove_file(fname)
+            summary["failed"].append(fname)
+            continue
+
+        writer.add_file(fname, pages, sha256=sha256, stat=stat)
+        summary["updated" if entry is not None else "added"].append(fname)
+
+    if dirty:
+        writer.commit()
+    return summary
@@ -0,0 +1,167 @@
+# scripts/index_service.py
+
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+
+import tracing
+from scripts.build_index import load_index
+from scripts.incremental_index import refresh_index
+from scripts.pageindex_index import build_pageindex_trees, load_pageindex_trees
+from config import DOCS_DIR, INDEX_JOB_HISTORY
+
+
+class IndexSnapshot:
+    """One version of the indexes; queries hold on to it for their whole run."""
+
+    __slots__ = ("version", "docs_cache", "trees", "bm25_index", "loaded_at")
+
+    def __init__(self, version, docs_cache, trees, bm25_index):
+        self.version = version
+        self.docs_cache = docs_cache
+        self.trees = trees
+        self.bm25_index = bm25_index
+        self.loaded_at = time.time()
+
+
+def _open_bm25():
+    # Mapped up front: a later refresh may delete the segments this snapshot reads.
+    try:
+        return load_index(eager=True)
+    except FileNotFoundError:
+        return None
+
+
+def _open_trees():
+    docs_cache, trees = load_pageindex_trees()
+    return dict(docs_cache), trees.snapshot()
+
+
+def _load_snapshot(version):
+    docs_cache, trees = _open_trees()
+    return IndexSnapshot(version, docs_cache, trees, _open_bm25())
+
+
+class IndexService:
+    """Shares one index snapshot across a process and rebuilds it on a worker thread.
+
+    Refresh jobs (re-parse changed PDFs into the BM25 index, then fetch missing
+    PageIndex trees) run one at a time in the background. A refresh requested
+    while another is still queued joins it. A finished job publishes a new
+    snapshot with a single assignment; queries that already hold the previous
+    snapshot keep using it.
+    """
+
+    def __init__(self, docs_dir=DOCS_DIR, history=INDEX_JOB_HISTORY):
+        self.docs_dir = docs_dir
+        self._snapshot = None
+        self._jobs = deque(maxlen=history)
+        self._ids = itertools.count(1)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def snapshot(self):
+        if self._snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = _load_snapshot(1)
+        return self._snapshot
+
+    def jobs(self):
+        """Copies of the recent jobs, newest first."""
+        with self._lock:
+            return [dict(job) for job in reversed(self._jobs)]
+
+    def latest_job(self):
+        jobs = self.jobs()
+        return jobs[0] if jobs else None
+
+    def submit_refresh(self, reason="manual"):
+        """Queue a refresh and return its job id (an already queued job's id, if any)."""
+        with self._lock:
+            for job in self._jobs:
+                if job["state"] == "queued":
+                    return job["id"]
+            job = {
+                "id": next(self._ids),
+                "reason": reason,
+                "state": "queued",
+                "stage": None,
+                "done": 0,
+                "total": 0,
+                "detail": "",
+                "queued_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "summary": None,
+                "error": None,
+                "version": None,
+            }
+            self._jobs.append(job)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._work, name="index-worker", daemon=True)
+                self._worker.start()
+        self._queue.put(job)
+        return job["id"]
+
+    def _update(self, job, **fields):
+        with self._lock:
+            job.update(fields)
+
+    def _progress(self, job):
+        def report(done, total, detail):
+            self._update(job, done=done, total=total, detail=detail or "")
+
+        return report
+
+    def _work(self):
+        while True:
+            self._run(self._queue.get())
+
+    def _publish(self, docs_cache=None, trees=None, bm25_index=None):
+        # Only the worker thread publishes, so reading the current snapshot needs no lock.
+        current = self.snapshot()
+        self._snapshot = IndexSnapshot(
+            current.version + 1,
+            current.docs_cache if docs_cache is None else docs_cache,
+            current.trees if trees is None else trees,
+            current.bm25_index if bm25_index is None else bm25_index,
+        )
+        return self._snapshot.version
+
+    def _run(self, job):
+        self._update(job, state="running", stage="parse", started_at=time.time())
+        summary = None
+        try:
+            with tracing.start_trace("index_refresh"):
+                summary = refresh_index(self.docs_dir, progress=self._progress(job))
+                if any(summary[key] for key in ("added", "updated", "removed", "failed")):
+                    self._update(job, version=self._publish(bm25_index=_open_bm25()))
+                self._update(job, stage="pageindex", done=0, total=0, detail="")
+                build_pageindex_trees(docs_dir=self.docs_dir, progress=self._progress(job))
+                self._update(job, stage="load", done=0, total=0, detail="")
+                docs_cache, trees = _open_trees()
+                version = self._publish(docs_cache=docs_cache, trees=trees)
+        except Exception as e:
+            tracing.count("index_refresh_total", status="failed")
+            self._update(
+                job,
+                state="failed",
+                summary=summary,
+                error=f"{type(e).__name__}: {e}",
+                finished_at=time.time(),
+            )
+            return
+
+        tracing.count("index_refresh_total", status="done")
+        self._update(
+            job,
+            state="done",
+            stage=None,
+            summary=summary,
+            version=version,
+            finished_at=time.time(),
+        )
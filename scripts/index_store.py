@@ -0,0 +1,418 @@
+# scripts/index_store.py
+
+import hashlib
+import json
+import math
+import mmap
+import os
+import shutil
+from bisect import bisect_right
+from collections import Counter
+
+import numpy as np
+
+from scripts.bm25 import BM25, tokenize
+from config import BM25_INDEX_DIR, BM25_RETAINED_GENERATIONS
+
+# Bump whenever the on-disk layout changes; readers refuse other versions.
+FORMAT_VERSION = 2
+MANIFEST_FILE = "manifest.json"
+# Indexes written before generations were tracked keep df here.
+DF_FILE = "df.json"
+SEGMENTS_DIR = "segments"
+DEFAULT_K1 = 1.5
+DEFAULT_B = 0.75
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _pages_sha256(pages):
+    digest = hashlib.sha256()
+    for page in pages:
+        digest.update(f"{page['page_num']}\0{page['text']}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _save_array(index_dir, name, values, dtype):
+    np.save(os.path.join(index_dir, f"{name}.npy"), np.asarray(values, dtype=dtype))
+
+
+def _write_blob(index_dir, name, texts):
+    offsets = [0]
+    with open(os.path.join(index_dir, f"{name}.bin"), "wb") as f:
+        for text in texts:
+            data = text.encode("utf-8")
+            f.write(data)
+            offsets.append(offsets[-1] + len(data))
+    _save_array(index_dir, f"{name}_offsets", offsets, np.int64)
+
+
+def _concat(arrays, dtype):
+    if not arrays:
+        return np.zeros(0, dtype=dtype)
+    return np.concatenate(arrays).astype(dtype, copy=False)
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _replace_dir(tmp_dir, target_dir):
+    # Readers that already mapped the old files keep working until they reopen.
+    old_dir = f"{target_dir}.old-{os.getpid()}"
+    if os.path.exists(target_dir):
+        os.replace(target_dir, old_dir)
+    os.replace(tmp_dir, target_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _write_segment(segment_dir, pages):
+    """Write one file's pages as a self-contained postings segment with local doc ids."""
+    tmp_dir = f"{segment_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    bm25 = BM25(tokenize(page["text"]) for page in pages)
+    # Segments keep their terms sorted for binary search, so renumber the build's ids in term order.
+    terms = bm25.vocabulary.terms()
+    order = sorted(range(len(terms)), key=terms.__getitem__)
+    _write_blob(tmp_dir, "terms", (terms[term_id] for term_id in order))
+
+    counts = np.diff(bm25.postings_offsets)[order]
+    postings_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+    # Position of every posting of the sorted terms within the build's postings arrays.
+    starts = bm25.postings_offsets[:-1][order]
+    positions = np.arange(postings_offsets[-1]) + np.repeat(starts - postings_offsets[:-1], counts)
+    _save_array(tmp_dir, "postings_offsets", postings_offsets, np.int64)
+    _save_array(tmp_dir, "postings_docs", bm25.postings_docs[positions], np.int32)
+    _save_array(tmp_dir, "postings_freqs", bm25.postings_freqs[positions], np.int32)
+
+    _save_array(tmp_dir, "doc_lengths", bm25.doc_lengths, np.int32)
+    _save_array(tmp_dir, "page_nums", [page["page_num"] for page in pages], np.int32)
+    _write_blob(tmp_dir, "text", (page["text"] for page in pages))
+
+    _replace_dir(tmp_dir, segment_dir)
+    return {
+        "page_count": len(pages),
+        "total_length": int(bm25.doc_lengths.sum()),
+        "num_terms": len(terms),
+    }
+
+
+class _MappedFiles:
+    """Opens index arrays and blobs on first use and keeps them memory-mapped."""
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self._arrays = {}
+        self._blobs = {}
+
+    def array(self, name):
+        if name not in self._arrays:
+            path = os.path.join(self.index_dir, f"{name}.npy")
+            self._arrays[name] = np.load(path, mmap_mode="r", allow_pickle=False)
+        return self._arrays[name]
+
+    def blob(self, name):
+        if name not in self._blobs:
+            path = os.path.join(self.index_dir, f"{name}.bin")
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    self._blobs[name] = b""
+                else:
+                    self._blobs[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._blobs[name]
+
+    def open_all(self):
+        """Map every file now; a mapped file stays readable after the directory is replaced or deleted."""
+        for file_name in os.listdir(self.index_dir):
+            name, extension = os.path.splitext(file_name)
+            if extension == ".npy":
+                self.array(name)
+            elif extension == ".bin":
+                self.blob(name)
+
+    def blob_item(self, name, index):
+        offsets = self.array(f"{name}_offsets")
+        return self.blob(name)[int(offsets[index]) : int(offsets[index + 1])]
+
+
+class _Segment:
+    def __init__(self, index_dir, entry, base):
+        self.files = _MappedFiles(os.path.join(index_dir, SEGMENTS_DIR, entry["segment"]))
+        self.source = entry["name"]
+        self.base = base
+        self.page_count = entry["page_count"]
+        self.num_terms = entry["num_terms"]
+        self._term_ids = {}
+
+    def term_id(self, word):
+        if word in self._term_ids:
+            return self._term_ids[word]
+
+        key = word.encode("utf-8")
+        lo, hi = 0, self.num_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.files.blob_item("terms", mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        term_id = None
+        if lo < self.num_terms and self.files.blob_item("terms", lo) == key:
+            term_id = lo
+        self._term_ids[word] = term_id
+        return term_id
+
+    def term_df(self):
+        offsets = np.diff(self.files.array("postings_offsets"))
+        for term_id in range(self.num_terms):
+            yield self.files.blob_item("terms", term_id).decode("utf-8"), int(offsets[term_id])
+
+
+def _load_manifest(index_dir):
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    version = manifest.get("format_version")
+    if version != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported BM25 index format version {version} in {index_dir} "
+            f"(expected {FORMAT_VERSION}). Please rebuild the index."
+        )
+    return manifest
+
+
+class IndexWriter:
+    """Adds, replaces and removes per-file segments, keeping global BM25 statistics as deltas."""
+
+    def __init__(self, index_dir=BM25_INDEX_DIR, reset=False, k1=DEFAULT_K1, b=DEFAULT_B):
+        self.index_dir = index_dir
+        manifest = None if reset else _load_manifest(index_dir)
+        if manifest is None:
+            manifest = {
+                "format_version": FORMAT_VERSION,
+                "k1": k1,
+                "b": b,
+                "doc_count": 0,
+                "total_length": 0,
+                "files": [],
+            }
+            self.df = Counter()
+        else:
+            with open(os.path.join(index_dir, manifest.get("df_file", DF_FILE)), "r", encoding="utf-8") as f:
+                self.df = Counter(json.load(f))
+        self.manifest = manifest
+
+    def files(self):
+        return {entry["name"]: entry for entry in self.manifest["files"]}
+
+    def _apply_df(self, entry, sign):
+        segment = _Segment(self.index_dir, entry, 0)
+        for term, count in segment.term_df():
+            self.df[term] += sign * count
+            if self.df[term] <= 0:
+                del self.df[term]
+        self.manifest["doc_count"] += sign * entry["page_count"]
+        self.manifest["total_length"] += sign * entry["total_length"]
+
+    def remove_file(self, name):
+        entries = self.manifest["files"]
+        for position, entry in enumerate(entries):
+            if entry["name"] == name:
+                self._apply_df(entry, -1)
+                del entries[position]
+                return True
+        return False
+
+    def add_file(self, name, pages, sha256=None, stat=None):
+        self.remove_file(name)
+        pages = list(pages)
+        segment = sha256 or _pages_sha256(pages)
+        os.makedirs(os.path.join(self.index_dir, SEGMENTS_DIR), exist_ok=True)
+        segment_dir = os.path.join(self.index_dir, SEGMENTS_DIR, segment)
+
+        entry = {"name": name, "sha256": sha256, "segment": segment}
+        if stat is not None:
+            entry["size"] = stat.st_size
+            entry["mtime_ns"] = stat.st_mtime_ns
+        # Identical content already indexed (under another name, or by a retained generation) reuses its segment.
+        known = self.manifest["files"] + [e for kept in self.manifest.get("retained", []) for e in kept["files"]]
+        shared = next((e for e in known if e["segment"] == segment), None)
+        if shared is not None and os.path.isdir(segment_dir):
+            entry.update({key: shared[key] for key in ("page_count", "total_length", "num_terms")})
+        else:
+            entry.update(_write_segment(segment_dir, pages))
+
+        self.manifest["files"].append(entry)
+        self._apply_df(entry, 1)
+        return entry
+
+    def _retained(self):
+        """Generations kept readable after this commit: the one on disk and those it retained."""
+        try:
+            previous = _load_manifest(self.index_dir)
+        except ValueError:
+            previous = None
+        if previous is None:
+            return 0, []
+        retained = [{"df_file": previous.get("df_file", DF_FILE), "files": previous["files"]}]
+        retained.extend(previous.get("retained", []))
+        return previous.get("generation", 0), retained[:BM25_RETAINED_GENERATIONS]
+
+    def commit(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        generation, retained = self._retained()
+        generation += 1
+        self.manifest["generation"] = generation
+        self.manifest["df_file"] = f"df-{generation}.json"
+        self.manifest["retained"] = retained
+        _write_json_atomic(os.path.join(self.index_dir, self.manifest["df_file"]), dict(self.df))
+        _write_json_atomic(os.path.join(self.index_dir, MANIFEST_FILE), self.manifest)
+
+        # Drop segments and df files that neither this generation nor a retained one references.
+        generations = [self.manifest] + retained
+        live_segments = {entry["segment"] for kept in generations for entry in kept["files"]}
+        live_df = {kept["df_file"] for kept in generations}
+        for name in os.listdir(self.index_dir):
+            if name.startswith("df") and name.endswith(".json") and name not in live_df:
+                os.remove(os.path.join(self.index_dir, name))
+        segments_dir = os.path.join(self.index_dir, SEGMENTS_DIR)
+        if os.path.isdir(segments_dir):
+            for segment in os.listdir(segments_dir):
+                if segment not in live_segments:
+                    shutil.rmtree(os.path.join(segments_dir, segment), ignore_errors=True)
+
+
+class MappedBM25(BM25):
+    """BM25 scorer over memory-mapped segments, with collection-wide idf and average length."""
+
+    def __init__(self, index_dir, manifest, segments):
+        self.index_dir = index_dir
+        self.df_path = os.path.join(index_dir, manifest.get("df_file", DF_FILE))
+        self.k1 = manifest["k1"]
+        self.b = manifest["b"]
+        self.doc_count = manifest["doc_count"]
+        self.avg_doc_length = manifest["total_length"] / self.doc_count if self.doc_count else 0
+        self.segments = segments
+        self._df = None
+        self._doc_lengths = None
+        self._length_norms = None
+        self._max_score_cache = {}
+
+    @property
+    def df(self):
+        if self._df is None:
+            with open(self.df_path, "r", encoding="utf-8") as f:
+                self._df = json.load(f)
+        return self._df
+
+    @property
+    def doc_lengths(self):
+        if self._doc_lengths is None:
+            lengths = [segment.files.array("doc_lengths") for segment in self.segments]
+            self._doc_lengths = _concat(lengths, np.float64)
+        return self._doc_lengths
+
+    @property
+    def length_norms(self):
+        if self._length_norms is None:
+            self._length_norms = self._length_norms_for(self.doc_lengths)
+        return self._length_norms
+
+    def _length_norms_for(self, doc_lengths):
+        if not self.avg_doc_length:
+            return np.zeros(len(doc_lengths), dtype=np.float64)
+        return self.k1 * (1 - self.b + self.b * doc_lengths / self.avg_doc_length)
+
+    def _postings(self, word):
+        ids = []
+        freqs = []
+        for segment in self.segments:
+            term_id = segment.term_id(word)
+            if term_id is None:
+                continue
+            offsets = segment.files.array("postings_offsets")
+            start, end = int(offsets[term_id]), int(offsets[term_id + 1])
+            ids.append(segment.files.array("postings_docs")[start:end] + segment.base)
+            freqs.append(segment.files.array("postings_freqs")[start:end])
+        if not ids:
+            return None
+        return _concat(ids, np.int32), _concat(freqs, np.float64)
+
+    def _idf(self, word):
+        count = self.df[word]
+        return math.log(1 + (self.doc_count - count + 0.5) / (count + 0.5))
+
+    def _max_score(self, word):
+        if word not in self._max_score_cache:
+            term_scores = self._term_scores(word)
+            self._max_score_cache[word] = 0.0 if term_scores is None else float(term_scores[1].max())
+        return self._max_score_cache[word]
+
+
+class MappedPages:
+    """Read-only sequence of page records ({doc_id, page_num, text}) backed by the index."""
+
+    def __init__(self, segments, count):
+        self.segments = segments
+        self._bases = [segment.base for segment in segments]
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def page_ranges(self):
+        """Return [(source, start, stop)]: each file's pages are contiguous."""
+        return [(segment.source, segment.base, segment.base + segment.page_count) for segment in self.segments]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("page index out of range")
+        segment = self.segments[bisect_right(self._bases, index) - 1]
+        local = index - segment.base
+        return {
+            "doc_id": segment.source,
+            "page_num": int(segment.files.array("page_nums")[local]),
+            "text": segment.files.blob_item("text", local).decode("utf-8"),
+        }
+
+
+def open_index(index_dir=BM25_INDEX_DIR, eager=False):
+    """Open the index as (MappedBM25, MappedPages).
+
+    Files are normally mapped on first use; commits keep each generation's
+    files for BM25_RETAINED_GENERATIONS further commits, so a lazy reader
+    survives that many refreshes. With ``eager`` everything is read or mapped
+    up front, so the reader keeps serving this version indefinitely.
+    """
+    manifest = _load_manifest(index_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No BM25 index found in {index_dir}. Please rebuild the index.")
+
+    segments = []
+    base = 0
+    for entry in manifest["files"]:
+        segments.append(_Segment(index_dir, entry, base))
+        base += entry["page_count"]
+
+    bm25 = MappedBM25(index_dir, manifest, segments)
+    if eager:
+        bm25.df
+        for segment in segments:
+            segment.files.open_all()
+    return bm25, MappedPages(segments, base)
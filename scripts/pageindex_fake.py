@@ -0,0 +1,118 @@
+# scripts/pageindex_fake.py
+
+import itertools
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+
+class FakePageIndexClient:
+    """Offline stand-in for pageindex.PageIndexClient with configurable delays.
+
+    Each submitted document reports "processing" until ``processing_seconds``
+    (plus optional random jitter) have passed since submission, then returns
+    ``tree`` or a one-node tree named after the file. ``submit_latency`` and
+    ``poll_latency`` simulate the network round-trip of each call.
+    """
+
+    def __init__(
+        self,
+        processing_seconds=2.0,
+        processing_jitter=0.0,
+        submit_latency=0.05,
+        poll_latency=0.05,
+        tree=None,
+        fail_doc_ids=(),
+        seed=None,
+    ):
+        self.processing_seconds = processing_seconds
+        self.processing_jitter = processing_jitter
+        self.submit_latency = submit_latency
+        self.poll_latency = poll_latency
+        self.tree = tree
+        self.fail_doc_ids = set(fail_doc_ids)
+        self.submit_calls = 0
+        self.get_tree_calls = 0
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._docs = {}
+        self._lock = threading.Lock()
+
+    def submit_document(self, file_path):
+        time.sleep(self.submit_latency)
+        with self._lock:
+            self.submit_calls += 1
+            doc_id = f"fake-{next(self._ids)}"
+            ready_at = (
+                time.monotonic()
+                + self.processing_seconds
+                + self._random.uniform(0, self.processing_jitter)
+            )
+            self._docs[doc_id] = (os.path.basename(file_path), ready_at)
+        return {"doc_id": doc_id}
+
+    def get_tree(self, doc_id, node_summary=True):
+        time.sleep(self.poll_latency)
+        with self._lock:
+            self.get_tree_calls += 1
+            if doc_id not in self._docs:
+                return {"status": "not_found"}
+            filename, ready_at = self._docs[doc_id]
+        if doc_id in self.fail_doc_ids:
+            return {"status": "failed"}
+        if time.monotonic() < ready_at:
+            return {"status": "processing"}
+        tree = self.tree or [
+            {
+                "title": filename,
+                "node_id": "0000",
+                "page_index": 1,
+                "summary": f"Synthetic tree for {filename}",
+                "text": f"Synthetic tree for {filename}",
+                "nodes": [],
+            }
+        ]
+        return {"status": "completed", "result": tree}
+
+
+def benchmark(num_docs=8, processing_seconds=2.0, max_concurrency=4, processing_jitter=0.5):
+    """Time build_pageindex_trees against the fake client in a scratch directory."""
+    from scripts.pageindex_index import build_pageindex_trees
+
+    work_dir = tempfile.mkdtemp(prefix="pageindex-bench-")
+    try:
+        docs_dir = os.path.join(work_dir, "policies")
+        os.makedirs(docs_dir)
+        for i in range(num_docs):
+            with open(os.path.join(docs_dir, f"policy{i}.pdf"), "wb") as f:
+                f.write(b"%PDF-1.4\n")
+
+        client = FakePageIndexClient(processing_seconds=processing_seconds, processing_jitter=processing_jitter)
+        started = time.perf_counter()
+        _, trees = build_pageindex_trees(
+            client=client,
+            docs_dir=docs_dir,
+            docs_cache_path=os.path.join(work_dir, "docs.json"),
+            trees_dir=os.path.join(work_dir, "trees"),
+            legacy_trees_path=os.path.join(work_dir, "trees.json"),
+            max_concurrency=max_concurrency,
+        )
+        elapsed = time.perf_counter() - started
+        documents = len(trees)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "documents": documents,
+        "seconds": elapsed,
+        "sequential_estimate_seconds": num_docs * processing_seconds,
+        "submit_calls": client.submit_calls,
+        "get_tree_calls": client.get_tree_calls,
+    }
+
+
+if __name__ == "__main__":
+    print(benchmark())
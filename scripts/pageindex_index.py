@@ -1,10 +1,13 @@
 import json
 import os
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from dotenv import load_dotenv
 
-from pageindex import PageIndexClient
+import tracing
+from scripts.tree_store import get_tree_store, migrate_legacy_trees
 
 from config import (
     DOCS_DIR,
@@ -12,7 +15,11 @@ from config import (
     PAGEINDEX_API_KEY_ENV,
     PAGEINDEX_DOCS_CACHE,
     PAGEINDEX_TREES_CACHE,
+    PAGEINDEX_TREES_DIR,
+    PAGEINDEX_MAX_CONCURRENCY,
     PAGEINDEX_MAX_POLLS,
+    PAGEINDEX_POLL_BACKOFF,
+    PAGEINDEX_POLL_MAX_SECONDS,
     PAGEINDEX_POLL_SECONDS,
 )
 
@@ -31,6 +38,8 @@ def _save_json(path, data):
 
 
 def _get_client():
+    from pageindex import PageIndexClient
+
     load_dotenv()
     api_key = os.getenv(PAGEINDEX_API_KEY_ENV)
     if not api_key:
@@ -44,8 +53,23 @@ def _is_pdf_file(filename):
     return filename.lower().endswith(".pdf")
 
 
+def _poll_delay(attempt):
+    # Exponential backoff with equal jitter, so concurrent pollers do not line up.
+    delay = min(PAGEINDEX_POLL_MAX_SECONDS, PAGEINDEX_POLL_SECONDS * PAGEINDEX_POLL_BACKOFF**attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
 def _wait_for_tree(client, doc_id):
+    with tracing.span("pageindex.wait_tree", doc_id=doc_id) as attrs:
+        return _poll_tree(client, doc_id, attrs)
+
+
+def _poll_tree(client, doc_id, attrs):
     for attempt in range(PAGEINDEX_MAX_POLLS):
+        attrs["polls"] = attempt + 1
+        tracing.count("pageindex_polls_total")
+        if attempt:
+            tracing.count("pageindex_poll_retries_total")
         tree_result = client.get_tree(doc_id, node_summary=True)
         if isinstance(tree_result, dict):
             status = tree_result.get("status")
@@ -57,46 +81,104 @@ def _wait_for_tree(client, doc_id):
             return tree_result
 
         if attempt < PAGEINDEX_MAX_POLLS - 1:
-            time.sleep(PAGEINDEX_POLL_SECONDS)
+            time.sleep(_poll_delay(attempt))
 
     raise TimeoutError(
         f"Timed out waiting for PageIndex tree for {doc_id} after {PAGEINDEX_MAX_POLLS} attempts."
     )
 
 
-def build_pageindex_trees():
-    if not os.path.isdir(DOCS_DIR):
-        raise FileNotFoundError(f"Docs directory not found: {DOCS_DIR}")
-
-    client = _get_client()
-    docs_cache = _load_json(PAGEINDEX_DOCS_CACHE)
-    trees_cache = _load_json(PAGEINDEX_TREES_CACHE)
-
-    updated = False
-
-    for filename in os.listdir(DOCS_DIR):
-        if not _is_pdf_file(filename):
-            continue
+def _submit_document(client, filename, file_path):
+    with tracing.span("pageindex.submit", filename=filename):
+        result = client.submit_document(file_path)
+    doc_id = result.get("doc_id")
+    if not doc_id:
+        raise RuntimeError(f"No doc_id returned for {filename}")
+    return doc_id
+
+
+def load_pageindex_trees(
+    docs_cache_path=PAGEINDEX_DOCS_CACHE,
+    trees_dir=PAGEINDEX_TREES_DIR,
+    legacy_trees_path=PAGEINDEX_TREES_CACHE,
+):
+    """Return (docs_cache, tree store) as currently on disk, without contacting PageIndex."""
+    with tracing.span("pageindex.load_cache"):
+        docs_cache = _load_json(docs_cache_path)
+        trees_cache = get_tree_store(trees_dir)
+        migrate_legacy_trees(trees_cache, legacy_trees_path)
+    return docs_cache, trees_cache
 
-        file_path = os.path.join(DOCS_DIR, filename)
-        doc_id = docs_cache.get(filename)
 
-        if not doc_id:
-            result = client.submit_document(file_path)
-            doc_id = result.get("doc_id")
-            if not doc_id:
-                raise RuntimeError(f"No doc_id returned for {filename}")
+def build_pageindex_trees(
+    client=None,
+    docs_dir=DOCS_DIR,
+    docs_cache_path=PAGEINDEX_DOCS_CACHE,
+    trees_dir=PAGEINDEX_TREES_DIR,
+    legacy_trees_path=PAGEINDEX_TREES_CACHE,
+    max_concurrency=PAGEINDEX_MAX_CONCURRENCY,
+    progress=None,
+):
+    """Submit new PDFs and fetch missing trees; returns (docs_cache, tree store).
+
+    Only the manifest is read up front: trees load from the store when a
+    query needs them, and each finished tree is written to its own shard.
+    ``progress(done, total, doc_id)``, if given, is called as each tree finishes.
+    """
+    if not os.path.isdir(docs_dir):
+        raise FileNotFoundError(f"Docs directory not found: {docs_dir}")
+
+    docs_cache, trees_cache = load_pageindex_trees(docs_cache_path, trees_dir, legacy_trees_path)
+
+    new_files = [
+        filename
+        for filename in sorted(os.listdir(docs_dir))
+        if _is_pdf_file(filename) and not docs_cache.get(filename)
+    ]
+    pending_ids = [
+        doc_id
+        for filename, doc_id in docs_cache.items()
+        if doc_id not in trees_cache and os.path.exists(os.path.join(docs_dir, filename))
+    ]
+    if not new_files and not pending_ids:
+        return docs_cache, trees_cache
+
+    if client is None:
+        client = _get_client()
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    errors = []
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        # Submit everything up front so PageIndex processes the documents in parallel.
+        submissions = {
+            pool.submit(_submit_document, client, filename, os.path.join(docs_dir, filename)): filename
+            for filename in new_files
+        }
+        for future in as_completed(submissions):
+            filename = submissions[future]
+            try:
+                doc_id = future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
             docs_cache[filename] = doc_id
-            updated = True
-
-        if doc_id not in trees_cache:
-            tree = _wait_for_tree(client, doc_id)
-            trees_cache[doc_id] = tree
-            updated = True
-
-    if updated:
-        os.makedirs(INDEX_DIR, exist_ok=True)
-        _save_json(PAGEINDEX_DOCS_CACHE, docs_cache)
-        _save_json(PAGEINDEX_TREES_CACHE, trees_cache)
+            pending_ids.append(doc_id)
+        if submissions:
+            _save_json(docs_cache_path, docs_cache)
+
+        polls = {pool.submit(_wait_for_tree, client, doc_id): doc_id for doc_id in pending_ids}
+        for done, future in enumerate(as_completed(polls), 1):
+            if progress is not None:
+                progress(done, len(polls), polls[future])
+            try:
+                tree = future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+            # Persist each finished tree so an interrupted run keeps its progress.
+            trees_cache.put(polls[future], tree)
+
+    if errors:
+        raise errors[0]
 
     return docs_cache, trees_cache
@@ -1,11 +1,29 @@
+import asyncio
 import json
-
-from llm.groq_client import generate_text
+import time
+
+import tracing
+from token_count import estimate_tokens
+from llm.router import agenerate_text, generate_text, stream_text
+from scripts.bm25 import tokenize
+from scripts.compiled_tree import get_compiled_tree
+from scripts.context_packer import pack_contexts
 from config import (
-    NODE_TEXT_MAX_CHARS,
+    CONTEXT_TOKEN_BUDGET,
+    TREE_BRANCH_FANOUT,
+    TREE_BRANCH_MAX_CONTEXTS,
+    TREE_LEXICAL_ENABLED,
+    TREE_LEXICAL_MARGIN,
+    TREE_LEXICAL_MIN_SCORE,
     TREE_MAX_DEPTH,
     TREE_MAX_NODES_PER_STEP,
+    TREE_OUTLINE_TOKEN_BUDGET,
     TREE_SELECT_TOP_K,
+    TREE_SPECULATIVE_PREFETCH,
+    TREE_TOURNAMENT_BATCH_SIZE,
+    TREE_TOURNAMENT_CONCURRENCY,
+    TREE_TOURNAMENT_ENABLED,
+    TREE_TRAVERSAL_MODE,
 )
 
 
@@ -20,87 +38,33 @@ def _extract_json_object(text):
         return None
 
 
-def _get_page_range(node):
-    start = node.get("start_index") or node.get("page_index")
-    end = node.get("end_index") or node.get("page_index")
-    if start is None and "page" in node:
-        start = node.get("page")
-        end = node.get("page")
-    return start, end
-
-
-def _shorten_text(text, limit):
-    if not text:
-        return ""
-    text = text.strip()
-    if len(text) <= limit:
-        return text
-    return text[:limit].rstrip() + "..."
+def _lexical_rank(node_ids, scores, compiled):
+    ranked = [(node_id, scores[compiled.node(node_id).index]) for node_id in node_ids]
+    # Stable sort keeps the tree order among equally scored nodes.
+    ranked.sort(key=lambda item: item[1], reverse=True)
+    return ranked
 
 
-def _node_summary(node):
-    return (
-        node.get("summary")
-        or node.get("node_summary")
-        or _shorten_text(node.get("text") or "", 400)
-    )
+def _lexical_winner(ranked):
+    if not ranked:
+        return None
+    top_id, top_score = ranked[0]
+    if top_score < TREE_LEXICAL_MIN_SCORE:
+        return None
+    runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+    if top_score >= runner_up * TREE_LEXICAL_MARGIN:
+        return top_id
+    return None
 
 
-def _normalize_node_id(node_id, fallback):
-    if node_id is None or str(node_id).strip() == "":
-        return fallback
-    return str(node_id)
-
-
-def _build_maps(tree):
-    node_map = {}
-    children_map = {}
-    root_ids = []
-
-    def walk(nodes, path_prefix):
-        for idx, node in enumerate(nodes):
-            fallback_id = f"node-{path_prefix}-{idx}"
-            node_id = _normalize_node_id(node.get("node_id"), fallback_id)
-            node["_node_id"] = node_id
-            node_map[node_id] = node
-
-            children = node.get("nodes") or []
-            children_ids = []
-            for child_index, child in enumerate(children):
-                child_fallback = f"node-{path_prefix}-{idx}-{child_index}"
-                child_id = _normalize_node_id(child.get("node_id"), child_fallback)
-                children_ids.append(child_id)
-            children_map[node_id] = children_ids
-
-            if path_prefix == "root":
-                root_ids.append(node_id)
-
-            walk(children, f"{path_prefix}-{idx}")
-
-    walk(tree, "root")
-    return node_map, children_map, root_ids
-
-
-def _format_candidate_nodes(node_ids, node_map):
-    lines = []
-    for node_id in node_ids[:TREE_MAX_NODES_PER_STEP]:
-        node = node_map[node_id]
-        start, end = _get_page_range(node)
-        summary = _node_summary(node)
-        if start is not None and end is not None:
-            page_part = f"pages {start}-{end}"
-        else:
-            page_part = "pages unknown"
-        lines.append(
-            f"- id: {node_id}; title: {node.get('title', '')}; {page_part}; summary: {summary}"
-        )
-    return "\n".join(lines)
+def _format_candidate_nodes(node_ids, compiled):
+    return "\n".join(compiled.node(node_id).candidate_line for node_id in node_ids)
 
 
-def _select_nodes_with_llm(question, node_ids, node_map, depth):
-    candidates_text = _format_candidate_nodes(node_ids, node_map)
+def _selection_prompt(question, node_ids, compiled):
+    candidates_text = _format_candidate_nodes(node_ids, compiled)
 
-    prompt = f"""You are selecting the most relevant sections in a document tree.
+    return f"""You are selecting the most relevant sections in a document tree.
 Question: {question}
 
 Candidates:
@@ -115,40 +79,123 @@ Return JSON only:
 {{"selected_ids": ["id1", "id2"], "reason": "...", "drill_down": true}}
 """
 
-    raw = generate_text(prompt, temperature=0.1)
+
+def _parse_selection(raw, node_ids, compiled):
     data = _extract_json_object(raw) or {}
     selected = data.get("selected_ids") or []
-    selected = [sid for sid in selected if sid in node_map]
+    selected = [sid for sid in selected if sid in compiled]
     drill_down = bool(data.get("drill_down"))
 
     if not selected:
+        tracing.count("selection_fallbacks_total")
         fallback = node_ids[:TREE_SELECT_TOP_K]
         return fallback, "fallback", False
 
     return selected, data.get("reason") or "", drill_down
 
 
-def _collect_context(selected_ids, node_map):
-    contexts = []
-    for node_id in selected_ids:
-        node = node_map[node_id]
-        start, end = _get_page_range(node)
-        text = node.get("text") or ""
-        summary = _node_summary(node)
-        context_text = _shorten_text(text or summary, NODE_TEXT_MAX_CHARS)
-        contexts.append(
-            {
-                "node_id": node_id,
-                "title": node.get("title", ""),
-                "start_page": start,
-                "end_page": end,
-                "context": context_text,
-            }
+def _select_nodes_with_llm(question, node_ids, compiled, depth, use_cache=True):
+    prompt = _selection_prompt(question, node_ids, compiled)
+    raw = generate_text(prompt, temperature=0.1, use_cache=use_cache)
+    return _parse_selection(raw, node_ids, compiled)
+
+
+async def _aselect_nodes_with_llm(question, node_ids, compiled, depth, use_cache=True):
+    prompt = _selection_prompt(question, node_ids, compiled)
+    raw = await agenerate_text(prompt, temperature=0.1, use_cache=use_cache)
+    return _parse_selection(raw, node_ids, compiled)
+
+
+async def _atournament_select(
+    question,
+    node_ids,
+    compiled,
+    depth,
+    use_cache=True,
+    batch_size=TREE_TOURNAMENT_BATCH_SIZE,
+    concurrency=TREE_TOURNAMENT_CONCURRENCY,
+):
+    """Select among more candidates than fit one prompt by running groups in parallel rounds.
+
+    Each round splits the candidates into groups of ``batch_size`` and keeps
+    the (at most TREE_SELECT_TOP_K) picks of every group; the last round runs
+    a normal selection over the surviving winners.
+    """
+    # Groups must be larger than what each group keeps, or rounds would not shrink.
+    batch_size = max(batch_size, TREE_SELECT_TOP_K + 1)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_group(group):
+        async with semaphore:
+            return await _aselect_nodes_with_llm(question, group, compiled, depth, use_cache)
+
+    with tracing.span("tournament", depth=depth, candidates=len(node_ids)) as attrs:
+        candidates = list(node_ids)
+        rounds = 0
+        while len(candidates) > batch_size:
+            groups = [candidates[i : i + batch_size] for i in range(0, len(candidates), batch_size)]
+            results = await asyncio.gather(*(run_group(group) for group in groups))
+            winners = []
+            for selected, reason, _drill_down in results:
+                if reason == "fallback":
+                    continue
+                winners.extend(sid for sid in selected[:TREE_SELECT_TOP_K] if sid not in winners)
+            # No group found anything relevant: keep the best-ranked batch for the final round.
+            candidates = winners or candidates[:batch_size]
+            rounds += 1
+        attrs["rounds"] = rounds
+
+        selected, reason, drill_down = await _aselect_nodes_with_llm(
+            question, candidates, compiled, depth, use_cache
         )
-    return contexts
+    return selected, reason, drill_down, rounds
+
+
+def _selection_method(reason, rounds):
+    if reason == "fallback":
+        return "fallback"
+    return "tournament" if rounds else "llm"
+
+
+async def _aselect_nodes(
+    question, node_ids, compiled, depth, use_cache=True, tournament=TREE_TOURNAMENT_ENABLED
+):
+    if tournament and len(node_ids) > TREE_TOURNAMENT_BATCH_SIZE:
+        selected, reason, drill_down, rounds = await _atournament_select(
+            question, node_ids, compiled, depth, use_cache
+        )
+    else:
+        # Without a tournament only the best-ranked nodes fit in the prompt.
+        if not tournament:
+            node_ids = node_ids[:TREE_MAX_NODES_PER_STEP]
+        selected, reason, drill_down = await _aselect_nodes_with_llm(
+            question, node_ids, compiled, depth, use_cache
+        )
+        rounds = 0
+    return selected, reason, drill_down, _selection_method(reason, rounds)
+
+
+def _select_nodes(
+    question, node_ids, compiled, depth, use_cache=True, tournament=TREE_TOURNAMENT_ENABLED
+):
+    if tournament and len(node_ids) > TREE_TOURNAMENT_BATCH_SIZE:
+        return asyncio.run(
+            _aselect_nodes(question, node_ids, compiled, depth, use_cache, tournament)
+        )
+    if not tournament:
+        node_ids = node_ids[:TREE_MAX_NODES_PER_STEP]
+    selected, reason, drill_down = _select_nodes_with_llm(
+        question, node_ids, compiled, depth, use_cache=use_cache
+    )
+    return selected, reason, drill_down, _selection_method(reason, 0)
 
 
-def _answer_with_reasons(question, contexts):
+def _collect_context(question, selected_ids, compiled, budget=CONTEXT_TOKEN_BUDGET):
+    with tracing.span("pack_context", selected=len(selected_ids)):
+        return pack_contexts(question, selected_ids, compiled, budget)
+
+
+def _answer_prompt(question, contexts):
     context_lines = []
     for ctx in contexts:
         page_info = "pages unknown"
@@ -158,7 +205,7 @@ def _answer_with_reasons(question, contexts):
             f"Node {ctx['node_id']} ({ctx['title']}, {page_info}): {ctx['context']}"
         )
 
-    prompt = f"""You are an insurance policy assistant.
+    return f"""You are an insurance policy assistant.
 Use ONLY the context below.
 Question: {question}
 
@@ -174,39 +221,436 @@ Reasons:
 If the context is insufficient, say what is missing.
 """
 
-    return generate_text(prompt, temperature=0.2)
 
+def _answer_with_reasons(question, contexts, use_cache=True):
+    with tracing.span("answer", contexts=len(contexts)):
+        return generate_text(_answer_prompt(question, contexts), temperature=0.2, use_cache=use_cache)
+
+
+async def _aanswer_with_reasons(question, contexts, use_cache=True):
+    with tracing.span("answer", contexts=len(contexts)):
+        return await agenerate_text(_answer_prompt(question, contexts), temperature=0.2, use_cache=use_cache)
+
+
+def _lexical_step(node_ids, lexical_scores, compiled):
+    """Order candidates by lexical score and return (ordered ids, winner or None, top score)."""
+    if lexical_scores is None:
+        return list(node_ids), None, None
+    ranked = _lexical_rank(node_ids, lexical_scores, compiled)
+    top_score = ranked[0][1] if ranked else None
+    return [node_id for node_id, _score in ranked], _lexical_winner(ranked), top_score
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def _outline_prompt(question, outline):
+    return f"""You are selecting the most relevant sections of an insurance policy.
+Question: {question}
+
+Document outline (one node per line: id | title | pages | summary; indentation shows nesting):
+{outline}
+
+Rules:
+- Pick up to {TREE_SELECT_TOP_K} leaf node ids (nodes with nothing nested under them) whose text most likely answers the question.
+- Never pick a parent section; pick the leaves under it instead.
+- If none look relevant, return an empty list.
+
+Return JSON only:
+{{"selected_ids": ["id1", "id2"], "reason": "..."}}
+"""
+
+
+def _select_with_outline(question, compiled, traversal, use_cache=True):
+    """Single-call selection over the whole outline; returns [] when the walk must be used instead."""
+    started = time.perf_counter()
+    outline = compiled.outline()
+    outline_tokens = estimate_tokens(outline)
+    if outline_tokens > TREE_OUTLINE_TOKEN_BUDGET:
+        traversal.append(
+            {
+                "depth": 0,
+                "selected": [],
+                "reason": f"outline too large ({outline_tokens} > {TREE_OUTLINE_TOKEN_BUDGET} tokens)",
+                "method": "outline_skipped",
+                "elapsed_ms": _elapsed_ms(started),
+            }
+        )
+        return []
+
+    raw = generate_text(_outline_prompt(question, outline), temperature=0.1, use_cache=use_cache)
+    data = _extract_json_object(raw) or {}
+    selected = []
+    for sid in data.get("selected_ids") or []:
+        # Only leaves are answers here; roots and parent sections would pack whole chapters.
+        if sid in compiled and not compiled.children(sid) and sid not in selected:
+            selected.append(sid)
+    selected = selected[:TREE_SELECT_TOP_K]
+    traversal.append(
+        {
+            "depth": 0,
+            "selected": selected,
+            "reason": (data.get("reason") or "") if selected else "no valid leaf ids; using tree walk",
+            "method": "outline",
+            "elapsed_ms": _elapsed_ms(started),
+        }
+    )
+    return selected
 
-def query_tree(question, tree):
-    node_map, children_map, root_ids = _build_maps(tree)
 
-    current_ids = root_ids
+def _iter_walk(
+    question, compiled, lexical_scores, traversal, use_cache=True, tournament=TREE_TOURNAMENT_ENABLED
+):
+    """Yield each traversal step as it is decided; the generator returns the final selection."""
+    current_ids = list(compiled.root_ids)
     selected_ids = []
-    traversal = []
 
     for depth in range(TREE_MAX_DEPTH):
         if not current_ids:
             break
 
-        selected, reason, drill_down = _select_nodes_with_llm(
-            question, current_ids, node_map, depth
-        )
+        started = time.perf_counter()
+        with tracing.span("select", depth=depth, candidates=len(current_ids)) as attrs:
+            current_ids, winner, top_score = _lexical_step(current_ids, lexical_scores, compiled)
+            if winner is not None:
+                # One candidate clearly dominates on exact terms: no LLM round-trip needed.
+                selected = [winner]
+                reason = f"lexical match (score {top_score:.2f})"
+                drill_down = bool(compiled.children(winner))
+                method = "lexical"
+            else:
+                selected, reason, drill_down, method = _select_nodes(
+                    question, current_ids, compiled, depth, use_cache=use_cache, tournament=tournament
+                )
+            attrs["method"] = method
         selected_ids = selected
-        traversal.append((selected, reason))
+        step = {
+            "depth": depth,
+            "selected": selected,
+            "reason": reason,
+            "method": method,
+            "elapsed_ms": _elapsed_ms(started),
+        }
+        traversal.append(step)
+        yield step
 
         if not drill_down:
             break
 
         next_ids = []
         for node_id in selected:
-            next_ids.extend(children_map.get(node_id, []))
+            next_ids.extend(compiled.children(node_id))
         current_ids = next_ids
 
-    contexts = _collect_context(selected_ids, node_map)
-    answer = _answer_with_reasons(question, contexts)
+    return selected_ids
+
+
+def _iter_selection(question, compiled, mode, lexical, traversal, use_cache, tournament):
+    if mode not in ("sequential", "outline"):
+        raise ValueError(f"Unknown traversal mode: {mode}")
+
+    selected_ids = []
+    if mode == "outline":
+        with tracing.span("select.outline"):
+            selected_ids = _select_with_outline(question, compiled, traversal, use_cache=use_cache)
+        yield traversal[-1]
+    if not selected_ids:
+        lexical_scores = None
+        if lexical:
+            with tracing.span("lexical_scores"):
+                lexical_scores = compiled.lexical_index().get_scores(tokenize(question))
+        selected_ids = yield from _iter_walk(
+            question, compiled, lexical_scores, traversal, use_cache=use_cache, tournament=tournament
+        )
+    return selected_ids
+
+
+def _run_to_end(generator):
+    while True:
+        try:
+            next(generator)
+        except StopIteration as stop:
+            return stop.value
+
+
+def query_tree(
+    question,
+    tree,
+    use_cache=True,
+    doc_id=None,
+    lexical=TREE_LEXICAL_ENABLED,
+    mode=TREE_TRAVERSAL_MODE,
+    tournament=TREE_TOURNAMENT_ENABLED,
+):
+    if mode == "branch":
+        return asyncio.run(
+            aquery_tree(
+                question,
+                tree,
+                use_cache=use_cache,
+                doc_id=doc_id,
+                lexical=lexical,
+                tournament=tournament,
+            )
+        )
+
+    with tracing.start_trace("query_tree") as trace:
+        # Accepts a raw PageIndex tree or a CompiledTree; either way nothing is mutated.
+        compiled = get_compiled_tree(tree, doc_id)
+        started = time.perf_counter()
+        traversal = []
+        selected_ids = _run_to_end(
+            _iter_selection(question, compiled, mode, lexical, traversal, use_cache, tournament)
+        )
+        selection_ms = _elapsed_ms(started)
+
+        contexts = _collect_context(question, selected_ids, compiled)
+        answer = _answer_with_reasons(question, contexts, use_cache=use_cache)
+
+    return {
+        "answer": answer,
+        "selected_nodes": contexts,
+        "traversal": traversal,
+        "mode": mode,
+        "selection_ms": selection_ms,
+        "trace": trace.to_dict(),
+    }
+
+
+def query_tree_stream(
+    question,
+    tree,
+    use_cache=True,
+    doc_id=None,
+    lexical=TREE_LEXICAL_ENABLED,
+    mode=TREE_TRAVERSAL_MODE,
+    tournament=TREE_TOURNAMENT_ENABLED,
+):
+    """Like query_tree, but yields events as they happen.
+
+    Events are dicts with a ``type`` of "step" (one traversal step), "contexts"
+    (the selected nodes), "token" (a chunk of answer text) and finally "done",
+    whose ``result`` has the same shape as query_tree's return value.
+    """
+    return tracing.iter_traced(
+        "query_tree_stream",
+        lambda: _query_tree_events(question, tree, use_cache, doc_id, lexical, mode, tournament),
+    )
+
+
+def _query_tree_events(question, tree, use_cache, doc_id, lexical, mode, tournament):
+    compiled = get_compiled_tree(tree, doc_id)
+    started = time.perf_counter()
+
+    if mode == "branch":
+        # Branches finish out of order, so their steps are reported once selection completes.
+        selected_ids, traversal = asyncio.run(
+            _abranch_selection(
+                question,
+                compiled,
+                lexical,
+                use_cache,
+                TREE_BRANCH_FANOUT,
+                TREE_SPECULATIVE_PREFETCH,
+                tournament,
+            )
+        )
+        for step in traversal:
+            yield {"type": "step", "step": step}
+    else:
+        traversal = []
+        steps = _iter_selection(question, compiled, mode, lexical, traversal, use_cache, tournament)
+        while True:
+            try:
+                step = next(steps)
+            except StopIteration as stop:
+                selected_ids = stop.value
+                break
+            yield {"type": "step", "step": step}
+    selection_ms = _elapsed_ms(started)
+
+    contexts = _collect_context(question, selected_ids, compiled)
+    yield {"type": "contexts", "selected_nodes": contexts}
+
+    parts = []
+    first_token_ms = None
+    answer_started = time.perf_counter()
+    for chunk in stream_text(_answer_prompt(question, contexts), temperature=0.2, use_cache=use_cache):
+        if first_token_ms is None:
+            first_token_ms = _elapsed_ms(started)
+        parts.append(chunk)
+        yield {"type": "token", "text": chunk}
+    tracing.record_span("answer", answer_started, contexts=len(contexts), first_token_ms=first_token_ms)
+
+    yield {
+        "type": "done",
+        "result": {
+            "answer": "".join(parts),
+            "selected_nodes": contexts,
+            "traversal": traversal,
+            "mode": mode,
+            "selection_ms": selection_ms,
+            "first_token_ms": first_token_ms,
+            "trace": tracing.current_trace().to_dict(),
+        },
+    }
+
+
+class _BranchTraversal:
+    """Explores every selected branch as its own task instead of merging children per level.
+
+    While a branch's selection call is in flight, the selection for the child
+    list of its most likely node (best lexical rank) is started speculatively;
+    it is reused if that node is chosen for drill-down and cancelled otherwise.
+    """
+
+    def __init__(self, question, compiled, lexical_scores, use_cache, fanout, speculative, tournament):
+        self.question = question
+        self.tournament = tournament
+        self.compiled = compiled
+        self.lexical_scores = lexical_scores
+        self.use_cache = use_cache
+        self.fanout = fanout
+        self.speculative = speculative
+        self.traversal = []
+        self.finals = []
+
+    def _start_selection(self, node_ids, depth):
+        return asyncio.ensure_future(
+            _aselect_nodes(
+                self.question,
+                node_ids,
+                self.compiled,
+                depth,
+                use_cache=self.use_cache,
+                tournament=self.tournament,
+            )
+        )
+
+    def _speculate(self, node_ids, depth):
+        if not self.speculative or depth + 1 >= TREE_MAX_DEPTH:
+            return None, None
+        for node_id in node_ids[:TREE_MAX_NODES_PER_STEP]:
+            children = self.compiled.children(node_id)
+            if not children:
+                continue
+            child_ids, winner, _ = _lexical_step(children, self.lexical_scores, self.compiled)
+            if winner is not None:
+                # The child step will be decided lexically anyway.
+                return None, None
+            return node_id, self._start_selection(child_ids, depth + 1)
+        return None, None
+
+    async def explore(self, parent_id, node_ids, depth, pending=None):
+        started = time.perf_counter()
+        with tracing.span("select", depth=depth, candidates=len(node_ids), branch=parent_id) as attrs:
+            node_ids, winner, top_score = _lexical_step(node_ids, self.lexical_scores, self.compiled)
+            speculated_id, speculated = None, None
+
+            if pending is None and winner is not None:
+                selected = [winner]
+                reason = f"lexical match (score {top_score:.2f})"
+                drill_down = bool(self.compiled.children(winner))
+                method = "lexical"
+            else:
+                task = pending or self._start_selection(node_ids, depth)
+                speculated_id, speculated = self._speculate(node_ids, depth)
+                selected, reason, drill_down, method = await task
+            attrs.update(method=method, speculative=pending is not None)
+
+        self.traversal.append(
+            {
+                "depth": depth,
+                "selected": selected,
+                "reason": reason,
+                "method": method,
+                "branch": parent_id,
+                "speculative": pending is not None,
+                "elapsed_ms": _elapsed_ms(started),
+            }
+        )
+
+        branches = []
+        for position, node_id in enumerate(selected):
+            children = self.compiled.children(node_id)
+            if (
+                drill_down
+                and children
+                and position < self.fanout
+                and depth + 1 < TREE_MAX_DEPTH
+            ):
+                prefetched = speculated if node_id == speculated_id else None
+                branches.append(self.explore(node_id, children, depth + 1, prefetched))
+            else:
+                self.finals.append((depth, node_id))
+
+        if speculated is not None and speculated_id not in {
+            node_id for node_id in selected[: self.fanout] if drill_down
+        }:
+            speculated.cancel()
+
+        if branches:
+            await asyncio.gather(*branches)
+
+    def ranked_finals(self):
+        seen = set()
+        ordered = []
+        for order, (depth, node_id) in enumerate(self.finals):
+            if node_id in seen:
+                continue
+            seen.add(node_id)
+            score = 0.0
+            if self.lexical_scores is not None:
+                score = self.lexical_scores[self.compiled.node(node_id).index]
+            # Deeper (more precise) sections first, then lexical relevance.
+            ordered.append((-depth, -score, order, node_id))
+        ordered.sort()
+        return [node_id for _depth, _score, _order, node_id in ordered[:TREE_BRANCH_MAX_CONTEXTS]]
+
+
+async def _abranch_selection(question, compiled, lexical, use_cache, fanout, speculative, tournament):
+    lexical_scores = None
+    if lexical:
+        with tracing.span("lexical_scores"):
+            lexical_scores = compiled.lexical_index().get_scores(tokenize(question))
+
+    traversal = _BranchTraversal(
+        question, compiled, lexical_scores, use_cache, fanout, speculative, tournament
+    )
+    if compiled.root_ids:
+        await traversal.explore(None, list(compiled.root_ids), 0)
+    traversal.traversal.sort(key=lambda step: step["depth"])
+    return traversal.ranked_finals(), traversal.traversal
+
+
+async def aquery_tree(
+    question,
+    tree,
+    use_cache=True,
+    doc_id=None,
+    lexical=TREE_LEXICAL_ENABLED,
+    fanout=TREE_BRANCH_FANOUT,
+    speculative=TREE_SPECULATIVE_PREFETCH,
+    tournament=TREE_TOURNAMENT_ENABLED,
+):
+    """Concurrent multi-branch traversal; wall-clock time grows with depth, not branch count."""
+    with tracing.start_trace("query_tree") as trace:
+        compiled = get_compiled_tree(tree, doc_id)
+        started = time.perf_counter()
+        selected_ids, traversal = await _abranch_selection(
+            question, compiled, lexical, use_cache, fanout, speculative, tournament
+        )
+        selection_ms = _elapsed_ms(started)
+
+        contexts = _collect_context(question, selected_ids, compiled)
+        answer = await _aanswer_with_reasons(question, contexts, use_cache=use_cache)
 
     return {
         "answer": answer,
         "selected_nodes": contexts,
         "traversal": traversal,
+        "mode": "branch",
+        "selection_ms": selection_ms,
+        "trace": trace.to_dict(),
     }
@@ -1,8 +1,37 @@
 # scripts/parse_documents.py
 
 import os, json
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 import fitz  # PyMuPDF
-from config import DOCS_DIR
+from config import (
+    CHUNKS_DIR,
+    CHUNKS_JSON,
+    CHUNKS_JSONL,
+    DOCS_DIR,
+    PARSE_PAGES_PER_TASK,
+    PARSE_WORKERS,
+)
+
+def _page_record(doc, fname, page_num):
+    text = doc[page_num].get_text().strip()
+    if not text:
+        return None
+    return {
+        "doc_id": fname,
+        "page_num": page_num + 1,
+        "text": text
+    }
+
+def parse_pdf(doc_path, fname):
+    records = []
+    doc = fitz.open(doc_path)
+    for page_num in range(len(doc)):
+        record = _page_record(doc, fname, page_num)
+        if record:
+            records.append(record)
+    doc.close()
+    return records
 
 def parse_documents(input_dir):
     output = []
@@ -10,20 +39,145 @@ def parse_documents(input_dir):
         if fname.endswith(".pdf"):
             doc_path = os.path.join(input_dir, fname)
             try:
-                doc = fitz.open(doc_path)
-                for page_num in range(len(doc)):
-                    page = doc[page_num]
-                    text = page.get_text().strip()
-                    if text:
-                        output.append({
-                            "doc_id": fname,
-                            "page_num": page_num + 1,
-                            "text": text
-                        })
-                doc.close()
+                output.extend(parse_pdf(doc_path, fname))
             except Exception as e:
                 print(f"Error reading {fname}: {e}")
 
-    os.makedirs("chunks", exist_ok=True)
-    with open("chunks/chunked_docs.json", "w", encoding="utf-8") as f:
+    os.makedirs(CHUNKS_DIR, exist_ok=True)
+    with open(CHUNKS_JSON, "w", encoding="utf-8") as f:
         json.dump(output, f, indent=2, ensure_ascii=False)
+
+
+def _parse_page_range(doc_path, fname, start, end):
+    # Runs in a worker process; each task opens its own handle on the PDF.
+    records = []
+    doc = fitz.open(doc_path)
+    for page_num in range(start, end):
+        record = _page_record(doc, fname, page_num)
+        if record:
+            records.append(record)
+    doc.close()
+    return end - start, records
+
+
+def _page_range_tasks(input_dir, pages_per_task):
+    for fname in sorted(os.listdir(input_dir)):
+        if not fname.endswith(".pdf"):
+            continue
+        doc_path = os.path.join(input_dir, fname)
+        try:
+            with fitz.open(doc_path) as doc:
+                page_count = len(doc)
+        except Exception as e:
+            print(f"Error reading {fname}: {e}")
+            continue
+        for start in range(0, page_count, pages_per_task):
+            yield doc_path, fname, start, min(start + pages_per_task, page_count)
+
+
+def parse_documents_parallel(
+    input_dir,
+    output_path=CHUNKS_JSONL,
+    workers=PARSE_WORKERS,
+    pages_per_task=PARSE_PAGES_PER_TASK,
+    report_every=5.0,
+):
+    """Parse PDFs in page-range tasks across a process pool, streaming records to JSONL.
+
+    Records are written in file/page order as soon as every earlier range has
+    finished, and at most ``2 * workers`` ranges are in flight, so memory stays
+    bounded however large the policy books are.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * 2
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = f"{output_path}.tmp-{os.getpid()}"
+
+    started = time.perf_counter()
+    last_report = started
+    pages_done = 0
+    records_written = 0
+    files = set()
+
+    tasks = enumerate(_page_range_tasks(input_dir, pages_per_task))
+    pending = {}
+    finished = {}
+    next_to_write = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(tmp_path, "w", encoding="utf-8") as out:
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) + len(finished) < max_pending:
+                item = next(tasks, None)
+                if item is None:
+                    exhausted = True
+                    break
+                seq, (doc_path, fname, start, end) = item
+                future = pool.submit(_parse_page_range, doc_path, fname, start, end)
+                pending[future] = (seq, fname, start, end)
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                seq, fname, start, end = pending.pop(future)
+                try:
+                    page_count, records = future.result()
+                except Exception as e:
+                    print(f"Error reading {fname} pages {start + 1}-{end}: {e}")
+                    page_count, records = end - start, []
+                pages_done += page_count
+                files.add(fname)
+                finished[seq] = records
+
+            # Flush in order so consumers see each file's pages contiguously.
+            while next_to_write in finished:
+                for record in finished.pop(next_to_write):
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    records_written += 1
+                next_to_write += 1
+
+            now = time.perf_counter()
+            if now - last_report >= report_every:
+                rate = pages_done / (now - started)
+                print(f"[parse] {pages_done} pages, {rate:.1f} pages/s")
+                last_report = now
+
+    os.replace(tmp_path, output_path)
+
+    elapsed = time.perf_counter() - started
+    stats = {
+        "files": len(files),
+        "pages": pages_done,
+        "records": records_written,
+        "seconds": elapsed,
+        "pages_per_second": pages_done / elapsed if elapsed else 0.0,
+    }
+    print(
+        f"[parse] done: {stats['files']} files, {stats['pages']} pages in "
+        f"{elapsed:.2f}s ({stats['pages_per_second']:.1f} pages/s)"
+    )
+    return stats
+
+
+def iter_page_records(path):
+    """Yield page records from either the JSON array or the JSONL chunk file."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+def latest_chunks_path():
+    candidates = [path for path in (CHUNKS_JSON, CHUNKS_JSONL) if os.path.exists(path)]
+    if not candidates:
+        raise FileNotFoundError("No parsed chunks found. Run parse_documents first.")
+    return max(candidates, key=os.path.getmtime)
+
+
+if __name__ == "__main__":
+    parse_documents_parallel(DOCS_DIR)
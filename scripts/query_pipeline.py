@@ -1,16 +1,106 @@
 # scripts/query_pipeline.py
 
-from scripts.pageindex_query import query_tree
+import time
 
+import tracing
+from scripts.answer_cache import cached_answer, remember_answer
+from scripts.batch_query import query_batch
+from scripts.compiled_tree import get_compiled_tree
+from scripts.corpus_query import query_corpus
+from scripts.pageindex_query import query_tree, query_tree_stream
+from config import ANSWER_CACHE_ENABLED, TREE_TRAVERSAL_MODE
 
-def query_system(user_query, doc_id, trees_cache):
+
+def _get_tree(doc_id, trees_cache):
     tree = trees_cache.get(doc_id)
     if not tree:
         raise ValueError("No PageIndex tree found for the selected document. Please rebuild the index.")
+    return tree
+
+
+def _answer_namespace(doc_id, trees_cache, tree, mode):
+    # The tree store's content hash; a plain dict of trees falls back to the tree object's identity.
+    version = trees_cache.version(doc_id) if hasattr(trees_cache, "version") else id(tree)
+    return doc_id, version, mode
+
+
+def query_system(user_query, doc_id, trees_cache, use_cache=True, mode=TREE_TRAVERSAL_MODE):
+    tree = _get_tree(doc_id, trees_cache)
+
+    if use_cache and ANSWER_CACHE_ENABLED:
+        namespace = _answer_namespace(doc_id, trees_cache, tree, mode)
+        hit = cached_answer(user_query, namespace, get_compiled_tree(tree, doc_id))
+        if hit is not None:
+            return {"answer": hit["answer"], "traversal": hit["traversal"]}
 
-    result = query_tree(user_query, tree)
+    result = query_tree(user_query, tree, use_cache=use_cache, doc_id=doc_id, mode=mode)
+    if use_cache and ANSWER_CACHE_ENABLED:
+        remember_answer(user_query, namespace, result)
 
     return {
         "answer": result["answer"],
         "traversal": result["traversal"]
     }
+
+
+def _replay(hit, mode, started, trace):
+    for step in hit["traversal"]:
+        yield {"type": "step", "step": step}
+    yield {"type": "contexts", "selected_nodes": hit["selected_nodes"]}
+    yield {"type": "token", "text": hit["answer"]}
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    yield {
+        "type": "done",
+        "result": {
+            **hit,
+            "mode": mode,
+            "selection_ms": elapsed_ms,
+            "first_token_ms": elapsed_ms,
+            "trace": trace.to_dict(),
+        },
+    }
+
+
+def query_system_stream(user_query, doc_id, trees_cache, use_cache=True, mode=TREE_TRAVERSAL_MODE):
+    """Yield query_tree_stream events for the selected document (replayed from the answer cache on a hit)."""
+    tree = _get_tree(doc_id, trees_cache)
+    if not (use_cache and ANSWER_CACHE_ENABLED):
+        yield from query_tree_stream(user_query, tree, use_cache=use_cache, doc_id=doc_id, mode=mode)
+        return
+
+    namespace = _answer_namespace(doc_id, trees_cache, tree, mode)
+    started = time.perf_counter()
+    with tracing.start_trace("query_system_stream") as trace:
+        hit = cached_answer(user_query, namespace, get_compiled_tree(tree, doc_id))
+    if hit is not None:
+        yield from _replay(hit, mode, started, trace)
+        return
+
+    for event in query_tree_stream(user_query, tree, use_cache=use_cache, doc_id=doc_id, mode=mode):
+        if event["type"] == "done":
+            remember_answer(user_query, namespace, event["result"])
+        yield event
+
+
+def query_system_batch(questions, doc_id, trees_cache, output_path, use_cache=True):
+    """Answer a list of questions for one document, writing JSONL results to output_path."""
+    tree = _get_tree(doc_id, trees_cache)
+    return query_batch(questions, tree, output_path, doc_id=doc_id, use_cache=use_cache)
+
+
+def query_corpus_system(user_query, docs_cache, trees_cache, use_cache=True, mode=TREE_TRAVERSAL_MODE, index=None):
+    """Answer from the most relevant indexed documents instead of one chosen doc_id.
+
+    Pass ``index`` (from load_index) when asking several questions, so the
+    BM25 index is not reopened for each one.
+    """
+    if not trees_cache:
+        raise ValueError("No PageIndex trees loaded. Please rebuild the index.")
+    result = query_corpus(user_query, docs_cache, trees_cache, use_cache=use_cache, mode=mode, index=index)
+    return {
+        "answer": result["answer"],
+        "documents": [
+            {"document": doc["document"], "doc_id": doc["doc_id"], "traversal": doc["traversal"]}
+            for doc in result["documents"]
+        ],
+    }
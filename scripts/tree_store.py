@@ -0,0 +1,220 @@
+# scripts/tree_store.py
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from urllib.parse import quote
+
+import tracing
+from config import PAGEINDEX_TREES_CACHE, PAGEINDEX_TREES_DIR, TREE_STORE_MAX_LOADED
+
+# Bump whenever the on-disk layout changes; readers refuse other versions.
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+
+
+def _encode(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _write_atomic(path, payload):
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+def _fingerprint(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _count_nodes(nodes):
+    return sum(1 + _count_nodes(node.get("nodes") or []) for node in nodes)
+
+
+class TreeStore(Mapping):
+    """PageIndex trees stored as one compact JSON file per doc_id, loaded on demand.
+
+    ``manifest.json`` lists the stored trees with each file's hash, so
+    membership and ``len()`` never read a tree. Loaded trees stay in an LRU of
+    ``max_loaded`` entries, and the manifest is re-read whenever another
+    process replaces it. Shards and manifest are written atomically; a tree
+    whose hash changed is reloaded on its next ``get``.
+    """
+
+    def __init__(self, root=PAGEINDEX_TREES_DIR, max_loaded=TREE_STORE_MAX_LOADED):
+        self.root = root
+        self.max_loaded = max_loaded
+        self.manifest_path = os.path.join(root, MANIFEST_FILE)
+        self._entries = {}
+        self._manifest_fingerprint = None
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        fingerprint = _fingerprint(self.manifest_path)
+        if fingerprint == self._manifest_fingerprint:
+            return self._entries
+        entries = {}
+        if fingerprint is not None:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            version = manifest.get("format_version")
+            if version != FORMAT_VERSION:
+                raise ValueError(
+                    f"Unsupported tree store format version {version} in {self.root} "
+                    f"(expected {FORMAT_VERSION}). Please rebuild the index."
+                )
+            entries = manifest["trees"]
+        self._entries = entries
+        self._manifest_fingerprint = fingerprint
+        return entries
+
+    def _entry(self, doc_id):
+        with self._lock:
+            return self._refresh().get(doc_id)
+
+    def version(self, doc_id):
+        """Content hash of the stored tree, or None if there is none."""
+        entry = self._entry(doc_id)
+        return entry["sha256"] if entry is not None else None
+
+    def __contains__(self, doc_id):
+        return self._entry(doc_id) is not None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._refresh())
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._refresh()))
+
+    def __getitem__(self, doc_id):
+        entry = self._entry(doc_id)
+        if entry is None:
+            raise KeyError(doc_id)
+        return self._load(doc_id, entry)
+
+    def _load(self, doc_id, entry):
+        with self._lock:
+            loaded = self._loaded.get(doc_id)
+            if loaded is not None and loaded[0] == entry["sha256"]:
+                self._loaded.move_to_end(doc_id)
+                tracing.count("tree_store_hits_total")
+                return loaded[1]
+
+        with tracing.span("tree_store.load", doc_id=doc_id, bytes=entry["bytes"]):
+            with open(os.path.join(self.root, entry["file"]), "rb") as f:
+                payload = f.read()
+            tree = json.loads(payload)
+        tracing.count("tree_store_loads_total")
+        sha256 = hashlib.sha256(payload).hexdigest()
+        if sha256 != entry["sha256"]:
+            tracing.count("tree_store_version_mismatches_total")
+
+        with self._lock:
+            self._loaded[doc_id] = (sha256, tree)
+            self._loaded.move_to_end(doc_id)
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+        return tree
+
+    def snapshot(self):
+        """A read-only view of the trees listed in the manifest right now."""
+        with self._lock:
+            return TreeStoreView(self, dict(self._refresh()))
+
+    def put(self, doc_id, tree):
+        self.update({doc_id: tree})
+
+    def update(self, trees):
+        """Write each tree's shard, then the manifest once."""
+        os.makedirs(self.root, exist_ok=True)
+        written = {}
+        for doc_id, tree in trees.items():
+            payload = _encode(tree)
+            file_name = f"{quote(str(doc_id), safe='')}.json"
+            _write_atomic(os.path.join(self.root, file_name), payload)
+            written[doc_id] = (
+                {
+                    "file": file_name,
+                    "sha256": hashlib.sha256(payload).hexdigest(),
+                    "bytes": len(payload),
+                    "nodes": _count_nodes(tree),
+                },
+                tree,
+            )
+
+        with self._lock:
+            entries = dict(self._refresh())
+            for doc_id, (entry, tree) in written.items():
+                entries[doc_id] = entry
+                self._loaded[doc_id] = (entry["sha256"], tree)
+                self._loaded.move_to_end(doc_id)
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+            _write_atomic(self.manifest_path, _encode({"format_version": FORMAT_VERSION, "trees": entries}))
+            self._entries = entries
+            self._manifest_fingerprint = _fingerprint(self.manifest_path)
+
+
+class TreeStoreView(Mapping):
+    """The trees a TreeStore listed at one moment, for an index snapshot.
+
+    Membership, ``len()`` and ``version()`` stay as they were when the view
+    was taken, even as the store gains trees; tree contents still load
+    through the store's shared LRU. The PageIndex build only ever adds shards
+    for new doc_ids, so a listed tree's shard is the version the view saw.
+    """
+
+    def __init__(self, store, entries):
+        self.store = store
+        self._entries = entries
+
+    def version(self, doc_id):
+        entry = self._entries.get(doc_id)
+        return entry["sha256"] if entry is not None else None
+
+    def __contains__(self, doc_id):
+        return doc_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __getitem__(self, doc_id):
+        return self.store._load(doc_id, self._entries[doc_id])
+
+
+def migrate_legacy_trees(store, legacy_path=PAGEINDEX_TREES_CACHE):
+    """Split a monolithic pageindex_trees.json into ``store`` if the store is still empty."""
+    if len(store) or not os.path.exists(legacy_path):
+        return 0
+    with open(legacy_path, "r", encoding="utf-8") as f:
+        trees = json.load(f)
+    store.update(trees)
+    return len(trees)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_tree_store(root=PAGEINDEX_TREES_DIR):
+    """Return the process-wide store for ``root``, so every caller shares one LRU."""
+    key = os.path.abspath(root)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = TreeStore(root)
+    return store
@@ -0,0 +1,416 @@
+# server.py
+
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, nullcontext
+from http import HTTPStatus
+
+import tracing
+from llm.router import get_router
+from scripts.corpus_query import query_corpus
+from scripts.index_service import IndexService
+from scripts.query_pipeline import query_system_stream
+from config import (
+    SERVICE_CORPUS_CONCURRENCY,
+    SERVICE_HOST,
+    SERVICE_MAX_BODY_BYTES,
+    SERVICE_MAX_QUEUED,
+    SERVICE_PORT,
+    SERVICE_QUEUE_TIMEOUT_SECONDS,
+    SERVICE_REQUEST_TIMEOUT_SECONDS,
+    SERVICE_TREE_CONCURRENCY,
+    TREE_TRAVERSAL_MODE,
+)
+
+MODES = ("sequential", "branch", "outline")
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Admission:
+    """Admission control for one backend: ``limit`` queries run, ``max_queued`` more wait up to ``timeout`` seconds."""
+
+    def __init__(self, name, limit, max_queued=SERVICE_MAX_QUEUED, timeout=SERVICE_QUEUE_TIMEOUT_SECONDS):
+        self.name = name
+        self.limit = limit
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.running = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.running + self.waiting >= self.limit + self.max_queued:
+            tracing.count("service_rejected_total", backend=self.name, reason="queue_full")
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, f"{self.name} queue is full")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            tracing.count("service_rejected_total", backend=self.name, reason="queue_timeout")
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, f"timed out waiting for a {self.name} slot") from None
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+    def status(self):
+        return {"limit": self.limit, "running": self.running, "queued": self.waiting}
+
+
+class _Flight:
+    """One computation; every request that joined it reads its events from the start."""
+
+    def __init__(self):
+        self.events = []
+        self.finished = False
+        self.error = None
+        self.followers = 0
+        self._changed = asyncio.Event()
+
+    def push(self, event):
+        self.events.append(event)
+        self._wake()
+
+    def finish(self, error=None):
+        self.finished = True
+        self.error = error
+        self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self, timeout):
+        """Yield every event, waiting at most ``timeout`` seconds (None: no limit) for each new one."""
+        index = 0
+        while True:
+            if index < len(self.events):
+                index += 1
+                yield self.events[index - 1]
+                continue
+            if self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
+            changed = self._changed
+            try:
+                await asyncio.wait_for(changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                raise HTTPError(HTTPStatus.GATEWAY_TIMEOUT, "query timed out") from None
+
+
+def _drain(loop, factory, flight):
+    # Runs on a worker thread; events reach the flight in order on the loop.
+    for event in factory():
+        loop.call_soon_threadsafe(flight.push, event)
+
+
+class QueryService:
+    """Runs queries for the HTTP handlers.
+
+    Requests with the same index version, document, mode and question share
+    one in-flight computation. Each new computation first takes a slot from
+    its backend's Admission ("tree" for one document, "corpus" for search-all).
+    """
+
+    def __init__(
+        self,
+        index_service,
+        tree_concurrency=SERVICE_TREE_CONCURRENCY,
+        corpus_concurrency=SERVICE_CORPUS_CONCURRENCY,
+        request_timeout=SERVICE_REQUEST_TIMEOUT_SECONDS,
+    ):
+        self.index_service = index_service
+        self.request_timeout = request_timeout
+        self.admission = {
+            "tree": Admission("tree", tree_concurrency),
+            "corpus": Admission("corpus", corpus_concurrency),
+        }
+        self._flights = {}
+        self._tasks = set()
+        self._executor = ThreadPoolExecutor(
+            max_workers=tree_concurrency + corpus_concurrency, thread_name_prefix="query"
+        )
+
+    def status(self):
+        snapshot = self.index_service.snapshot()
+        job = self.index_service.latest_job()
+        return {
+            "status": "ok",
+            "index_version": snapshot.version,
+            "documents": len(snapshot.docs_cache),
+            "in_flight": len(self._flights),
+            "backends": {name: admission.status() for name, admission in self.admission.items()},
+            "refresh": None if job is None else {"id": job["id"], "state": job["state"], "stage": job["stage"]},
+            "llm": get_router().status(),
+        }
+
+    def _factory(self, snapshot, doc_id, question, mode):
+        if doc_id is None:
+            if not snapshot.trees:
+                raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "No PageIndex trees loaded. Please rebuild the index.")
+
+            def corpus_events():
+                result = query_corpus(
+                    question, snapshot.docs_cache, snapshot.trees, mode=mode, index=snapshot.bm25_index
+                )
+                yield {"type": "done", "result": result}
+
+            return "corpus", corpus_events
+
+        if doc_id not in snapshot.trees:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"No PageIndex tree for doc_id {doc_id}.")
+        return "tree", lambda: query_system_stream(question, doc_id, snapshot.trees, mode=mode)
+
+    def flight(self, doc_id, question, mode):
+        """Return the in-flight computation for this query, starting one if there is none."""
+        snapshot = self.index_service.snapshot()
+        key = (snapshot.version, doc_id, mode, question)
+        flight = self._flights.get(key)
+        if flight is not None:
+            tracing.count("service_coalesced_total")
+        else:
+            backend, factory = self._factory(snapshot, doc_id, question, mode)
+            flight = self._flights[key] = _Flight()
+            task = asyncio.create_task(self._run(key, backend, factory, flight))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        flight.followers += 1
+        return flight
+
+    async def _run(self, key, backend, factory, flight):
+        loop = asyncio.get_running_loop()
+        try:
+            async with self.admission[backend].slot():
+                await loop.run_in_executor(self._executor, _drain, loop, factory, flight)
+        except Exception as e:
+            flight.finish(e)
+        else:
+            flight.finish()
+        finally:
+            # Later identical requests start a fresh computation (the LLM cache makes it cheap).
+            self._flights.pop(key, None)
+
+    async def result(self, flight):
+        async def wait():
+            async for event in flight.follow(None):
+                if event["type"] == "done":
+                    return event["result"]
+            raise HTTPError(HTTPStatus.INTERNAL_SERVER_ERROR, "query finished without a result")
+
+        try:
+            return await asyncio.wait_for(wait(), self.request_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPError(HTTPStatus.GATEWAY_TIMEOUT, "query timed out") from None
+
+
+async def _read_request(reader):
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "incomplete request") from None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "headers too large") from None
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _version = lines[0].split(" ", 2)
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "malformed request line") from None
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "invalid Content-Length") from None
+    if length > SERVICE_MAX_BODY_BYTES:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, target.split("?", 1)[0], body
+
+
+def _head(status, content_type, extra=()):
+    status = HTTPStatus(status)
+    lines = [f"HTTP/1.1 {status.value} {status.phrase}", f"Content-Type: {content_type}", "Connection: close"]
+    lines.extend(extra)
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def _send(writer, status, body, content_type="application/json"):
+    if not isinstance(body, bytes):
+        body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+    extra = [f"Content-Length: {len(body)}"]
+    if status == HTTPStatus.SERVICE_UNAVAILABLE:
+        extra.append("Retry-After: 1")
+    writer.write(_head(status, content_type, extra) + body)
+    await writer.drain()
+
+
+async def _send_chunk(writer, data):
+    writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+    await writer.drain()
+
+
+def _parse_query(body):
+    try:
+        payload = json.loads(body or b"{}")
+    except json.JSONDecodeError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "body must be JSON") from None
+    if not isinstance(payload, dict):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "body must be a JSON object")
+    question = " ".join(str(payload.get("question") or "").split())
+    if not question:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "question is required")
+    mode = payload.get("mode") or TREE_TRAVERSAL_MODE
+    if mode not in MODES:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"mode must be one of {', '.join(MODES)}")
+    doc_id = payload.get("doc_id")
+    return (str(doc_id) if doc_id else None), question, mode, bool(payload.get("stream"))
+
+
+class Server:
+    """Minimal HTTP/1.1 front end (one request per connection) for QueryService.
+
+    POST /query     {"question", "doc_id" (omit to search all documents), "mode", "stream"}
+    POST /refresh   queue an index refresh
+    GET  /healthz   index version, in-flight queries, backend queues and LLM provider health
+    GET  /metrics   Prometheus text format
+    """
+
+    def __init__(self, queries):
+        self.queries = queries
+
+    async def handle(self, reader, writer):
+        started = time.perf_counter()
+        endpoint = "unknown"
+        status = HTTPStatus.INTERNAL_SERVER_ERROR
+        try:
+            method, path, body = await _read_request(reader)
+            endpoint = path
+            status = await self._dispatch(writer, method, path, body)
+        except HTTPError as e:
+            status = e.status
+            await self._send_error(writer, e.status, e.message)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            status = 499  # client went away
+        except Exception as e:
+            await self._send_error(writer, status, f"{type(e).__name__}: {e}")
+        finally:
+            if endpoint not in ("/query", "/refresh", "/healthz", "/metrics"):
+                endpoint = "other"
+            tracing.count("service_requests_total", endpoint=endpoint, status=int(status))
+            tracing.metrics.observe(
+                "service_request_duration_seconds", time.perf_counter() - started, endpoint=endpoint
+            )
+            writer.close()
+
+    async def _send_error(self, writer, status, message):
+        try:
+            await _send(writer, status, {"error": message})
+        except ConnectionError:
+            pass
+
+    async def _dispatch(self, writer, method, path, body):
+        if path == "/healthz" and method == "GET":
+            await _send(writer, HTTPStatus.OK, self.queries.status())
+            return HTTPStatus.OK
+        if path == "/metrics" and method == "GET":
+            text = tracing.metrics.to_prometheus().encode("utf-8")
+            await _send(writer, HTTPStatus.OK, text, "text/plain; version=0.0.4")
+            return HTTPStatus.OK
+        if path == "/refresh" and method == "POST":
+            job_id = self.queries.index_service.submit_refresh(reason="http")
+            await _send(writer, HTTPStatus.ACCEPTED, {"job_id": job_id})
+            return HTTPStatus.ACCEPTED
+        if path == "/query" and method == "POST":
+            return await self._query(writer, body)
+        if path in ("/healthz", "/metrics", "/refresh", "/query"):
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} not allowed on {path}")
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"no route for {path}")
+
+    async def _query(self, writer, body):
+        doc_id, question, mode, stream = _parse_query(body)
+        flight = self.queries.flight(doc_id, question, mode)
+        if not stream:
+            result = await self.queries.result(flight)
+            await _send(writer, HTTPStatus.OK, result)
+            return HTTPStatus.OK
+
+        # Newline-delimited JSON events, sent as they arrive. Errors before the
+        # first event still get a proper status; later ones become an error event.
+        events = flight.follow(self.queries.request_timeout)
+        try:
+            first = await events.__anext__()
+        except StopAsyncIteration:
+            raise HTTPError(HTTPStatus.INTERNAL_SERVER_ERROR, "query finished without events") from None
+        writer.write(_head(HTTPStatus.OK, "application/x-ndjson", ["Transfer-Encoding: chunked"]))
+        error = None
+        try:
+            await _send_chunk(writer, (json.dumps(first, ensure_ascii=False) + "\n").encode("utf-8"))
+            async for event in events:
+                await _send_chunk(writer, (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+        except ConnectionError:
+            raise
+        except HTTPError as e:
+            error = e.message
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        if error is not None:
+            await _send_chunk(writer, (json.dumps({"type": "error", "error": error}) + "\n").encode("utf-8"))
+        await _send_chunk(writer, b"")
+        return HTTPStatus.OK
+
+
+async def serve(host=SERVICE_HOST, port=SERVICE_PORT, index_service=None):
+    queries = QueryService(index_service or IndexService())
+    queries.index_service.snapshot()  # load the indexes before accepting connections
+    server = await asyncio.start_server(Server(queries).handle, host, port)
+    print(f"Serving on http://{host}:{port}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP query service for indexed insurance documents")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument(
+        "--fake-llm",
+        type=float,
+        metavar="SECONDS",
+        help="answer with the deterministic benchmark LLM (this latency per call) instead of Groq",
+    )
+    args = parser.parse_args()
+
+    fake = nullcontext()
+    if args.fake_llm is not None:
+        from benchmarks.fake_llm import FakeLLM, installed
+
+        fake = installed(FakeLLM(latency=args.fake_llm))
+    with fake:
+        try:
+            asyncio.run(serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
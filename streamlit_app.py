@@ -1,9 +1,11 @@
+import altair as alt
 import streamlit as st
 import os
-from scripts.parse_documents import parse_documents
-from scripts.build_index import build_index
-from scripts.pageindex_index import build_pageindex_trees
-from scripts.pageindex_query import query_tree
+import tracing
+from config import TREE_TRAVERSAL_MODE
+from scripts.corpus_query import query_corpus
+from scripts.index_service import IndexService
+from scripts.query_pipeline import query_system_stream
 
 
 def _page_range(node):
@@ -15,6 +17,47 @@ def _page_range(node):
     return start, end
 
 
+def _step_line(number, step):
+    reason_part = f" | reason: {step['reason']}" if step["reason"] else ""
+    timing_part = f" ({step['elapsed_ms']} ms)" if "elapsed_ms" in step else ""
+    return f"Step {number} [{step['method']}]{timing_part}: {', '.join(step['selected'])}{reason_part}"
+
+
+def _render_waterfall(trace):
+    rows = []
+    for span in trace["spans"]:
+        attrs = span["attrs"]
+        label = span["name"]
+        if "depth" in attrs:
+            label += f" (depth {attrs['depth']})"
+        rows.append(
+            {
+                "span": f"{span['span_id']:03d} {label}",
+                "name": span["name"],
+                "start": span["start_ms"],
+                "end": span["start_ms"] + span["duration_ms"],
+                "duration_ms": span["duration_ms"],
+                "details": ", ".join(f"{key}={value}" for key, value in attrs.items()),
+            }
+        )
+    if not rows:
+        st.info("No spans recorded.")
+        return
+    chart = (
+        alt.Chart(alt.Data(values=rows))
+        .mark_bar()
+        .encode(
+            x=alt.X("start:Q", title="ms since query start"),
+            x2="end:Q",
+            y=alt.Y("span:N", sort=None, title=None),
+            color=alt.Color("name:N", legend=alt.Legend(title="stage")),
+            tooltip=["span:N", "duration_ms:Q", "details:N"],
+        )
+        .properties(height=max(120, 18 * len(rows)))
+    )
+    st.altair_chart(chart, use_container_width=True)
+
+
 def _render_tree(nodes, selected_ids, depth=0, max_depth=8):
     if depth >= max_depth:
         return
@@ -33,42 +76,85 @@ def _render_tree(nodes, selected_ids, depth=0, max_depth=8):
             _render_tree(children, selected_ids, depth + 1, max_depth=max_depth)
 
 
+@st.cache_resource
+def _index_service():
+    # One per server process: every session reads the same snapshot and job queue.
+    return IndexService("data/policies")
+
+
+def _job_line(job):
+    if job["state"] == "failed":
+        return f"Refresh {job['id']} failed: {job['error']}"
+    if job["state"] == "done":
+        summary = job["summary"]
+        return (
+            f"Refresh {job['id']} done (index version {job['version']}). Added {len(summary['added'])}, "
+            f"updated {len(summary['updated'])}, removed {len(summary['removed'])}, "
+            f"unchanged {len(summary['unchanged'])}."
+        )
+    return f"Refresh {job['id']} {job['state']}"
+
+
+@st.fragment(run_every=2)
+def _index_status(service, version):
+    snapshot = service.snapshot()
+    if snapshot.version != version:
+        # A refresh finished: rerun the page so the document list uses the new snapshot.
+        st.rerun()
+    st.caption(f"Index version {snapshot.version}: {len(snapshot.docs_cache)} documents")
+    job = service.latest_job()
+    if job is None:
+        return
+    if job["state"] in ("queued", "running"):
+        fraction = job["done"] / job["total"] if job["total"] else 0.0
+        detail = f" ({job['done']}/{job['total']} {job['detail']})" if job["total"] else ""
+        st.progress(fraction, text=f"Refresh {job['id']}: {job['stage'] or 'queued'}{detail}")
+    elif job["state"] == "failed":
+        st.error(_job_line(job))
+    else:
+        st.success(_job_line(job))
+        if job["summary"]["failed"]:
+            st.warning(f"Could not parse: {', '.join(job['summary']['failed'])}")
+
+
 st.set_page_config(page_title="Insurance QA (PageIndex)", layout="wide")
 
 st.title("Insurance Policy QA (PageIndex, Vectorless)")
 st.caption("Tree-based retrieval with Groq reasoning.")
 
-if "docs_cache" not in st.session_state:
-    st.session_state.docs_cache = {}
-if "trees_cache" not in st.session_state:
-    st.session_state.trees_cache = {}
+service = _index_service()
+# Read once per run, so a refresh finishing mid-run cannot mix two index versions.
+snapshot = service.snapshot()
+
+if "uploaded" not in st.session_state:
+    st.session_state.uploaded = set()
 
 # Add file uploader for user-uploaded PDFs
 uploaded_files = st.file_uploader("Upload PDF files", type="pdf", accept_multiple_files=True)
 
 if uploaded_files:
-    st.info("Processing uploaded files...")
-    for uploaded_file in uploaded_files:
+    # The uploader keeps its files across reruns; only new uploads are saved and indexed.
+    new_files = [f for f in uploaded_files if (f.name, f.size) not in st.session_state.uploaded]
+    for uploaded_file in new_files:
         file_path = os.path.join("data/policies", uploaded_file.name)
         with open(file_path, "wb") as f:
             f.write(uploaded_file.read())
-    st.success("Files uploaded successfully. Click 'Build/Refresh PageIndex Trees' to index them.")
+        st.session_state.uploaded.add((uploaded_file.name, uploaded_file.size))
+    if new_files:
+        job_id = service.submit_refresh(reason="upload")
+        st.success(f"Saved {len(new_files)} file(s). Indexing in the background (refresh {job_id}).")
 
 with st.sidebar:
     st.header("Indexing")
     if st.button("Build/Refresh PageIndex Trees", use_container_width=True):
-        with st.spinner("Building PageIndex trees..."):
-            parse_documents("data/policies")  # Parse all documents in the folder
-            build_index("data/policies")  # Build index for parsed documents
-            docs_cache, trees_cache = build_pageindex_trees()
-            st.session_state.docs_cache = docs_cache
-            st.session_state.trees_cache = trees_cache
-        st.success("Index ready.")
-
-    if not st.session_state.docs_cache:
+        # Re-parse and re-index only new, changed or deleted PDFs, off the request path.
+        service.submit_refresh()
+    _index_status(service, snapshot.version)
+
+    if not snapshot.docs_cache:
         st.info("Add PDF files to data/policies and click Build.")
 
-    doc_items = list(st.session_state.docs_cache.items())
+    doc_items = list(snapshot.docs_cache.items())
     doc_label_map = {f"{name} (doc_id: {doc_id})": doc_id for name, doc_id in doc_items}
     doc_labels = list(doc_label_map.keys())
 
@@ -76,28 +162,86 @@ with st.sidebar:
     if doc_labels:
         selected_label = st.selectbox("Select document", doc_labels)
 
+    traversal_mode = st.selectbox(
+        "Traversal mode",
+        ["sequential", "branch", "outline"],
+        index=["sequential", "branch", "outline"].index(TREE_TRAVERSAL_MODE),
+        help="outline selects nodes from the whole tree in one LLM call; branch explores branches concurrently.",
+    )
+    search_all = st.checkbox(
+        "Search all documents",
+        help="Route the question to the most relevant documents and answer from all of them.",
+    )
+
 question = st.text_input("Ask a question about the policy")
 ask = st.button("Ask", type="primary", use_container_width=True)
 
 if ask:
-    if not st.session_state.docs_cache or not st.session_state.trees_cache:
+    if not snapshot.docs_cache or not snapshot.trees:
         st.error("No index loaded. Build PageIndex trees first.")
-    elif not selected_label:
-        st.error("Select a document first.")
     elif not question.strip():
         st.error("Enter a question to continue.")
+    elif search_all:
+        with st.spinner("Routing the question and answering across documents..."):
+            result = query_corpus(
+                question,
+                snapshot.docs_cache,
+                snapshot.trees,
+                mode=traversal_mode,
+                index=snapshot.bm25_index,
+            )
+
+        answer_tab, docs_tab = st.tabs(["Answer", "Documents"])
+        with answer_tab:
+            st.subheader("Answer")
+            st.write(result["answer"])
+        with docs_tab:
+            st.caption(
+                f"Routing: {result['route_ms']} ms | node selection: {result['selection_ms']} ms"
+            )
+            _render_waterfall(result["trace"])
+            if not result["documents"]:
+                st.info("No document matched the question.")
+            for doc in result["documents"]:
+                st.subheader(f"{doc['document']} (score {doc['route_score']:.2f})")
+                traversal_lines = [
+                    _step_line(number, step) for number, step in enumerate(doc["traversal"], 1)
+                ]
+                st.code("\n".join(traversal_lines) or "No traversal steps recorded.")
+                for node in doc["selected_nodes"]:
+                    with st.expander(f"{node['title']} ({node['node_id']})"):
+                        st.write(node["context"])
+    elif not selected_label:
+        st.error("Select a document first.")
     else:
         doc_id = doc_label_map[selected_label]
-        tree = st.session_state.trees_cache.get(doc_id)
+        tree = snapshot.trees.get(doc_id)
         if not tree:
             st.error("No tree found for the selected document. Rebuild the index.")
         else:
-            with st.spinner("Retrieving nodes and generating answer..."):
-                result = query_tree(question, tree)
+            # Show traversal steps and answer tokens as they arrive, then the full tabs.
+            status = st.status("Selecting nodes...", expanded=True)
+            answer_placeholder = st.empty()
+            step_count = 0
+            partial_answer = ""
+            result = None
+            for event in query_system_stream(question, doc_id, snapshot.trees, mode=traversal_mode):
+                if event["type"] == "step":
+                    step_count += 1
+                    status.write(_step_line(step_count, event["step"]))
+                elif event["type"] == "contexts":
+                    status.update(label="Generating answer...")
+                elif event["type"] == "token":
+                    partial_answer += event["text"]
+                    answer_placeholder.markdown(partial_answer + "▌")
+                elif event["type"] == "done":
+                    result = event["result"]
+            status.update(label="Done", state="complete", expanded=False)
+            answer_placeholder.empty()
 
             all_selected_ids = []
-            for node_ids, _reason in result["traversal"]:
-                all_selected_ids.extend(node_ids)
+            for step in result["traversal"]:
+                all_selected_ids.extend(step["selected"])
             selected_id_set = set(all_selected_ids)
 
             answer_tab, log_tab, nodes_tab, tree_tab = st.tabs(
@@ -110,14 +254,27 @@ if ask:
 
             with log_tab:
                 st.subheader("Retrieval Log")
-                traversal_lines = []
-                for step, (node_ids, reason) in enumerate(result["traversal"], 1):
-                    reason_part = f" | reason: {reason}" if reason else ""
-                    traversal_lines.append(
-                        f"Step {step}: {', '.join(node_ids)}{reason_part}"
-                    )
+                traversal_lines = [
+                    _step_line(number, step) for number, step in enumerate(result["traversal"], 1)
+                ]
+                st.caption(
+                    f"Mode: {result['mode']} | node selection: {result['selection_ms']} ms"
+                    f" | first token: {result['first_token_ms']} ms"
+                )
                 st.code("\n".join(traversal_lines) or "No traversal steps recorded.")
 
+                trace = result["trace"]
+                st.subheader("Timing Waterfall")
+                counters = ", ".join(f"{name}: {value}" for name, value in sorted(trace["counters"].items()))
+                st.caption(counters or "No LLM calls or cache lookups recorded.")
+                _render_waterfall(trace)
+                st.download_button(
+                    "Download trace (JSON lines)",
+                    tracing.to_jsonl(trace),
+                    file_name=f"trace-{trace['trace_id']}.jsonl",
+                    mime="application/x-ndjson",
+                )
+
             with nodes_tab:
                 st.subheader("Selected Nodes (All Steps)")
                 if not result["selected_nodes"]:
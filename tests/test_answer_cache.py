@@ -0,0 +1,38 @@
+import pytest
+
+from scripts.answer_cache import AnswerCache, term_weights
+from scripts.compiled_tree import get_compiled_tree
+from scripts.tree_store import get_tree_store
+
+
+@pytest.fixture(scope="module")
+def weights():
+    store = get_tree_store()
+    doc_id = next(iter(store))
+    return term_weights(get_compiled_tree(store[doc_id], doc_id))
+
+
+@pytest.mark.parametrize(
+    "cached, asked",
+    [
+        ("What is the sum insured of 5 lakh?", "What is the sum insured of 10 lakh?"),
+        ("Are senior citizens above 60 covered?", "Are senior citizens above 75 covered?"),
+        ("Is cataract covered in the first year?", "Is cataract covered in the second year?"),
+        ("Is cataract covered?", "Is cataract not covered?"),
+        ("Is cashless available in network hospital?", "Is cashless available in non network hospital?"),
+        ("Can I cancel within the free look period?", "Can I cancel after the free look period?"),
+        ("Is maternity covered with a waiting period?", "Is maternity covered without a waiting period?"),
+        ("Is a claim payable before discharge?", "Is a claim payable after discharge?"),
+    ],
+)
+def test_questions_differing_in_a_number_or_polarity_miss(weights, cached, asked):
+    cache = AnswerCache()
+    cache.store("ns", cached, {"answer": cached})
+    assert cache.lookup("ns", asked, weights) is None
+
+
+def test_rephrased_question_with_same_number_hits(weights):
+    cache = AnswerCache()
+    cache.store("ns", "What is the sum insured of 5 lakh?", {"answer": "five"})
+    hit = cache.lookup("ns", "sum insured of 5 lakh?", weights)
+    assert hit is not None and hit[0] == {"answer": "five"}
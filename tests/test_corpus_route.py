@@ -0,0 +1,49 @@
+import json
+import shutil
+
+from scripts import corpus_query
+from scripts.index_store import SEGMENTS_DIR, IndexWriter, open_index
+
+
+def _pages(name, texts):
+    return [{"doc_id": name, "page_num": num, "text": text} for num, text in enumerate(texts, 1)]
+
+
+def test_long_document_cannot_crowd_out_a_short_one(tmp_path):
+    writer = IndexWriter(str(tmp_path), reset=True)
+    writer.add_file("long.pdf", _pages("long.pdf", ["cataract surgery waiting period"] * 30))
+    writer.add_file("short.pdf", _pages("short.pdf", ["cataract cover after two years of policy"]))
+    writer.commit()
+
+    bm25, docs = open_index(str(tmp_path))
+    scores = corpus_query._route_with_pages("cataract", bm25, docs, {"long.pdf", "short.pdf"})
+    assert set(scores) == {"long.pdf", "short.pdf"}
+
+
+def test_outdated_index_falls_back_to_trees(tmp_path, monkeypatch):
+    writer = IndexWriter(str(tmp_path), reset=True)
+    writer.add_file("a.pdf", _pages("a.pdf", ["cataract"]))
+    writer.commit()
+    manifest_path = tmp_path / "manifest.json"
+    manifest = json.loads(manifest_path.read_text())
+    manifest["format_version"] = -1
+    manifest_path.write_text(json.dumps(manifest))
+
+    monkeypatch.setattr(corpus_query, "load_index", lambda: open_index(str(tmp_path)))
+    monkeypatch.setattr(corpus_query, "_route_with_trees", lambda *args: {"a.pdf": 1.0})
+    assert corpus_query.route_question("cataract", {"a.pdf": "doc-a"}, {"doc-a": {}}) == [
+        ("a.pdf", "doc-a", 1.0)
+    ]
+
+
+def test_unreadable_index_falls_back_to_trees(tmp_path, monkeypatch):
+    writer = IndexWriter(str(tmp_path), reset=True)
+    writer.add_file("a.pdf", _pages("a.pdf", ["cataract"]))
+    writer.commit()
+    index = open_index(str(tmp_path))
+    shutil.rmtree(tmp_path / SEGMENTS_DIR)
+
+    monkeypatch.setattr(corpus_query, "_route_with_trees", lambda *args: {"a.pdf": 1.0})
+    assert corpus_query.route_question("cataract", {"a.pdf": "doc-a"}, {"doc-a": {}}, index=index) == [
+        ("a.pdf", "doc-a", 1.0)
+    ]
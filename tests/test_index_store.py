@@ -0,0 +1,35 @@
+import os
+
+from config import BM25_RETAINED_GENERATIONS
+from scripts.bm25 import tokenize
+from scripts.index_store import SEGMENTS_DIR, IndexWriter, open_index
+
+
+def _pages(name, text):
+    return [{"doc_id": name, "page_num": 1, "text": text}]
+
+
+def _commit(index_dir, text):
+    writer = IndexWriter(index_dir)
+    writer.add_file("a.pdf", _pages("a.pdf", text))
+    writer.commit()
+
+
+def test_lazy_reader_survives_a_refresh(tmp_path):
+    index_dir = str(tmp_path)
+    _commit(index_dir, "cataract surgery waiting period")
+    bm25, docs = open_index(index_dir)
+
+    _commit(index_dir, "maternity cover after two years")
+    assert bm25.get_scores(tokenize("cataract"))[0] > 0
+    assert docs[0]["text"] == "cataract surgery waiting period"
+
+
+def test_commit_prunes_generations_beyond_the_retained_ones(tmp_path):
+    index_dir = str(tmp_path)
+    for generation in range(BM25_RETAINED_GENERATIONS + 3):
+        _commit(index_dir, f"clause {generation}")
+
+    segments = os.listdir(os.path.join(index_dir, SEGMENTS_DIR))
+    df_files = [name for name in os.listdir(index_dir) if name.startswith("df")]
+    assert len(segments) == len(df_files) == BM25_RETAINED_GENERATIONS + 1
@@ -0,0 +1,37 @@
+import json
+
+from config import TREE_SELECT_TOP_K
+from scripts import pageindex_query
+from scripts.compiled_tree import CompiledTree
+
+
+def _tree():
+    return CompiledTree(
+        [
+            {
+                "node_id": "0001",
+                "title": "Coverage",
+                "nodes": [{"node_id": f"00{i:02d}", "title": f"Clause {i}", "text": "covered"} for i in range(2, 8)],
+            }
+        ]
+    )
+
+
+def test_outline_keeps_only_leaves_up_to_top_k(monkeypatch):
+    picks = ["0001", "0002", "0002", "missing", "0003", "0004", "0005", "0006"]
+    monkeypatch.setattr(
+        pageindex_query, "generate_text", lambda *args, **kwargs: json.dumps({"selected_ids": picks})
+    )
+    traversal = []
+    selected = pageindex_query._select_with_outline("Is it covered?", _tree(), traversal, use_cache=False)
+    assert selected == ["0002", "0003", "0004", "0005", "0006"][:TREE_SELECT_TOP_K]
+    assert traversal[0]["selected"] == selected
+
+
+def test_outline_with_only_parent_picks_falls_back_to_the_walk(monkeypatch):
+    monkeypatch.setattr(
+        pageindex_query, "generate_text", lambda *args, **kwargs: json.dumps({"selected_ids": ["0001"]})
+    )
+    traversal = []
+    assert pageindex_query._select_with_outline("Is it covered?", _tree(), traversal, use_cache=False) == []
+    assert traversal[0]["reason"] == "no valid leaf ids; using tree walk"
@@ -0,0 +1,84 @@
+from concurrent.futures import Future
+
+import pytest
+
+from benchmarks.fake_llm import FakeAPIError, ScriptedProvider
+from llm.router import CircuitBreaker, LLMRouter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_half_open_trial_success_closes_and_failure_reopens():
+    clock = Clock()
+    breaker = CircuitBreaker(failures=2, cooldown=10, clock=clock)
+    breaker.record_failure()
+    assert breaker.allow() and breaker.state == "closed"
+    breaker.record_failure()
+    assert not breaker.allow() and breaker.state == "open"
+
+    clock.now = 11
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock.now = 22
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_non_retryable_trial_error_releases_half_open_breaker():
+    breaker = CircuitBreaker(failures=1, cooldown=0)
+    provider = ScriptedProvider("p", [(0, 503), (0, 400), 0], breaker=breaker)
+    router = LLMRouter([provider], hedge=False)
+
+    with pytest.raises(FakeAPIError):
+        router.complete("Question: a")
+    assert breaker.state == "open"
+    with pytest.raises(FakeAPIError):
+        router.complete("Question: b")
+    assert breaker.state == "half_open"
+    assert router.complete("Question: c")[1] is provider
+    assert breaker.state == "closed"
+
+
+def test_cancelled_hedge_trial_releases_half_open_breaker():
+    primary = ScriptedProvider("primary", [0])
+    backup = ScriptedProvider("backup", [0], breaker=CircuitBreaker(failures=1, cooldown=0))
+    backup.breaker.record_failure()
+    router = LLMRouter([primary, backup])
+
+    # The hedge took the half-open trial slot but was cancelled before it started.
+    assert backup.breaker.allow() and not backup.breaker.allow()
+    router._cancel({Future(): backup})
+    assert backup.breaker.state == "half_open"
+    assert backup.breaker.allow()
+
+
+def test_hedge_to_faster_backup_wins():
+    primary = ScriptedProvider("primary", [0.5])
+    primary.hedge_delay = lambda: 0.01
+    backup = ScriptedProvider("backup", [0])
+    router = LLMRouter([primary, backup])
+
+    text, provider = router.complete("Question: a")
+    assert provider is backup and text
+
+
+def test_fails_over_on_5xx_and_skips_provider_once_breaker_opens():
+    primary = ScriptedProvider("primary", [(0, 503)], breaker=CircuitBreaker(failures=2, cooldown=60))
+    backup = ScriptedProvider("backup", [0])
+    router = LLMRouter([primary, backup], hedge=False)
+
+    for i in range(4):
+        assert router.complete(f"Question: {i}")[1] is backup
+    assert primary.calls == 2
+    assert primary.breaker.state == "open"
+    assert router.status()["primary"]["error_rate"] == 1.0
@@ -0,0 +1,131 @@
+import asyncio
+import json
+from http import HTTPStatus
+
+import pytest
+
+import tracing
+from benchmarks.fake_llm import FakeLLM, installed
+from scripts.index_service import IndexSnapshot
+from server import Admission, HTTPError, QueryService, Server
+
+DOC_ID = "doc-a"
+
+
+def _tree():
+    return [
+        {
+            "node_id": "0001",
+            "title": "Coverage",
+            "text": "What the policy pays for.",
+            "nodes": [
+                {"node_id": "0002", "title": "Cataract", "text": "Cataract surgery is covered after two years."},
+                {"node_id": "0003", "title": "Maternity", "text": "Maternity is covered after four years."},
+            ],
+        },
+        {"node_id": "0004", "title": "Claims", "text": "Claims are settled within thirty days."},
+    ]
+
+
+class StubIndexService:
+    def __init__(self):
+        self._snapshot = IndexSnapshot(1, {"a.pdf": DOC_ID}, {DOC_ID: _tree()}, None)
+
+    def snapshot(self):
+        return self._snapshot
+
+    def latest_job(self):
+        return None
+
+
+def _coalesced():
+    return tracing.metrics.snapshot()["counters"].get("service_coalesced_total", 0)
+
+
+def test_identical_requests_share_one_computation():
+    async def run(service):
+        flights = [service.flight(DOC_ID, "Is cataract surgery covered?", "sequential") for _ in range(8)]
+        return await asyncio.gather(*(service.result(flight) for flight in flights))
+
+    index_service = StubIndexService()
+    before = _coalesced()
+    with installed(FakeLLM(latency=0.05)) as fake:
+        results = asyncio.run(run(QueryService(index_service)))
+    assert _coalesced() - before == 7
+    assert all(result == results[0] for result in results)
+    assert fake.calls > 0
+
+    # Asked again once the first computation is over: served from the answer cache.
+    with installed(FakeLLM(latency=0)) as fake:
+        asyncio.run(run(QueryService(index_service)))
+    assert fake.calls == 0
+
+
+def test_full_queue_is_rejected():
+    async def run():
+        admission = Admission("tree", limit=1, max_queued=0, timeout=1)
+        async with admission.slot():
+            with pytest.raises(HTTPError) as error:
+                async with admission.slot():
+                    pass
+        return error.value
+
+    assert asyncio.run(run()).status == HTTPStatus.SERVICE_UNAVAILABLE
+
+
+def test_queue_timeout_is_rejected():
+    async def run():
+        admission = Admission("tree", limit=1, max_queued=1, timeout=0.01)
+        async with admission.slot():
+            with pytest.raises(HTTPError) as error:
+                async with admission.slot():
+                    pass
+        return error.value
+
+    assert asyncio.run(run()).status == HTTPStatus.SERVICE_UNAVAILABLE
+
+
+def test_overrunning_query_times_out():
+    async def run():
+        service = QueryService(StubIndexService(), request_timeout=0.05)
+        with pytest.raises(HTTPError) as error:
+            await service.result(service.flight(DOC_ID, "How long do claims take to settle?", "sequential"))
+        return error.value
+
+    with installed(FakeLLM(latency=0.5)):
+        assert asyncio.run(run()).status == HTTPStatus.GATEWAY_TIMEOUT
+
+
+def _read_chunked(body):
+    data = b""
+    while True:
+        size_line, body = body.split(b"\r\n", 1)
+        size = int(size_line, 16)
+        if size == 0:
+            return data
+        data, body = data + body[:size], body[size + 2 :]
+
+
+def test_stream_sends_ndjson_events():
+    async def run():
+        server = await asyncio.start_server(Server(QueryService(StubIndexService())).handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            body = json.dumps({"question": "Is maternity covered?", "doc_id": DOC_ID, "stream": True}).encode()
+            writer.write(
+                f"POST /query HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+        return response
+
+    with installed(FakeLLM(latency=0)):
+        response = asyncio.run(run())
+    head, body = response.split(b"\r\n\r\n", 1)
+    assert head.startswith(b"HTTP/1.1 200")
+    assert b"application/x-ndjson" in head
+    events = [json.loads(line) for line in _read_chunked(body).decode().splitlines()]
+    assert events[0]["type"] == "step"
+    assert events[-1]["type"] == "done" and events[-1]["result"]["answer"]
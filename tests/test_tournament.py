@@ -0,0 +1,41 @@
+import asyncio
+
+from benchmarks.fake_llm import _CANDIDATE_RE, FakeLLM, installed
+from config import TREE_MAX_NODES_PER_STEP
+from scripts.compiled_tree import CompiledTree
+from scripts.pageindex_query import _aselect_nodes, _atournament_select
+
+
+class RecordingLLM(FakeLLM):
+    def __init__(self):
+        super().__init__(latency=0)
+        self.prompts = []
+
+    def reply(self, prompt):
+        self.prompts.append(prompt)
+        return super().reply(prompt)
+
+
+def _wide_tree(count):
+    return CompiledTree(
+        [{"node_id": f"n{i:02d}", "title": f"Section {i}", "text": f"clause {i}"} for i in range(count)]
+    )
+
+
+def test_tournament_groups_list_every_candidate():
+    compiled = _wide_tree(20)
+    with installed(RecordingLLM()) as fake:
+        asyncio.run(
+            _atournament_select("Is cataract covered?", compiled.root_ids, compiled, 0, use_cache=False, batch_size=10)
+        )
+    listed = [len(_CANDIDATE_RE.findall(prompt)) for prompt in fake.prompts]
+    assert listed[:2] == [10, 10]
+
+
+def test_selection_without_tournament_caps_candidates():
+    compiled = _wide_tree(20)
+    with installed(RecordingLLM()) as fake:
+        asyncio.run(
+            _aselect_nodes("Is cataract covered?", compiled.root_ids, compiled, 0, use_cache=False, tournament=False)
+        )
+    assert [len(_CANDIDATE_RE.findall(prompt)) for prompt in fake.prompts] == [TREE_MAX_NODES_PER_STEP]
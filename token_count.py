@@ -0,0 +1,12 @@
+# token_count.py
+
+import math
+
+# Llama/Gemini tokenizers average roughly four characters of English per token.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
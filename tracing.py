@@ -0,0 +1,295 @@
+# tracing.py
+
+import contextvars
+import itertools
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the span duration histogram buckets.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def _metric_key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = ",".join(f'{key}="{str(value).replace(chr(34), chr(39))}"' for key, value in labels)
+    return "{" + parts + "}"
+
+
+class Metrics:
+    """Process-wide counters and span-duration histograms, exportable in Prometheus text format."""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = _metric_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = _metric_key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += 1
+            histogram[2] += seconds
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        with self._lock:
+            counters = {
+                name + _format_labels(labels): value
+                for (name, labels), value in sorted(self._counters.items())
+            }
+            histograms = {
+                name + _format_labels(labels): {"count": count, "sum": round(total, 6)}
+                for (name, labels), (_buckets, count, total) in sorted(self._histograms.items())
+            }
+        return {"counters": counters, "histograms": histograms}
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (list(value[0]), value[1], value[2])) for key, value in self._histograms.items()
+            )
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), (bucket_counts, count, total) in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                bucket_labels = labels + (("le", bound),)
+                lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class Trace:
+    """Spans and counters recorded for one query.
+
+    Spans are appended from whichever thread or task finishes them, so the
+    trace is shared (under a lock) by everything running inside ``start_trace``.
+    """
+
+    def __init__(self, name, trace_id=None):
+        self.name = name
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.spans = []
+        self.counters = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _next_id(self):
+        with self._lock:
+            return next(self._ids)
+
+    def _offset_ms(self, moment):
+        return round((moment - self.started) * 1000, 2)
+
+    def add_span(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: (span["start_ms"], span["span_id"]))
+            counters = dict(self.counters)
+        total_ms = max((span["start_ms"] + span["duration_ms"] for span in spans), default=0.0)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "total_ms": round(total_ms, 2),
+            "counters": counters,
+            "spans": spans,
+        }
+
+
+def to_jsonl(trace):
+    """One JSON line per span (each carrying the trace id), followed by a summary line."""
+    data = trace if isinstance(trace, dict) else trace.to_dict()
+    lines = [json.dumps({"type": "span", "trace_id": data["trace_id"], **span}) for span in data["spans"]]
+    lines.append(
+        json.dumps(
+            {
+                "type": "trace",
+                "trace_id": data["trace_id"],
+                "name": data["name"],
+                "total_ms": data["total_ms"],
+                "counters": data["counters"],
+            }
+        )
+    )
+    return "\n".join(lines) + "\n"
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def start_trace(name):
+    """Collect every span and counter recorded inside the block into a new Trace, unless one is active."""
+    existing = _current_trace.get()
+    if existing is not None:
+        with span(name):
+            yield existing
+        return
+    trace = Trace(name)
+    trace_token = _current_trace.set(trace)
+    try:
+        with span(name):
+            yield trace
+    finally:
+        _current_trace.reset(trace_token)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a block; the yielded dict can be filled with attributes while it runs.
+
+    The duration always feeds the process-wide histogram; the span itself is
+    only kept when a trace is active.
+    """
+    trace = _current_trace.get()
+    parent = _current_span.get()
+    record = {
+        "span_id": trace._next_id() if trace is not None else 0,
+        "parent_id": parent["span_id"] if parent is not None else None,
+        "name": name,
+        "attrs": dict(attrs),
+    }
+    token = _current_span.set(record)
+    started = time.perf_counter()
+    try:
+        yield record["attrs"]
+    except Exception as e:
+        record["attrs"]["error"] = type(e).__name__
+        raise
+    finally:
+        finished = time.perf_counter()
+        _current_span.reset(token)
+        metrics.observe("pipeline_span_duration_seconds", finished - started, span=name)
+        if trace is not None:
+            record["start_ms"] = trace._offset_ms(started)
+            record["duration_ms"] = round((finished - started) * 1000, 2)
+            trace.add_span(record)
+
+
+def record_span(name, started, **attrs):
+    """Record a span that began at ``started`` (a perf_counter value) and ends now.
+
+    For work such as token streams, where a ``with span()`` block would stay
+    open across yields into the consumer's code.
+    """
+    finished = time.perf_counter()
+    metrics.observe("pipeline_span_duration_seconds", finished - started, span=name)
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    parent = _current_span.get()
+    trace.add_span(
+        {
+            "span_id": trace._next_id(),
+            "parent_id": parent["span_id"] if parent is not None else None,
+            "name": name,
+            "attrs": attrs,
+            "start_ms": trace._offset_ms(started),
+            "duration_ms": round((finished - started) * 1000, 2),
+        }
+    )
+
+
+def record_llm_usage(model, prompt_tokens, completion_tokens):
+    """Count one provider call and its token usage on the current span, trace and process metrics."""
+    annotate(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    count("llm_calls_total", model=model)
+    count("llm_prompt_tokens_total", prompt_tokens, model=model)
+    count("llm_completion_tokens_total", completion_tokens, model=model)
+
+
+def annotate(**attrs):
+    """Attach attributes to the innermost open span, if any."""
+    record = _current_span.get()
+    if record is not None:
+        record["attrs"].update(attrs)
+
+
+def count(name, value=1, **labels):
+    """Increment a process-wide counter and the active trace's counter of the same name."""
+    metrics.inc(name, value, **labels)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.inc(name, value)
+
+
+def iter_traced(name, factory):
+    """Iterate ``factory()`` inside its own trace, without leaking it into the consumer.
+
+    Context variables set in a generator would otherwise stay set in the
+    caller between items, so the generator is advanced inside a private
+    context. Inside it, ``current_trace()`` returns the trace.
+    """
+    context = contextvars.copy_context()
+    trace = Trace(name)
+
+    def traced():
+        with span(name):
+            yield from factory()
+
+    def start():
+        _current_trace.set(trace)
+        _current_span.set(None)
+        return traced()
+
+    iterator = context.run(start)
+    try:
+        while True:
+            try:
+                item = context.run(next, iterator)
+            except StopIteration:
+                return
+            yield item
+    finally:
+        # An abandoned stream must still close its spans inside the private context.
+        context.run(iterator.close)